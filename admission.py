@@ -0,0 +1,240 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
+from fastmcp.exceptions import ToolError
+from fastmcp.server.dependencies import get_http_headers
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+from auth import extract_bearer_token
+from metrics import MetricsRegistry
+
+# Queue class and priority (lower runs first) per tool; unlisted tools are
+# normal-priority text, and EXEMPT_TOOLS skip admission entirely
+TOOL_ADMISSION: Dict[str, Tuple[str, int]] = {
+    "reply": ("text", 0),
+    "opener": ("text", 0),
+    "generate_bio": ("text", 1),
+    "date_plan": ("text", 1),
+    "red_flag_check": ("text", 1),
+    "profile_roast": ("text", 1),
+    "batch_opener": ("text", 2),
+    "batch_reply": ("text", 2),
+    "batch_red_flag_check": ("text", 2),
+    "analyze_profile_screenshot": ("vision", 1),
+    "analyze_conversation_screenshot": ("vision", 0),
+}
+EXEMPT_TOOLS = {"validate"}
+
+class AdmissionRejected(Exception):
+    """Raised when a tool call is shed instead of queued"""
+    
+    def __init__(self, queue: str, reason: str, retry_after: float):
+        super().__init__(f"{queue} queue {reason}")
+        self.queue = queue
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionQueue:
+    """Bounded priority queue in front of a fixed number of running tool calls
+    
+    Waiters are served by priority, and round-robin across tokens within a
+    priority so one client's burst can't starve the others. A call is
+    rejected up front when the queue is full or its estimated wait exceeds
+    max_estimated_wait, and rejected after max_wait seconds in the queue.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        max_queue: int,
+        max_wait: float = 30.0,
+        max_estimated_wait: float = 20.0
+    ):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_estimated_wait = max_estimated_wait
+        self.running = 0
+        self.queued = 0
+        self.service_time: Optional[float] = None
+        self._levels: Dict[int, "OrderedDict[str, deque]"] = {}
+    
+    def estimated_wait(self) -> float:
+        """Seconds a call arriving now would wait, from the average service time"""
+        if self.running + self.queued < self.concurrency or self.service_time is None:
+            return 0.0
+        return (self.queued // self.concurrency + 1) * self.service_time
+    
+    async def acquire(self, token: str, priority: int) -> float:
+        """Wait for a slot; returns the seconds spent queued"""
+        if self.queued == 0 and self.running < self.concurrency:
+            self.running += 1
+            return 0.0
+        
+        estimate = self.estimated_wait()
+        if self.queued >= self.max_queue:
+            raise AdmissionRejected(self.name, "full", max(1.0, estimate))
+        if estimate > self.max_estimated_wait:
+            raise AdmissionRejected(self.name, "overloaded", estimate)
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._levels.setdefault(priority, OrderedDict()).setdefault(token, deque()).append(waiter)
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        
+        if not waiter.done():
+            self._abandon(waiter)
+            raise AdmissionRejected(self.name, "timeout", max(1.0, self.estimated_wait()))
+        return time.monotonic() - start
+    
+    def _abandon(self, waiter: asyncio.Future):
+        """Give up a queued place, or the slot if it was granted meanwhile"""
+        if waiter.done():
+            self.release(None)
+        else:
+            waiter.cancel()
+            self.queued -= 1
+    
+    def release(self, seconds: Optional[float]):
+        """Free a slot and hand it to the next waiter"""
+        self.running -= 1
+        if seconds is not None:
+            self.service_time = seconds if self.service_time is None else 0.8 * self.service_time + 0.2 * seconds
+        
+        while self.running < self.concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            self.running += 1
+            self.queued -= 1
+            waiter.set_result(None)
+    
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """Oldest live waiter of the next token in the highest non-empty priority"""
+        for priority in sorted(self._levels):
+            tokens = self._levels[priority]
+            while tokens:
+                token, waiters = next(iter(tokens.items()))
+                while waiters and waiters[0].done():
+                    waiters.popleft()
+                if not waiters:
+                    del tokens[token]
+                    continue
+                
+                waiter = waiters.popleft()
+                if waiters:
+                    tokens.move_to_end(token)
+                else:
+                    del tokens[token]
+                return waiter
+        return None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get queue depth, running calls and the current wait estimate"""
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "estimated_wait_seconds": self.estimated_wait()
+        }
+
+class AdmissionController:
+    """Admission queues per tool class (text, vision)"""
+    
+    def __init__(
+        self,
+        queues: Dict[str, AdmissionQueue],
+        tool_admission: Optional[Dict[str, Tuple[str, int]]] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.queues = queues
+        self.tool_admission = tool_admission if tool_admission is not None else TOOL_ADMISSION
+        self.metrics = metrics
+    
+    @asynccontextmanager
+    async def admit(self, tool: str, token: str) -> AsyncIterator[None]:
+        """Hold a slot in the tool's queue for the duration of the call"""
+        queue_name, priority = self.tool_admission.get(tool, ("text", 1))
+        queue = self.queues[queue_name]
+        try:
+            waited = await queue.acquire(token, priority)
+        except AdmissionRejected as e:
+            if self.metrics:
+                self.metrics.record_admission(queue_name, e.reason, None)
+            raise
+        
+        if self.metrics:
+            self.metrics.record_admission(queue_name, "admitted", waited)
+        start = time.monotonic()
+        cancelled = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # Cancelled calls don't count towards the service time estimate
+            queue.release(None if cancelled else time.monotonic() - start)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Flat per-queue gauges, e.g. text_queued and vision_estimated_wait_seconds"""
+        return {
+            f"{name}_{key}": value
+            for name, queue in self.queues.items()
+            for key, value in queue.stats().items()
+        }
+
+class AdmissionMiddleware(Middleware):
+    """FastMCP middleware queueing tool calls and shedding them with a retry-after hint"""
+    
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+    
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        tool = context.message.name
+        if tool in EXEMPT_TOOLS:
+            return await call_next(context)
+        
+        token = extract_bearer_token(get_http_headers(include_all=True)) or "anonymous"
+        try:
+            async with self.controller.admit(tool, token):
+                return await call_next(context)
+        except AdmissionRejected as e:
+            raise ToolError(
+                f"Server busy ({e.queue} queue {e.reason}), retry after {e.retry_after:.0f}s"
+            )
+
+def create_admission_controller(metrics: Optional[MetricsRegistry] = None) -> AdmissionController:
+    """Create the text and vision admission queues configured by the environment"""
+    max_wait = float(os.getenv("ADMISSION_MAX_WAIT", 30))
+    max_estimated_wait = float(os.getenv("ADMISSION_MAX_ESTIMATED_WAIT", 20))
+    return AdmissionController(
+        {
+            "text": AdmissionQueue(
+                "text",
+                int(os.getenv("ADMISSION_TEXT_CONCURRENCY", 32)),
+                int(os.getenv("ADMISSION_TEXT_QUEUE", 128)),
+                max_wait,
+                max_estimated_wait
+            ),
+            # Each queued screenshot holds its base64 payload, so keep this short
+            "vision": AdmissionQueue(
+                "vision",
+                int(os.getenv("ADMISSION_VISION_CONCURRENCY", 4)),
+                int(os.getenv("ADMISSION_VISION_QUEUE", 16)),
+                max_wait,
+                max_estimated_wait
+            ),
+        },
+        metrics=metrics
+    )
@@ -1,16 +1,11 @@
 import os
 import sys
-import asyncio
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
 def main():
     """Main entry point for the AI Wingman MCP Server"""
     try:
         # Import and run the MCP server
-        from mcp_server import mcp, BEARER_TOKEN
+        from mcp_server import mcp, BEARER_TOKEN, http_middleware
         
         port = int(os.getenv("PORT", 8000))
         
@@ -21,7 +16,7 @@ def main():
         print("="*50)
         
         # Run the MCP server
-        asyncio.run(mcp.run(port=port, host="0.0.0.0"))
+        mcp.run(transport="http", port=port, host="0.0.0.0", middleware=http_middleware)
         
     except KeyboardInterrupt:
         print("\n👋 AI Wingman MCP Server shutting down...")
@@ -1,16 +1,245 @@
 import os
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+import json
+import time
+import hashlib
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from fastmcp.server.dependencies import get_http_headers
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+from governor import TokenBucket
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Bearer tokens for authentication
+# Bearer tokens for authentication (used when AUTH_TOKENS_FILE is not set)
 VALID_BEARER_TOKENS = [
     os.getenv("MCP_BEARER_TOKEN", "puch2024"),
     "wingman123",  # Backup token
     "puch2024"     # Default token
 ]
 
+# Bearer token of the tool call being handled, so LLM usage can be charged to it
+current_token: ContextVar[Optional[str]] = ContextVar("current_token", default=None)
+
+def hash_token(token: str) -> str:
+    """SHA-256 hex digest a token is stored and looked up under"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class TokenRecord:
+    """A registered bearer token with its request rate limit and daily LLM-token quota
+    
+    A rate or quota of 0 disables that limit.
+    """
+    
+    def __init__(
+        self,
+        digest: str,
+        name: str,
+        requests_per_minute: float = 0,
+        daily_tokens: int = 0,
+        permissions: Optional[List[str]] = None
+    ):
+        self.digest = digest
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.daily_tokens = daily_tokens
+        self.permissions = permissions or ["full_access"]
+        self.day = ""
+        self.used_tokens = 0
+    
+    def _roll_day(self):
+        today = datetime.now(timezone.utc).date().isoformat()
+        if today != self.day:
+            self.day = today
+            self.used_tokens = 0
+    
+    def check(self) -> Tuple[bool, Optional[str], float]:
+        """Take one request from the rate limit; returns (allowed, reason, retry_after)"""
+        self._roll_day()
+        if self.daily_tokens > 0 and self.used_tokens >= self.daily_tokens:
+            now = datetime.now(timezone.utc)
+            midnight = 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+            return False, "daily_quota", float(midnight)
+        
+        wait = self.requests.try_acquire(1)
+        if wait > 0:
+            return False, "rate_limit", wait
+        return True, None, 0.0
+    
+    def charge(self, tokens: int):
+        """Add LLM tokens used on behalf of this token to today's total"""
+        self._roll_day()
+        self.used_tokens += tokens
+    
+    def inherit(self, previous: "TokenRecord"):
+        """Keep rate-limit and quota state across a reload"""
+        if previous.requests.per_minute == self.requests.per_minute:
+            self.requests = previous.requests
+        self.day = previous.day
+        self.used_tokens = previous.used_tokens
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get limits and today's usage"""
+        self._roll_day()
+        return {
+            "name": self.name,
+            "requests_per_minute": self.requests.per_minute,
+            "daily_tokens": self.daily_tokens,
+            "used_tokens": self.used_tokens
+        }
+
+class TokenRegistry:
+    """Bearer tokens keyed by SHA-256 digest, hot-reloaded from a JSON file
+    
+    Lookups hash the presented token and do one dict lookup; only digests
+    are kept, never the tokens themselves. The file holds
+    {"tokens": [{"token" or "sha256": ..., "name": ..., "requests_per_minute": ...,
+    "daily_tokens": ...}]} and is re-read when its mtime changes, checked at
+    most every reload_interval seconds. Usage carries over across reloads.
+    """
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        default_tokens: Optional[List[str]] = None,
+        requests_per_minute: float = 0,
+        daily_tokens: int = 0,
+        reload_interval: float = 5.0
+    ):
+        self.path = path
+        self.requests_per_minute = requests_per_minute
+        self.daily_tokens = daily_tokens
+        self.reload_interval = reload_interval
+        self._records: Dict[str, TokenRecord] = {}
+        self._file_version: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        
+        for token in default_tokens or []:
+            self.add(token)
+        if path:
+            self.reload()
+    
+    def add(
+        self,
+        token: str,
+        name: Optional[str] = None,
+        requests_per_minute: Optional[float] = None,
+        daily_tokens: Optional[int] = None
+    ) -> TokenRecord:
+        """Register a token (in memory only; lost on the next file reload)"""
+        digest = hash_token(token)
+        record = TokenRecord(
+            digest,
+            name or f"token-{digest[:8]}",
+            self.requests_per_minute if requests_per_minute is None else requests_per_minute,
+            self.daily_tokens if daily_tokens is None else daily_tokens
+        )
+        if digest in self._records:
+            record.inherit(self._records[digest])
+        self._records[digest] = record
+        return record
+    
+    def remove(self, token: str):
+        """Unregister a token"""
+        self._records.pop(hash_token(token), None)
+    
+    def lookup(self, token: Optional[str]) -> Optional[TokenRecord]:
+        """Get the record for a presented token, or None if it isn't registered"""
+        if not token:
+            return None
+        self.maybe_reload()
+        
+        # No constant-time compare needed: the dict compares SHA-256 digests of
+        # what the caller sent, and since they can't choose their digest's
+        # prefix, lookup timing tells them nothing about registered tokens
+        return self._records.get(hash_token(token))
+    
+    def maybe_reload(self):
+        """Re-read the token file if it changed since the last load"""
+        now = time.monotonic()
+        if not self.path or now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version != self._file_version:
+            # Recorded up front so an invalid file is reported once, not on every check
+            self._file_version = version
+            self.reload()
+    
+    def reload(self):
+        """Replace the registered tokens with the file's; keeps the old set if the file is invalid"""
+        try:
+            stat = os.stat(self.path)
+            with open(self.path) as f:
+                entries = json.load(f)["tokens"]
+            
+            records: Dict[str, TokenRecord] = {}
+            for entry in entries:
+                digest = entry.get("sha256") or hash_token(entry["token"])
+                record = TokenRecord(
+                    digest.lower(),
+                    entry.get("name", f"token-{digest[:8]}"),
+                    entry.get("requests_per_minute", self.requests_per_minute),
+                    entry.get("daily_tokens", self.daily_tokens),
+                    entry.get("permissions")
+                )
+                if record.digest in self._records:
+                    record.inherit(self._records[record.digest])
+                records[record.digest] = record
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Could not load tokens from %s: %s", self.path, e)
+            return
+        
+        self._records = records
+        self._file_version = (stat.st_mtime_ns, stat.st_size)
+        self.reloads += 1
+        logger.info("Loaded %d tokens from %s", len(records), self.path)
+    
+    def charge_current(self, tokens: int):
+        """Charge LLM tokens to the bearer token of the current tool call"""
+        record = self.lookup(current_token.get())
+        if record is not None:
+            record.charge(tokens)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get registry size and reload count"""
+        return {"tokens": len(self._records), "reloads": self.reloads}
+    
+    def usage(self) -> Dict[str, Dict[str, Any]]:
+        """Get today's usage per token name"""
+        return {record.name: record.stats() for record in self._records.values()}
+
+class TokenContextMiddleware(Middleware):
+    """FastMCP middleware exposing the caller's bearer token to LLM usage accounting"""
+    
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        reset = current_token.set(extract_bearer_token(get_http_headers(include_all=True)))
+        try:
+            return await call_next(context)
+        finally:
+            current_token.reset(reset)
+
+def create_token_registry() -> TokenRegistry:
+    """Create the token registry configured by the environment"""
+    path = os.getenv("AUTH_TOKENS_FILE")
+    return TokenRegistry(
+        path=path,
+        default_tokens=None if path else VALID_BEARER_TOKENS,
+        requests_per_minute=float(os.getenv("AUTH_REQUESTS_PER_MINUTE", 600)),
+        daily_tokens=int(os.getenv("AUTH_DAILY_TOKENS", 0)),
+        reload_interval=float(os.getenv("AUTH_RELOAD_INTERVAL", 5))
+    )
+
+# Global token registry
+token_registry = create_token_registry()
+
 def extract_bearer_token(headers: Dict[str, str]) -> Optional[str]:
     """Extract bearer token from request headers"""
     
@@ -25,34 +254,29 @@ def extract_bearer_token(headers: Dict[str, str]) -> Optional[str]:
         return x_auth_token
     
     # Check if the entire auth header is the token (some clients send it directly)
-    if auth_header in VALID_BEARER_TOKENS:
+    if token_registry.lookup(auth_header) is not None:
         return auth_header
     
     return None
 
 def verify_bearer_token(headers: Dict[str, str]) -> bool:
     """Verify that the request has a valid bearer token"""
-    
-    token = extract_bearer_token(headers)
-    
-    if not token:
-        return False
-    
-    # Check if token is in the list of valid tokens
-    return token in VALID_BEARER_TOKENS
+    return token_registry.lookup(extract_bearer_token(headers)) is not None
 
 def verify_token_string(token: str) -> bool:
     """Verify a token string directly"""
-    return token in VALID_BEARER_TOKENS
+    return token_registry.lookup(token) is not None
 
 def get_bearer_token_info(token: str) -> dict:
     """Get information about a bearer token"""
     
-    if token in VALID_BEARER_TOKENS:
+    record = token_registry.lookup(token)
+    if record is not None:
         return {
             "valid": True,
             "token": token,
-            "permissions": ["full_access"],
+            "name": record.name,
+            "permissions": record.permissions,
             "source": "ai_wingman_mcp"
         }
     
@@ -74,26 +298,24 @@ def create_auth_error() -> Dict[str, Any]:
 class AuthManager:
     """Authentication manager for the MCP server"""
     
-    def __init__(self):
-        self.valid_tokens = VALID_BEARER_TOKENS.copy()
+    def __init__(self, registry: Optional[TokenRegistry] = None):
+        self.registry = registry or token_registry
     
     def add_token(self, token: str):
         """Add a new valid bearer token"""
-        if token not in self.valid_tokens:
-            self.valid_tokens.append(token)
+        self.registry.add(token)
     
     def remove_token(self, token: str):
         """Remove a bearer token"""
-        if token in self.valid_tokens:
-            self.valid_tokens.remove(token)
+        self.registry.remove(token)
     
     def verify_headers(self, headers: Dict[str, str]) -> bool:
         """Verify headers have valid authentication"""
-        return verify_bearer_token(headers)
+        return self.registry.lookup(extract_bearer_token(headers)) is not None
     
     def verify_token(self, token: str) -> bool:
         """Verify a token directly"""
-        return verify_token_string(token)
+        return self.registry.lookup(token) is not None
     
     def get_token_info(self, token: str) -> dict:
         """Get information about a specific token"""
@@ -109,4 +331,4 @@ def fastmcp_auth_middleware(headers: Dict[str, str]) -> bool:
 
 def fastmcp_verify_token(token: str) -> bool:
     """FastMCP compatible token verification"""
-    return token in VALID_BEARER_TOKENS
+    return verify_token_string(token)
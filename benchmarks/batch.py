@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+from typing import Any, Dict, List
+from fastmcp import Client
+from benchmarks.load import free_port, wait_for_port
+
+SAMPLE_PROFILES = [
+    "Hinge: loves hiking, dogs, and 90s hip hop. Just moved to Austin.",
+    "Nurse, night owl, will beat you at Mario Kart. Looking for someone to try every taco truck with.",
+    "Climber and amateur baker. Sourdough starter named Kevin.",
+    "Law student, marathon runner, has strong opinions about Oxford commas.",
+    "Plant dad of 40. Weekend farmers market regular. Terrible at karaoke but committed.",
+]
+
+BATCH_TOOLS = {
+    "opener": ("batch_opener", "profiles", "their_profile_text"),
+    "reply": ("batch_reply", "messages", "partner_msg"),
+    "red_flag_check": ("batch_red_flag_check", "profile_texts", "profile_text"),
+}
+
+def make_items(count: int) -> List[str]:
+    """Unique items so the response cache can't answer for the upstream"""
+    return [f"{SAMPLE_PROFILES[index % len(SAMPLE_PROFILES)]} (#{index})" for index in range(count)]
+
+async def run_singles(client: Client, tool: str, argument: str, items: List[str], concurrency: int) -> float:
+    """N single-item calls, `concurrency` at a time (1 = what users do by hand)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def call(item: str):
+        async with semaphore:
+            await client.call_tool(tool, {argument: item, "fresh": True}, raise_on_error=False)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*[call(item) for item in items])
+    return time.perf_counter() - start
+
+async def run_batch(client: Client, tool: str, argument: str, items: List[str]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    result = await client.call_tool(tool, {argument: items, "fresh": True}, raise_on_error=False)
+    elapsed = time.perf_counter() - start
+    data = result.structured_content or {}
+    if data.get("error"):
+        raise RuntimeError(data["error"])
+    return {"elapsed": elapsed, "failed": data["failed"], "upstream_calls": data["upstream_calls"]}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Batch tools vs N single calls, in items per second")
+    parser.add_argument("--items", type=int, default=30)
+    parser.add_argument("--tools", default=",".join(BATCH_TOOLS))
+    parser.add_argument("--single-concurrency", type=int, default=1)
+    parser.add_argument("--mock-latency", type=float, default=0.3)
+    args = parser.parse_args()
+    
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+         "--latency-median", str(args.mock_latency), "--latency-dist", "fixed"],
+        cwd=root
+    )
+    
+    try:
+        await wait_for_port(mock_port, mock)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+        import mcp_server
+        
+        items = make_items(args.items)
+        async with Client(mcp_server.mcp) as client:
+            for single_tool in args.tools.split(","):
+                batch_tool, batch_argument, single_argument = BATCH_TOOLS[single_tool]
+                singles = await run_singles(client, single_tool, single_argument, items, args.single_concurrency)
+                batch = await run_batch(client, batch_tool, batch_argument, items)
+                print(
+                    f"{single_tool:>15}  singles {len(items) / singles:7.1f} items/s ({len(items)} calls)  "
+                    f"batch {len(items) / batch['elapsed']:7.1f} items/s ({batch['upstream_calls']} upstream calls, "
+                    f"{batch['failed']} failed)  speedup {singles / batch['elapsed']:.1f}x"
+                )
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+if __name__ == "__main__":
+    asyncio.run(main())
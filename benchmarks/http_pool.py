@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Dict, List
+from benchmarks.load import free_port, percentile, wait_for_port
+from cache import NullCache
+from governor import AdaptiveConcurrencyLimiter, RateGovernor
+from http_pool import HTTPPool, http2_available
+from llm import LLMClient
+from metrics import MetricsRegistry
+
+def make_certificate(directory: str) -> Dict[str, str]:
+    """Self-signed certificate for 127.0.0.1 (needs the openssl CLI)"""
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", keyfile, "-out", certfile, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True
+    )
+    return {"certfile": certfile, "keyfile": keyfile}
+
+def scenarios(certfile: str, http2: bool) -> Dict[str, HTTPPool]:
+    """Pools to compare; sdk-defaults mirrors the limits AsyncOpenAI uses on its own"""
+    pools = {
+        "sdk-defaults": HTTPPool(
+            max_connections=1000, max_keepalive_connections=100, keepalive_expiry=5.0,
+            read_timeout=600, http2=False, verify=certfile
+        ),
+        "tuned-http1": HTTPPool(http2=False, verify=certfile),
+    }
+    if http2:
+        pools["tuned-http2"] = HTTPPool(http2=True, verify=certfile)
+    return pools
+
+async def run_scenario(name: str, pool: HTTPPool, base_url: str, args) -> Dict[str, Any]:
+    """Bursts of concurrent completions separated by idle gaps"""
+    os.environ["OPENAI_BASE_URL"] = base_url
+    # A fixed concurrency limit so only the pool settings differ between scenarios
+    limiter = AdaptiveConcurrencyLimiter(initial=args.burst, max_limit=args.burst)
+    llm = LLMClient(
+        cache=NullCache(), governor=RateGovernor(limiter=limiter), metrics=MetricsRegistry(), http_pool=pool
+    )
+    latencies: List[float] = []
+    peak = {"connections": 0, "waiting": 0}
+    
+    async def call(index: int):
+        start = time.perf_counter()
+        await llm.generate_response(f"{name} request {index}", max_tokens=16, bypass_cache=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+        stats = pool.stats()
+        peak["connections"] = max(peak["connections"], stats.get("connections", 0))
+        peak["waiting"] = max(peak["waiting"], stats.get("waiting", 0))
+    
+    start = time.perf_counter()
+    busy = 0.0
+    for wave in range(args.waves):
+        if wave:
+            await asyncio.sleep(args.idle)
+        wave_start = time.perf_counter()
+        await asyncio.gather(*[call(wave * args.burst + index) for index in range(args.burst)])
+        busy += time.perf_counter() - wave_start
+    
+    stats = pool.stats()
+    await llm.aclose()
+    ordered = sorted(latencies)
+    return {
+        "scenario": name,
+        "http2": stats["http2"],
+        "requests": len(latencies),
+        "busy_rps": len(latencies) / busy,
+        "p50_ms": percentile(ordered, 0.50),
+        "p99_ms": percentile(ordered, 0.99),
+        "tls_handshakes": stats["tls_handshakes"],
+        "peak_connections": peak["connections"],
+        "peak_waiting": peak["waiting"],
+        "elapsed_s": time.perf_counter() - start
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Upstream connection pool settings against the mock OpenAI server over TLS")
+    parser.add_argument("--burst", type=int, default=200, help="concurrent completions per wave")
+    parser.add_argument("--waves", type=int, default=3)
+    parser.add_argument("--idle", type=float, default=6.0, help="seconds between waves")
+    parser.add_argument("--mock-latency", type=float, default=0.2)
+    args = parser.parse_args()
+    
+    # HTTP/2 needs h2 on the client and hypercorn for the mock
+    http2 = http2_available()
+    try:
+        import hypercorn  # noqa: F401
+    except ImportError:
+        http2 = False
+    
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as directory:
+        certificate = make_certificate(directory)
+        port = free_port()
+        command = [
+            sys.executable, "-m", "benchmarks.mock_openai", "--port", str(port),
+            "--latency-median", str(args.mock_latency), "--latency-dist", "fixed",
+            "--token-interval", "0", "--ssl-certfile", certificate["certfile"],
+            "--ssl-keyfile", certificate["keyfile"]
+        ]
+        mock = subprocess.Popen(command + (["--http2"] if http2 else []), cwd=root)
+        
+        try:
+            await wait_for_port(port, mock)
+            os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+            for name, pool in scenarios(certificate["certfile"], http2).items():
+                row = await run_scenario(name, pool, f"https://127.0.0.1:{port}/v1", args)
+                print(
+                    f"{row['scenario']:>13}  {row['busy_rps']:7.1f} rps  p50 {row['p50_ms']:7.1f}  "
+                    f"p99 {row['p99_ms']:7.1f} ms  TLS handshakes {row['tls_handshakes']:>4}  "
+                    f"peak connections {row['peak_connections']:>4}  peak waiting {row['peak_waiting']:>4}"
+                )
+        finally:
+            mock.terminate()
+            mock.wait(timeout=10)
+
+if __name__ == "__main__":
+    asyncio.run(main())
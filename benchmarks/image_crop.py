@@ -0,0 +1,162 @@
+import io
+import base64
+import random
+import argparse
+import statistics
+from typing import Any, Dict, List, Tuple
+from PIL import Image, ImageDraw
+from image_processor import ImageProcessor
+from benchmarks.load import percentile
+
+# (background, header, divider, my bubble, my text, their bubble, their text, keyboard, key)
+THEMES = {
+    "light": ((255, 255, 255), (255, 255, 255), (220, 220, 224), (50, 130, 246), (255, 255, 255), (233, 233, 235), (20, 20, 20), (209, 211, 217), (255, 255, 255)),
+    "tinted": ((255, 255, 255), (255, 198, 41), (255, 198, 41), (255, 198, 41), (20, 20, 20), (238, 238, 240), (20, 20, 20), (209, 211, 217), (255, 255, 255)),
+    "dark": ((0, 0, 0), (22, 22, 24), (44, 44, 46), (10, 132, 255), (255, 255, 255), (38, 38, 40), (235, 235, 235), (40, 40, 42), (90, 90, 94)),
+}
+
+def draw_words(draw: ImageDraw.ImageDraw, rng: random.Random, left: int, top: int, width: int, lines: int, color: Tuple[int, ...]):
+    """Text stand-in: rows of word-sized blocks"""
+    for line in range(lines):
+        x, y = left, top + line * 56
+        right = left + (width if line < lines - 1 else rng.randint(width // 3, width))
+        while x < right - 30:
+            word = rng.randint(40, 150)
+            draw.rectangle((x, y + 10, min(x + word, right), y + 42), fill=color)
+            x += word + 18
+
+def status_bar(draw: ImageDraw.ImageDraw, width: int, color: Tuple[int, ...]):
+    draw.rectangle((60, 50, 170, 90), fill=color)
+    draw.rectangle((width - 220, 55, width - 60, 85), fill=color)
+
+def conversation_screenshot(rng: random.Random, theme: str, keyboard: bool, width: int = 1170, height: int = 2532) -> Tuple[Image.Image, List[str]]:
+    """A chat screenshot and the side of each of its bubbles, top to bottom"""
+    background, header, divider, mine, my_text, theirs, their_text, keys_color, key = THEMES[theme]
+    ink = their_text
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+    
+    # Status bar and header (avatar, name), closed by a divider line
+    draw.rectangle((0, 0, width, 300), fill=header)
+    status_bar(draw, width, ink)
+    draw.ellipse((60, 170, 170, 280), fill=(200, 120, 90))
+    draw.rectangle((200, 200, 200 + rng.randint(150, 350), 250), fill=ink)
+    draw.rectangle((0, 300, width, 302), fill=divider)
+    
+    # Input bar, keyboard and home indicator
+    bottom = height - (860 if keyboard else 0)
+    if keyboard:
+        draw.rectangle((0, bottom, width, height), fill=keys_color)
+        for row in range(4):
+            for column in range(10):
+                left = 12 + column * 115
+                draw.rounded_rectangle((left, bottom + 30 + row * 150, left + 100, bottom + 150 + row * 150), 12, fill=key)
+    draw.rectangle((0, bottom - 180, width, bottom - 178), fill=divider)
+    draw.rounded_rectangle((40, bottom - 150, width - 160, bottom - 50), 50, outline=divider, width=3)
+    if not keyboard:
+        draw.rounded_rectangle((width // 2 - 140, height - 30, width // 2 + 140, height - 20), 5, fill=ink)
+    
+    sides: List[str] = []
+    y = 360 + rng.randint(0, 120)
+    # Chats often don't fill the screen
+    limit = bottom - 220 - rng.choice([0, 0, 400, 900])
+    if rng.random() < 0.5:
+        draw.rectangle((width // 2 - 120, y, width // 2 + 120, y + 30), fill=(142, 142, 147))
+        y += 80
+    side = rng.choice(["left", "right"])
+    while True:
+        lines = rng.choice([1, 1, 2, 3])
+        bubble_width = rng.randint(300, 780) if lines == 1 else 780
+        bubble_height = lines * 56 + 44
+        if y + bubble_height > limit:
+            break
+        left = 40 if side == "left" else width - 40 - bubble_width
+        draw.rounded_rectangle((left, y, left + bubble_width, y + bubble_height), 40, fill=theirs if side == "left" else mine)
+        draw_words(draw, rng, left + 40, y + 22, bubble_width - 80, lines, their_text if side == "left" else my_text)
+        sides.append(side)
+        y += bubble_height + rng.choice([10, 14, 40, 60])
+        if rng.random() < 0.6:
+            side = "right" if side == "left" else "left"
+    return image, sides
+
+def profile_screenshot(rng: random.Random, width: int = 1170, height: int = 2532) -> Image.Image:
+    """A profile screenshot: photo, name and prompt cards"""
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    status_bar(draw, width, (20, 20, 20))
+    photo_bottom = int(height * rng.uniform(0.45, 0.6))
+    size = (width, photo_bottom - 140)
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 40)
+    image.paste(Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT))), (0, 140))
+    draw.rectangle((60, photo_bottom + 50, 500, photo_bottom + 130), fill=(20, 20, 20))
+    y = photo_bottom + 200
+    while y + 300 < height - 200:
+        draw.rounded_rectangle((40, y, width - 40, y + 260), 30, fill=(245, 245, 247))
+        draw_words(draw, rng, 80, y + 30, width - 160, 3, (20, 20, 20))
+        y += 320
+    return image
+
+def encode(image: Image.Image) -> str:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def corpus(count: int, seed: int) -> List[Dict[str, Any]]:
+    """Synthetic screenshots: conversations in every theme with and without a keyboard, and profiles"""
+    rng = random.Random(seed)
+    items = []
+    for index in range(count):
+        if index % 4 == 3:
+            items.append({"kind": "profile", "image_data": encode(profile_screenshot(rng)), "sides": None})
+            continue
+        theme = list(THEMES)[index % len(THEMES)]
+        image, sides = conversation_screenshot(rng, theme, keyboard=rng.random() < 0.4)
+        items.append({"kind": f"conversation/{theme}", "image_data": encode(image), "sides": sides})
+    return items
+
+def main():
+    parser = argparse.ArgumentParser(description="Vision tokens and preprocessing time with UI chrome cropping and chat-bubble tiling")
+    parser.add_argument("--images", type=int, default=48)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    
+    items = corpus(args.images, args.seed)
+    plain = ImageProcessor(crop=False)
+    cropping = ImageProcessor(crop=True, segment_bubbles=False)
+    segmenting = ImageProcessor(crop=True, segment_bubbles=True)
+    
+    rows: Dict[str, Dict[str, List[float]]] = {}
+    correct = 0
+    conversations = 0
+    for item in items:
+        segment = item["sides"] is not None
+        for name, processor in (("none", plain), ("crop", cropping), ("crop+tile", segmenting)):
+            if name == "crop+tile" and not segment:
+                continue
+            prepared = processor.prepare_for_vision(item["image_data"], segment=segment)
+            row = rows.setdefault(f"{item['kind'].split('/')[0]:>12} {name:<9}", {"tokens": [], "uncropped": [], "crop_ms": [], "prepare_ms": []})
+            row["tokens"].append(prepared["metadata"]["vision_tokens"])
+            row["uncropped"].append(prepared["metadata"]["vision_tokens_uncropped"])
+            row["crop_ms"].append(prepared["metadata"]["crop_ms"])
+            row["prepare_ms"].append(prepared["metadata"]["prepare_ms"])
+            if segment and name == "crop+tile":
+                detected = [bubble["side"] for bubble in prepared["bubbles"] if bubble["side"] != "center"]
+                conversations += 1
+                correct += detected == item["sides"]
+    
+    print(f"{len(items)} synthetic screenshots, 1170x2532, normalized to the configured max edge")
+    for name, row in sorted(rows.items()):
+        tokens = sum(row["tokens"])
+        uncropped = sum(row["uncropped"])
+        crop_ms = sorted(row["crop_ms"])
+        prepare_ms = sorted(row["prepare_ms"])
+        print(
+            f"{name}  vision tokens {tokens / len(row['tokens']):7.1f}/image ({1 - tokens / uncropped:5.1%} saved)  "
+            f"crop p50 {percentile(crop_ms, 0.5):6.1f} ms  p95 {percentile(crop_ms, 0.95):6.1f} ms  "
+            f"prepare p50 {percentile(prepare_ms, 0.5):6.1f} ms  mean {statistics.fmean(prepare_ms):6.1f} ms"
+        )
+    print(f"bubble sides matched the drawn layout in {correct}/{conversations} conversations")
+
+if __name__ == "__main__":
+    main()
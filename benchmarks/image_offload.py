@@ -0,0 +1,78 @@
+import io
+import time
+import base64
+import asyncio
+import argparse
+import statistics
+import numpy as np
+from PIL import Image
+from image_processor import ImageProcessor, ImageWorkerPool
+
+def make_screenshot(width: int = 1170, height: int = 2532) -> str:
+    """Blocky noise PNG (~3 MB, like a photo-heavy screenshot) so decode and re-encode do real work"""
+    blocks = np.random.randint(0, 255, (height // 2, width // 2, 3), dtype=np.uint8)
+    pixels = blocks.repeat(2, axis=0).repeat(2, axis=1)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+async def text_tool(latency: float) -> float:
+    """Stand-in for a text tool: tiny CPU work plus an awaited upstream call"""
+    start = time.perf_counter()
+    await asyncio.sleep(latency)
+    return time.perf_counter() - start
+
+async def run_mode(mode: str, screenshot: str, args) -> dict:
+    processor = ImageProcessor()
+    pool = ImageWorkerPool(processor, workers=args.workers, mode=mode, queue_size=1000) if mode != "inline" else None
+    
+    async def image_tool():
+        if pool is None:
+            processor.prepare_for_vision(screenshot)
+        else:
+            await pool.prepare_for_vision(screenshot)
+    
+    async def image_load():
+        while not stop.is_set():
+            await asyncio.gather(*[image_tool() for _ in range(args.image_concurrency)])
+    
+    stop = asyncio.Event()
+    loaders = [asyncio.create_task(image_load())]
+    await asyncio.sleep(0.1)
+    
+    latencies = []
+    for _ in range(args.text_calls):
+        latencies.append(await text_tool(args.upstream_latency))
+    
+    stop.set()
+    await asyncio.gather(*loaders)
+    if pool is not None:
+        pool.shutdown()
+    
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        "mode": mode,
+        "p50_ms": statistics.median(latencies_ms),
+        "p99_ms": latencies_ms[int(len(latencies_ms) * 0.99) - 1],
+        "max_ms": latencies_ms[-1]
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Text tool latency while image tools saturate the server")
+    parser.add_argument("--modes", default="inline,thread,process")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--image-concurrency", type=int, default=4)
+    parser.add_argument("--text-calls", type=int, default=100)
+    parser.add_argument("--upstream-latency", type=float, default=0.005)
+    args = parser.parse_args()
+    
+    screenshot = make_screenshot()
+    print(f"screenshot payload: {len(screenshot) / 1e6:.1f} MB base64")
+    print(f"{'mode':>8} {'p50_ms':>8} {'p99_ms':>8} {'max_ms':>8}")
+    
+    for mode in args.modes.split(","):
+        result = await run_mode(mode, screenshot, args)
+        print(f"{result['mode']:>8} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['max_ms']:>8.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
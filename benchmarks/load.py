@@ -0,0 +1,288 @@
+import io
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import asyncio
+import argparse
+import subprocess
+import statistics
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from PIL import Image, ImageDraw
+from fastmcp import Client
+
+def make_screenshot_b64(width: int = 1170, height: int = 2532) -> str:
+    """Synthetic chat screenshot for the vision tools"""
+    image = Image.new("RGB", (width, height), (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, 120), fill=(20, 20, 20))
+    for index in range(10):
+        top = 200 + index * 220
+        left = 40 if index % 2 else width - 640
+        draw.rounded_rectangle((left, top, left + 600, top + 160), 40, fill=(60, 130, 250) if index % 2 == 0 else (230, 230, 235))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def tool_arguments(screenshot: str) -> Dict[str, Dict[str, Any]]:
+    """Sample arguments for every tool in mcp_server.py"""
+    return {
+        "validate": {},
+        "generate_bio": {"profile_text": "Software engineer who loves bouldering, ramen and indie films", "tone": "playful"},
+        "opener": {"their_profile_text": "Hinge: loves hiking, dogs, and 90s hip hop. Just moved to Austin.", "count": 3},
+        "reply": {"partner_msg": "Haha I can't believe you've never had a breakfast taco", "intent": "flirt"},
+        "date_plan": {"city": "San Francisco", "budget": "medium", "interests": "coffee, art", "vibe": "casual"},
+        "red_flag_check": {"profile_text": "Hey beautiful, I'm a crypto trader, text me on WhatsApp +1 555 0100"},
+        "profile_roast": {"bio": "6'2 because apparently that matters. Fluent in sarcasm.", "images_desc": "4 fish photos"},
+        "batch_opener": {"tone": "playful", "profiles": [f"Profile {n}: loves climbing, tacos and board games" for n in range(10)]},
+        "batch_reply": {"intent": "flirt", "messages": [f"Message {n}: what are you up to this weekend?" for n in range(10)]},
+        "batch_red_flag_check": {"profile_texts": [f"Profile {n}: investor, text me on Telegram" for n in range(10)]},
+        "analyze_profile_screenshot": {"image_data": screenshot, "context": "benchmark"},
+        "analyze_conversation_screenshot": {"image_data": screenshot, "my_role": "sender"},
+    }
+
+def vary_arguments(arguments: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """Make each call unique so response caches and coalescing don't hide upstream work"""
+    varied = dict(arguments)
+    for key, value in arguments.items():
+        if isinstance(value, str) and key != "image_data":
+            varied[key] = f"{value} ({index})"
+            break
+    return varied
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before listening on {port}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+SERVER_BOOTSTRAP = """
+import sys, json, time, asyncio
+sys.path.insert(0, {root!r})
+import mcp_server
+
+async def monitor_lag(path, interval=0.05):
+    samples = []
+    last_write = time.monotonic()
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.monotonic() - start - interval) * 1000)
+        if time.monotonic() - last_write > 1:
+            ordered = sorted(samples)
+            with open(path, "w") as out:
+                json.dump({{
+                    "samples": len(ordered),
+                    "p50_ms": ordered[len(ordered) // 2],
+                    "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+                    "max_ms": ordered[-1]
+                }}, out)
+            last_write = time.monotonic()
+
+async def main():
+    asyncio.create_task(monitor_lag({lag_path!r}))
+    await mcp_server.mcp.run_http_async(
+        show_banner=False, host="127.0.0.1", port={port}, log_level="warning",
+        middleware=mcp_server.http_middleware
+    )
+
+asyncio.run(main())
+"""
+
+async def drive_tool(
+    client: Client,
+    name: str,
+    arguments: Dict[str, Any],
+    requests: int,
+    concurrency: int,
+    unique: bool = True
+) -> Dict[str, Any]:
+    """Call one tool `requests` times with `concurrency` workers"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = requests
+    
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            call_arguments = vary_arguments(arguments, remaining) if unique else arguments
+            start = time.perf_counter()
+            try:
+                result = await client.call_tool(name, call_arguments, raise_on_error=False)
+                data = getattr(result, "data", None) or getattr(result, "structured_content", None)
+                if getattr(result, "is_error", False) or (isinstance(data, dict) and data.get("error")):
+                    errors["tool_error"] = errors.get("tool_error", 0) + 1
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    
+    ordered = sorted(latency * 1000 for latency in latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(ordered) if ordered else 0.0,
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99),
+        "max_ms": ordered[-1] if ordered else 0.0
+    }
+
+async def sample_rss(pid: int, samples: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(0.2)
+
+def git_revision(root: str) -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args) -> Dict[str, Any]:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    processes = []
+    
+    if args.openai_base_url:
+        env["OPENAI_BASE_URL"] = args.openai_base_url
+    else:
+        mock_port = free_port()
+        mock = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+             "--latency-median", str(args.mock_latency), "--error-rate-429", str(args.mock_429_rate)],
+            cwd=root, env=env
+        )
+        processes.append(mock)
+        env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+        await wait_for_port(mock_port, mock)
+    
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env["LLM_CACHE_ENABLED"] = "true" if args.cache else "false"
+    
+    port = free_port()
+    lag_path = os.path.join(root, f".bench_lag_{port}.json")
+    bootstrap = SERVER_BOOTSTRAP.format(root=root, lag_path=lag_path, port=port)
+    server = subprocess.Popen([sys.executable, "-c", bootstrap], cwd=root, env=env)
+    processes.append(server)
+    
+    try:
+        await wait_for_port(port, server)
+        rss_start = read_rss_mb(server.pid)
+        rss_samples: List[float] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(server.pid, rss_samples, stop))
+        
+        arguments = tool_arguments(make_screenshot_b64())
+        results = {}
+        async with Client(f"http://127.0.0.1:{port}/mcp/", auth=args.token) as client:
+            tools = [tool.name for tool in await client.list_tools()]
+            selected = [name for name in tools if not args.tools or name in args.tools.split(",")]
+            for name in selected:
+                if name not in arguments:
+                    print(f"skipping {name}: no sample arguments")
+                    continue
+                results[name] = await drive_tool(
+                    client, name, arguments[name], args.requests, args.concurrency, unique=not args.cache
+                )
+                row = results[name]
+                print(
+                    f"{name:>32} {row['throughput_rps']:>8.1f} rps  p50 {row['p50_ms']:>8.1f}  "
+                    f"p95 {row['p95_ms']:>8.1f}  p99 {row['p99_ms']:>8.1f} ms  errors {sum(row['errors'].values())}"
+                )
+        
+        stop.set()
+        await sampler
+        loop_lag = None
+        if os.path.exists(lag_path):
+            with open(lag_path) as lag_file:
+                loop_lag = json.load(lag_file)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+        if os.path.exists(lag_path):
+            os.remove(lag_path)
+    
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(root),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cache": args.cache,
+            "openai_base_url": env["OPENAI_BASE_URL"],
+            "mock_latency": None if args.openai_base_url else args.mock_latency
+        },
+        "server": {
+            "rss_mb_start": rss_start,
+            "rss_mb_peak": max(rss_samples) if rss_samples else None,
+            "loop_lag": loop_lag
+        },
+        "tools": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark over the FastMCP HTTP transport")
+    parser.add_argument("--requests", type=int, default=50, help="calls per tool")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--tools", default="", help="comma-separated subset of tools")
+    parser.add_argument("--token", default=os.getenv("MCP_BEARER_TOKEN", "puch2024"))
+    parser.add_argument("--cache", action="store_true", help="repeat identical calls with the LLM response cache enabled")
+    parser.add_argument("--openai-base-url", default=None, help="use this upstream instead of starting the mock")
+    parser.add_argument("--mock-latency", type=float, default=0.3)
+    parser.add_argument("--mock-429-rate", type=float, default=0.0)
+    parser.add_argument("--output", default=None, help="write results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = asyncio.run(run(args))
+    
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+        print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
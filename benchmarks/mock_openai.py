@@ -0,0 +1,364 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Vision cost the mock bills per image part
+IMAGE_PROMPT_TOKENS = 765
+
+FILLER_WORDS = (
+    "coffee walk museum tacos sunset playlist hiking bookstore rooftop jazz "
+    "picnic gallery ramen karaoke arcade market bakery garden brunch trivia"
+).split()
+
+# Item markers in the packed prompts of the batch_* tools
+BATCH_ITEM = re.compile(r"^\s*\[(\d+)\] ", re.MULTILINE)
+
+class MockConfig:
+    """Behavior of the mock OpenAI server"""
+    
+    def __init__(
+        self,
+        latency_dist: str = "lognormal",
+        latency_median: float = 0.5,
+        latency_sigma: float = 0.5,
+        vision_latency_extra: float = 1.0,
+        token_interval: float = 0.005,
+        completion_fill: float = 0.6,
+        error_rate_429: float = 0.0,
+        error_rate_500: float = 0.0,
+        retry_after: float = 1.0,
+        prompt_cache: bool = False,
+        cache_min_tokens: int = 1024,
+        cache_block_tokens: int = 128,
+        seed: Optional[int] = None
+    ):
+        self.latency_dist = latency_dist
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.vision_latency_extra = vision_latency_extra
+        self.token_interval = token_interval
+        self.completion_fill = completion_fill
+        self.error_rate_429 = error_rate_429
+        self.error_rate_500 = error_rate_500
+        self.retry_after = retry_after
+        self.prompt_cache = prompt_cache
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_block_tokens = cache_block_tokens
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.seen_prefixes = set()
+        self.system_prefixes: Counter = Counter()
+    
+    def sample_latency(self, vision: bool) -> float:
+        """Time before the first byte of a response"""
+        if self.latency_dist == "fixed":
+            latency = self.latency_median
+        elif self.latency_dist == "uniform":
+            latency = self.random.uniform(0, 2 * self.latency_median)
+        else:
+            latency = self.random.lognormvariate(0, self.latency_sigma) * self.latency_median
+        return latency + (self.vision_latency_extra if vision else 0)
+
+def count_prompt(messages: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Approximate prompt tokens (4 chars/token) and count image parts"""
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+    return {"prompt_tokens": chars // 4 + images * IMAGE_PROMPT_TOKENS, "images": images}
+
+def prompt_text(messages: List[Dict[str, Any]]) -> str:
+    """Messages flattened in order (images as their URL) for prefix matching"""
+    parts = []
+    for message in messages:
+        parts.append(f"<{message.get('role')}>")
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    parts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    parts.append(part["image_url"]["url"])
+    return "".join(parts)
+
+def cached_prefix_tokens(config: MockConfig, messages: List[Dict[str, Any]]) -> int:
+    """Tokens of the longest prompt prefix seen before, in whole cache blocks, like upstream prompt caching"""
+    text = prompt_text(messages)
+    block = config.cache_block_tokens * 4
+    digest = hashlib.sha256()
+    cached = 0
+    for end in range(block, len(text) + 1, block):
+        # One running hash, so every prefix costs a single pass over the text
+        digest.update(text[end - block:end].encode("utf-8"))
+        key = digest.hexdigest()
+        if key in config.seen_prefixes:
+            cached = end // 4
+        config.seen_prefixes.add(key)
+    return cached if cached >= config.cache_min_tokens else 0
+
+def example_from_schema(schema: Dict[str, Any], defs: Optional[Dict[str, Any]] = None) -> Any:
+    """Build a minimal instance that satisfies a JSON schema"""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    
+    if "$ref" in schema:
+        return example_from_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"]
+            return example_from_schema((options or schema[key])[0], defs)
+    
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "null")
+    
+    if schema_type == "object":
+        return {
+            name: example_from_schema(prop, defs)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        return [example_from_schema(schema.get("items", {}), defs) for _ in range(2)]
+    if schema_type == "integer":
+        return 1
+    if schema_type == "number":
+        return 1.0
+    if schema_type == "boolean":
+        return True
+    if schema_type == "null":
+        return None
+    if "enum" in schema:
+        return schema["enum"][0]
+    return " ".join(random.sample(FILLER_WORDS, 4))
+
+def batch_results(messages: List[Dict[str, Any]], completion_tokens: int) -> Optional[Dict[str, Any]]:
+    """Answer a packed batch prompt with one result per "[index] item" line"""
+    prompt = messages[-1].get("content") if messages else None
+    if not isinstance(prompt, str):
+        return None
+    
+    indexes = [int(index) for index in BATCH_ITEM.findall(prompt)]
+    if not indexes:
+        return None
+    
+    words = max(1, completion_tokens // len(indexes))
+    return {
+        "results": [
+            {"index": index, "content": " ".join(random.choices(FILLER_WORDS, k=words))}
+            for index in indexes
+        ]
+    }
+
+def make_content(body: Dict[str, Any], completion_tokens: int) -> str:
+    """Generate completion text, or JSON when a response_format is requested"""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        json_schema = response_format["json_schema"]
+        if json_schema.get("name") == "BatchCompletion":
+            packed = batch_results(body.get("messages", []), completion_tokens)
+            if packed is not None:
+                return json.dumps(packed)
+        return json.dumps(example_from_schema(json_schema["schema"]))
+    if response_format.get("type") == "json_object":
+        return json.dumps({"content": " ".join(random.choices(FILLER_WORDS, k=completion_tokens))})
+    
+    return " ".join(random.choices(FILLER_WORDS, k=completion_tokens))
+
+def error_response(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"message": message, "type": "mock_error", "code": status}},
+        status_code=status,
+        headers=headers
+    )
+
+def create_app(config: MockConfig) -> Starlette:
+    """Create the mock OpenAI-compatible ASGI app"""
+    
+    async def chat_completions(request: Request):
+        body = await request.json()
+        config.requests += 1
+        request_id = f"chatcmpl-mock-{config.requests}"
+        
+        roll = config.random.random()
+        if roll < config.error_rate_429:
+            return error_response(
+                429, "Rate limit reached (mock)", {"retry-after": str(config.retry_after)}
+            )
+        if roll < config.error_rate_429 + config.error_rate_500:
+            return error_response(500, "Internal server error (mock)")
+        
+        messages = body.get("messages", [])
+        prompt = count_prompt(messages)
+        for message in messages:
+            if message.get("role") == "system" and isinstance(message.get("content"), str):
+                config.system_prefixes[hashlib.sha256(message["content"].encode("utf-8")).hexdigest()] += 1
+        cached_tokens = min(cached_prefix_tokens(config, messages), prompt["prompt_tokens"]) if config.prompt_cache else 0
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens") or 256
+        completion_tokens = max(1, int(max_tokens * config.completion_fill))
+        content = make_content(body, completion_tokens)
+        model = body.get("model", "gpt-4o")
+        usage = {
+            "prompt_tokens": prompt["prompt_tokens"],
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt["prompt_tokens"] + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+        
+        await asyncio.sleep(config.sample_latency(prompt["images"] > 0))
+        
+        if body.get("stream"):
+            async def events():
+                words = content.split(" ")
+                for index, word in enumerate(words):
+                    delta = word if index == 0 else " " + word
+                    chunk = {
+                        "id": request_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(config.token_interval)
+                
+                final = {
+                    "id": request_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    final["usage"] = usage
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            
+            return StreamingResponse(events(), media_type="text/event-stream")
+        
+        # Non-streamed responses still take time proportional to their length
+        await asyncio.sleep(config.token_interval * completion_tokens)
+        
+        choices = [
+            {
+                "index": index,
+                "message": {"role": "assistant", "content": content if index == 0 else make_content(body, completion_tokens)},
+                "finish_reason": "stop"
+            }
+            for index in range(body.get("n") or 1)
+        ]
+        return JSONResponse({
+            "id": request_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+            "usage": usage
+        })
+    
+    async def models(request: Request):
+        return JSONResponse({
+            "object": "list",
+            "data": [
+                {"id": name, "object": "model", "owned_by": "mock"}
+                for name in ("gpt-4o", "gpt-4o-mini")
+            ]
+        })
+    
+    async def stats(request: Request):
+        return JSONResponse({
+            "requests": config.requests,
+            "system_prefixes": dict(config.system_prefixes)
+        })
+    
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/models", models, methods=["GET"]),
+        Route("/mock/stats", stats, methods=["GET"]),
+    ])
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local OpenAI-compatible mock server; point OPENAI_BASE_URL at http://host:port/v1"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-dist", choices=["lognormal", "uniform", "fixed"], default="lognormal")
+    parser.add_argument("--latency-median", type=float, default=0.5, help="seconds before the first byte")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--vision-latency-extra", type=float, default=1.0)
+    parser.add_argument("--token-interval", type=float, default=0.005, help="seconds per generated word")
+    parser.add_argument("--completion-fill", type=float, default=0.6, help="fraction of max_tokens generated")
+    parser.add_argument("--error-rate-429", type=float, default=0.0)
+    parser.add_argument("--error-rate-500", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--prompt-cache", action="store_true", help="report cached_tokens for repeated prompt prefixes")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024, help="shortest prefix the prompt cache serves")
+    parser.add_argument("--cache-block-tokens", type=int, default=128, help="granularity of cached prefixes")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ssl-certfile", default=None)
+    parser.add_argument("--ssl-keyfile", default=None)
+    parser.add_argument("--keep-alive", type=float, default=75.0, help="seconds idle connections are kept open")
+    parser.add_argument("--http2", action="store_true", help="serve with hypercorn so TLS clients can negotiate HTTP/2")
+    args = parser.parse_args()
+    
+    config = MockConfig(
+        latency_dist=args.latency_dist,
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        vision_latency_extra=args.vision_latency_extra,
+        token_interval=args.token_interval,
+        completion_fill=args.completion_fill,
+        error_rate_429=args.error_rate_429,
+        error_rate_500=args.error_rate_500,
+        retry_after=args.retry_after,
+        prompt_cache=args.prompt_cache,
+        cache_min_tokens=args.cache_min_tokens,
+        cache_block_tokens=args.cache_block_tokens,
+        seed=args.seed
+    )
+    if args.http2:
+        # uvicorn only speaks HTTP/1.1; hypercorn negotiates h2 over TLS (ALPN)
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+        
+        hypercorn_config = Config()
+        hypercorn_config.bind = [f"{args.host}:{args.port}"]
+        hypercorn_config.certfile = args.ssl_certfile
+        hypercorn_config.keyfile = args.ssl_keyfile
+        hypercorn_config.loglevel = "WARNING"
+        hypercorn_config.keep_alive_timeout = args.keep_alive
+        asyncio.run(serve(create_app(config), hypercorn_config))
+        return
+    
+    uvicorn.run(
+        create_app(config),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+        timeout_keep_alive=int(args.keep_alive),
+        ssl_certfile=args.ssl_certfile,
+        ssl_keyfile=args.ssl_keyfile
+    )
+
+if __name__ == "__main__":
+    main()
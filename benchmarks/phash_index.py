@@ -0,0 +1,40 @@
+import time
+import random
+import argparse
+import numpy as np
+from cache import PerceptualHashIndex
+
+def bench_lookups(index: PerceptualHashIndex, lookups: int, group: str) -> float:
+    """Average lookup time in microseconds"""
+    queries = [random.getrandbits(256) for _ in range(lookups)]
+    start = time.perf_counter()
+    for query in queries:
+        index.lookup(query, group)
+    return (time.perf_counter() - start) / lookups * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Perceptual hash index lookup benchmark")
+    parser.add_argument("--sizes", default="1000,10000,50000,100000")
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+    
+    sizes = [int(size) for size in args.sizes.split(",")]
+    group = "profile|profile|"
+    
+    print(f"numpy {np.__version__}, bitwise_count: {hasattr(np, 'bitwise_count')}")
+    print(f"{'entries':>10} {'lookup_us':>12} {'index_mb':>10}")
+    
+    for size in sizes:
+        index = PerceptualHashIndex(max_entries=size, ttl=3600)
+        for _ in range(size):
+            index.add(random.getrandbits(256), group, "analysis")
+        
+        avg_us = bench_lookups(index, args.lookups, group)
+        memory_mb = (
+            index._hashes.nbytes + index._groups.nbytes + index._expires.nbytes
+            + index._last_used.nbytes + index._valid.nbytes
+        ) / 1e6
+        print(f"{size:>10} {avg_us:>12.1f} {memory_mb:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import re
+import time
+import random
+import argparse
+from collections import Counter
+from typing import List
+from benchmarks.batch import SAMPLE_PROFILES
+from prescreen import RED_FLAG_RULES, create_red_flag_screen
+
+# Messages and profiles the pre-screen should flag, at different strengths
+RISKY_SAMPLES = [
+    "Hi dear, I rarely use this app. Text me on Telegram @lucy_2291 so we can talk more",
+    "I made 30% weekly returns on a crypto trading platform, my uncle taught me, I can show you",
+    "Could you send me $200 on Cash App? It's an emergency, hospital bills for my mom",
+    "Looking for a sugar daddy, allowance discussed privately",
+    "Hey handsome, add me on WhatsApp +1 (415) 555-0198",
+    "Stuck at the airport, customs fees are $900, can you lend me money? I'll pay you back",
+    "I need you to verify you're real at verify-dates.xyz/check before we meet",
+    "Please send me the code that just came to your phone, it's for the app",
+    "Follow my insta @jenny.travels.x and check my link www.jennyx.me/links",
+    "Engineer by day, bitcoin nerd by night. Will explain blockchain on the first date whether you like it or not",
+    "Call me sometime 212 555 0147",
+    "Sugar daddy here, $500 weekly allowance, just send me your Cash App",
+    "I'm deleting this app, add me on WhatsApp and send me $300 in Steam gift cards for my visa fees",
+]
+
+def make_corpus(count: int, risky_fraction: float, seed: int = 7) -> List[str]:
+    """Mix of clean profiles and risky messages, each made unique"""
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        source = RISKY_SAMPLES if rng.random() < risky_fraction else SAMPLE_PROFILES
+        corpus.append(f"{rng.choice(source)} #{index}")
+    return corpus
+
+def combined_scan(pattern: re.Pattern, text: str) -> int:
+    """All rules as one alternation, without the trigger prefilter"""
+    return len({match.lastgroup for match in pattern.finditer(text.lower())})
+
+def main():
+    parser = argparse.ArgumentParser(description="Red-flag pre-screen throughput and LLM calls skipped")
+    parser.add_argument("--texts", type=int, default=20000)
+    parser.add_argument("--risky-fraction", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    
+    screen = create_red_flag_screen()
+    corpus = make_corpus(args.texts, args.risky_fraction)
+    megabytes = sum(len(text.encode("utf-8")) for text in corpus) / 1e6
+    
+    decisions = Counter(screen.scan(text)["decision"] for text in corpus)
+    
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in corpus:
+            screen.scan(text)
+    prefiltered = time.perf_counter() - start
+    
+    pattern = re.compile("|".join(f"(?P<{name}>{rule})" for name, _, _, _, rule in RED_FLAG_RULES))
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in corpus:
+            combined_scan(pattern, text)
+    combined = time.perf_counter() - start
+    
+    scans = args.texts * args.repeat
+    print(f"corpus: {args.texts} texts, {megabytes:.2f} MB, {args.risky_fraction:.0%} risky")
+    print(
+        f"prefiltered     {megabytes * args.repeat / prefiltered:7.1f} MB/s  "
+        f"{prefiltered / scans * 1e6:6.1f} us/text"
+    )
+    print(
+        f"combined regex  {megabytes * args.repeat / combined:7.1f} MB/s  "
+        f"{combined / scans * 1e6:6.1f} us/text"
+    )
+    for decision in ("skip", "focused", "general"):
+        print(f"{decision:>8}  {decisions[decision] / args.texts:6.1%}")
+    print(f"LLM calls skipped: {decisions['skip'] / args.texts:.1%}")
+
+if __name__ == "__main__":
+    main()
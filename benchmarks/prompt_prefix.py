@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from collections import defaultdict
+from typing import Dict
+from fastmcp import Client
+from benchmarks.load import free_port, make_screenshot_b64, tool_arguments, vary_arguments, wait_for_port
+from prompts import PROMPTS
+
+async def main():
+    parser = argparse.ArgumentParser(description="Check prompt prefixes stay byte-identical and measure the cached-token ratio")
+    parser.add_argument("--calls", type=int, default=20, help="calls per tool, each with different input")
+    parser.add_argument("--cache-min-tokens", type=int, default=0, help="OpenAI only caches prefixes from 1024 tokens")
+    parser.add_argument("--cache-block-tokens", type=int, default=32)
+    args = parser.parse_args()
+    
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+         "--latency-median", "0.01", "--latency-dist", "fixed", "--token-interval", "0", "--prompt-cache",
+         "--cache-min-tokens", str(args.cache_min_tokens), "--cache-block-tokens", str(args.cache_block_tokens)],
+        cwd=root
+    )
+    
+    try:
+        await wait_for_port(mock_port, mock)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+        os.environ["ADMISSION_ENABLED"] = "false"
+        import mcp_server
+        
+        arguments = tool_arguments(make_screenshot_b64(400, 800))
+        arguments.pop("validate")
+        async with Client(mcp_server.mcp) as client:
+            for tool, tool_args in arguments.items():
+                for index in range(args.calls):
+                    await client.call_tool(tool, {**vary_arguments(tool_args, index), "fresh": True}, raise_on_error=False)
+        
+        with urllib.request.urlopen(f"http://127.0.0.1:{mock_port}/mock/stats") as response:
+            received: Dict[str, int] = json.load(response)["system_prefixes"]
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+    
+    names = {template.digest: name for name, template in PROMPTS.items()}
+    unknown = {digest: count for digest, count in received.items() if digest not in names}
+    
+    tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: {"prompt": 0, "cached": 0})
+    for (tool, model, kind), count in mcp_server.metrics.llm_tokens.items():
+        if kind in ("prompt", "cached"):
+            tokens[tool][kind] += count
+    
+    print(f"cache block {args.cache_block_tokens} tokens, min {args.cache_min_tokens} tokens")
+    for digest, count in sorted(received.items(), key=lambda item: names.get(item[0], "")):
+        name = names.get(digest, "UNKNOWN")
+        prefix = len(PROMPTS[name].system) // 4 if name in PROMPTS else 0
+        usage = tokens.get(name, {"prompt": 0, "cached": 0})
+        ratio = usage["cached"] / usage["prompt"] if usage["prompt"] else 0.0
+        print(
+            f"{name:>32}  {count:4d} calls, 1 prefix ({digest[:12]}, ~{prefix} tokens)  "
+            f"cached {usage['cached']:6d}/{usage['prompt']:6d} prompt tokens ({ratio:.0%})"
+        )
+    print(f"prefixes not in the registry: {len(unknown)}")
+    if unknown:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+from typing import Any, Dict, List
+from benchmarks.load import free_port, percentile, wait_for_port
+from cache import NullCache
+from governor import AdaptiveConcurrencyLimiter, RateGovernor
+from llm import LLMClient
+from metrics import MetricsRegistry
+from routing import ModelRouter
+
+async def run_scenario(name: str, hedge: bool, args) -> Dict[str, Any]:
+    """Reply calls against a long-tailed upstream, with or without hedging"""
+    limiter = AdaptiveConcurrencyLimiter(initial=args.concurrency * 2, max_limit=args.concurrency * 2)
+    registry = MetricsRegistry()
+    router = ModelRouter(hedge_enabled=hedge, hedge_quantile=args.hedge_quantile, hedge_min_delay=0.05)
+    llm = LLMClient(cache=NullCache(), governor=RateGovernor(limiter=limiter), metrics=registry, router=router)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    
+    async def call(index: int, record: bool):
+        async with semaphore:
+            start = time.perf_counter()
+            await llm.generate_response(f"{name} request {index}", max_tokens=16, tool="reply", bypass_cache=True)
+            if record:
+                latencies.append((time.perf_counter() - start) * 1000)
+    
+    # Fill the route's latency window before measuring so the hedge delay is known
+    await asyncio.gather(*[call(index, False) for index in range(router.min_samples)])
+    await asyncio.gather(*[call(index, True) for index in range(args.requests)])
+    await llm.aclose()
+    
+    ordered = sorted(latencies)
+    outcomes = {outcome: count for (route, outcome), count in registry.route_requests.items() if route == "reply"}
+    return {
+        "scenario": name,
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99),
+        "upstream_calls": sum(registry.llm_calls.values()),
+        "requests": router.min_samples + args.requests,
+        "outcomes": outcomes
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Tail latency of routed calls with and without hedged requests")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--hedge-quantile", type=float, default=0.95)
+    parser.add_argument("--mock-latency", type=float, default=0.2)
+    parser.add_argument("--mock-sigma", type=float, default=1.0, help="lognormal sigma; larger means a longer tail")
+    args = parser.parse_args()
+    
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(port),
+         "--latency-median", str(args.mock_latency), "--latency-sigma", str(args.mock_sigma),
+         "--token-interval", "0", "--seed", "7"],
+        cwd=root
+    )
+    
+    try:
+        await wait_for_port(port, mock)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+        for name, hedge in (("no-hedge", False), ("hedged", True)):
+            row = await run_scenario(name, hedge, args)
+            print(
+                f"{row['scenario']:>9}  p50 {row['p50_ms']:7.1f}  p95 {row['p95_ms']:7.1f}  p99 {row['p99_ms']:7.1f} ms  "
+                f"upstream calls {row['upstream_calls']} for {row['requests']} requests  {row['outcomes']}"
+            )
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+from typing import Any, Dict, List
+from fastmcp import Client
+from benchmarks.load import make_screenshot_b64, free_port, wait_for_port
+
+def count_llm_calls(snapshot: Dict[str, Any]) -> int:
+    """Total upstream completions recorded by the metrics registry"""
+    return sum(
+        model["calls"] for models in snapshot["llm"].values() for model in models.values()
+    )
+
+async def profile_session(client: Client, screenshot: str, index: int, single_call: bool) -> List[str]:
+    """One user session: analyze a profile screenshot, then get openers for it
+    
+    The two-step flow is what clients did while the screenshot tools returned
+    placeholder openers: take the extracted text and make a second ``opener`` call.
+    """
+    result = await client.call_tool(
+        "analyze_profile_screenshot",
+        {"image_data": screenshot, "context": f"session {index}", "fresh": True},
+        raise_on_error=False
+    )
+    analysis = result.structured_content or {}
+    if analysis.get("error"):
+        raise RuntimeError(analysis["error"])
+    
+    openers = [opener["text"] for opener in analysis.get("suggested_openers", [])]
+    if single_call and openers:
+        return openers
+    
+    result = await client.call_tool(
+        "opener",
+        {"their_profile_text": analysis.get("extracted_text", ""), "fresh": True},
+        raise_on_error=False
+    )
+    return [opener["text"] for opener in (result.structured_content or {}).get("openers", [])]
+
+async def run_flow(client: Client, screenshot: str, args, single_call: bool) -> Dict[str, Any]:
+    from metrics import metrics
+    
+    metrics.reset()
+    latencies = []
+    for index in range(args.sessions):
+        start = time.perf_counter()
+        await profile_session(client, screenshot, index, single_call)
+        latencies.append((time.perf_counter() - start) * 1000)
+    
+    calls = count_llm_calls(metrics.snapshot())
+    return {
+        "flow": "single-call" if single_call else "two-step",
+        "round_trips_per_session": calls / args.sessions,
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": statistics.median(latencies)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Upstream round-trips per profile screenshot session")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--mock-latency", type=float, default=0.3)
+    args = parser.parse_args()
+    
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+         "--latency-median", str(args.mock_latency), "--latency-dist", "fixed"],
+        cwd=root
+    )
+    
+    try:
+        await wait_for_port(mock_port, mock)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+        import mcp_server
+        
+        screenshot = make_screenshot_b64()
+        async with Client(mcp_server.mcp) as client:
+            for single_call in (False, True):
+                row = await run_flow(client, screenshot, args, single_call)
+                print(
+                    f"{row['flow']:>12}  {row['round_trips_per_session']:.2f} round-trips/session  "
+                    f"mean {row['mean_ms']:.0f} ms  p50 {row['p50_ms']:.0f} ms"
+                )
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+from typing import Any, Dict, List
+from benchmarks.load import percentile
+from cache import SQLiteCache
+
+# A typical cached completion
+SAMPLE_VALUE = "Hey! A sourdough starter named Kevin is elite. What's the best thing you've baked with him? " * 4
+
+def populate(path: str, entries: int):
+    """Fill the cache in one transaction so every get is a hit"""
+    cache = SQLiteCache(path, max_entries=entries * 2)
+    connection = cache.connection
+    connection.execute("BEGIN")
+    for index in range(entries):
+        cache.set(f"key-{index}", SAMPLE_VALUE, 3600)
+    connection.execute("COMMIT")
+    cache.close()
+
+def worker(path: str, entries: int, duration: float, write_ratio: float, seed: int, results):
+    """Random gets (and some sets) for `duration` seconds; reports get latencies"""
+    cache = SQLiteCache(path, max_entries=entries * 2)
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    hits = 0
+    writes = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        key = f"key-{rng.randrange(entries)}"
+        if rng.random() < write_ratio:
+            cache.set(key, SAMPLE_VALUE, 3600)
+            writes += 1
+            continue
+        
+        start = time.perf_counter()
+        found, _ = cache.get(key)
+        latencies.append(time.perf_counter() - start)
+        hits += found
+    cache.close()
+    results.put({"latencies": latencies, "hits": hits, "writes": writes})
+
+def run(path: str, workers: int, args) -> Dict[str, Any]:
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker, args=(path, args.entries, args.duration, args.write_ratio, seed, results)
+        )
+        for seed in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    
+    latencies = sorted(latency * 1e6 for row in rows for latency in row["latencies"])
+    gets = len(latencies)
+    return {
+        "workers": workers,
+        "gets_per_s": gets / args.duration,
+        "writes_per_s": sum(row["writes"] for row in rows) / args.duration,
+        "hit_rate": sum(row["hits"] for row in rows) / gets if gets else 0.0,
+        "p50_us": percentile(latencies, 0.50),
+        "p99_us": percentile(latencies, 0.99),
+        "mean_us": statistics.fmean(latencies) if latencies else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite shared cache hit latency and throughput across worker processes")
+    parser.add_argument("--workers", default="1,4,8")
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per run")
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite3")
+        populate(path, args.entries)
+        for workers in (int(count) for count in args.workers.split(",")):
+            row = run(path, workers, args)
+            print(
+                f"{row['workers']:>2} workers  {row['gets_per_s']:10.0f} gets/s  {row['writes_per_s']:8.0f} sets/s  "
+                f"hit rate {row['hit_rate']:.2f}  p50 {row['p50_us']:6.1f}  p99 {row['p99_us']:7.1f} us"
+            )
+
+if __name__ == "__main__":
+    main()
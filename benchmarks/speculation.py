@@ -0,0 +1,127 @@
+import os
+import re
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from collections import defaultdict
+from typing import Any, Dict, List
+from fastmcp import Client
+from benchmarks.load import free_port, make_screenshot_b64, percentile, wait_for_port
+
+def read_counters(port: int) -> Dict[str, Dict[str, float]]:
+    """Upstream calls and completion tokens per tool, and speculation outcomes, from /metrics"""
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        text = response.read().decode()
+    
+    counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for name, labels, value in re.findall(r'^(wingman_\w+)\{(.*)\} (\S+)$', text, re.MULTILINE):
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+        if name == "wingman_llm_calls_total":
+            counters["calls"][labels["tool"]] += float(value)
+        elif name == "wingman_llm_tokens_total" and labels["kind"] in ("prompt", "completion"):
+            counters["tokens"][labels["tool"]] += float(value)
+        elif name == "wingman_speculation_total":
+            counters["speculation"][labels["outcome"]] += float(value)
+    return counters
+
+async def run_sessions(root: str, env: Dict[str, str], screenshot: str, speculative: bool, args) -> Dict[str, Any]:
+    """Sessions one after another (speculation is per caller): screenshot analysis, a pause while the user reads it, then an opener call"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "mcp_server.py"], cwd=root,
+        env=dict(env, PORT=str(port), SPECULATIVE_ENABLED="true" if speculative else "false"),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    rng = random.Random(args.seed)
+    latencies: List[float] = []
+    prefetched = 0
+    
+    async def session(index: int):
+        nonlocal prefetched
+        # Some users ask for a different tone, which the speculation can't serve
+        tone = "playful" if rng.random() < args.mismatch_rate else "friendly"
+        async with Client(f"http://127.0.0.1:{port}/mcp/", auth=args.token) as client:
+            result = await client.call_tool(
+                "analyze_profile_screenshot",
+                {"image_data": screenshot, "context": f"session {index}", "fresh": True},
+                raise_on_error=False
+            )
+            profile_text = (result.structured_content or {}).get("extracted_text", "")
+            await asyncio.sleep(args.think_time)
+            
+            start = time.perf_counter()
+            result = await client.call_tool("opener", {"their_profile_text": profile_text, "tone": tone}, raise_on_error=False)
+            latencies.append((time.perf_counter() - start) * 1000)
+            prefetched += bool((result.structured_content or {}).get("prefetched"))
+    
+    try:
+        await wait_for_port(port, server)
+        for index in range(args.sessions):
+            await session(index)
+        counters = read_counters(port)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    
+    ordered = sorted(latencies)
+    return {
+        "mode": "speculative" if speculative else "on-demand",
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "mean_ms": statistics.fmean(ordered),
+        "prefetched": prefetched,
+        "opener_calls": counters["calls"]["opener"],
+        "opener_tokens": counters["tokens"]["opener"],
+        "speculation": dict(counters["speculation"])
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="opener latency after a profile screenshot, with and without speculative prefetch")
+    parser.add_argument("--sessions", type=int, default=30)
+    parser.add_argument("--think-time", type=float, default=3.0, help="seconds between the analysis and the opener call")
+    parser.add_argument("--mismatch-rate", type=float, default=0.2, help="share of opener calls with a non-default tone")
+    parser.add_argument("--mock-latency", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--token", default=os.getenv("MCP_BEARER_TOKEN", "puch2024"))
+    args = parser.parse_args()
+    
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    mock_port = free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+         "--latency-median", str(args.mock_latency), "--seed", "7"],
+        cwd=root
+    )
+    env = dict(os.environ, OPENAI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1", LLM_CACHE_ENABLED="false")
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    
+    try:
+        await wait_for_port(mock_port, mock)
+        screenshot = make_screenshot_b64(600, 1200)
+        print(f"{args.sessions} sessions, {args.think_time}s think time, {args.mismatch_rate:.0%} opener calls with another tone")
+        for speculative in (False, True):
+            row = await run_sessions(root, env, screenshot, speculative, args)
+            print(
+                f"{row['mode']:>11}  opener p50 {row['p50_ms']:7.1f}  p95 {row['p95_ms']:7.1f}  mean {row['mean_ms']:7.1f} ms  "
+                f"opener upstream calls {row['opener_calls']:.0f} ({row['opener_tokens']:.0f} tokens)"
+            )
+            if speculative:
+                outcomes = row["speculation"]
+                served = outcomes.get("hit", 0) + outcomes.get("joined", 0)
+                started = outcomes.get("started", 0)
+                print(
+                    f"             started {started:.0f}  hit {outcomes.get('hit', 0):.0f}  joined {outcomes.get('joined', 0):.0f}  "
+                    f"miss {outcomes.get('miss', 0):.0f}  hit rate {served / started if started else 0:.0%}  "
+                    f"served prefetched {row['prefetched']}/{args.sessions}"
+                )
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+if __name__ == "__main__":
+    asyncio.run(main())
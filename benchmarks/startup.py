@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from benchmarks.load import free_port, git_revision, read_rss_mb, wait_for_port
+
+# Modules whose cumulative import time is reported
+LOCAL_MODULES = (
+    "mcp_server", "llm", "governor", "cache", "metrics", "schemas",
+    "structured", "image_processor", "auth"
+)
+THIRD_PARTY = ("fastmcp", "mcp", "starlette", "uvicorn", "pydantic", "numpy", "openai", "PIL", "dotenv")
+
+def measure_imports(root: str, env: Dict[str, str]) -> Dict[str, float]:
+    """Cumulative import time (ms) per module from `python -X importtime`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import mcp_server"],
+        cwd=root, env=env, capture_output=True, text=True, check=True
+    )
+    
+    times: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name in LOCAL_MODULES or name in THIRD_PARTY:
+            times[name] = max(times.get(name, 0.0), int(cumulative.strip()) / 1000)
+    return times
+
+async def measure_start(root: str, env: Dict[str, str]) -> Dict[str, Any]:
+    """Time from spawning app.py to an accepting socket, and the RSS once idle"""
+    port = free_port()
+    env = dict(env, PORT=str(port))
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=root, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        await wait_for_port(port, server)
+        listening = time.perf_counter() - start
+        rss_listening = read_rss_mb(server.pid)
+        await asyncio.sleep(1.0)
+        rss_idle = read_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    
+    return {"listening_s": listening, "rss_mb_listening": rss_listening, "rss_mb_idle": rss_idle}
+
+async def run(args) -> Dict[str, Any]:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env["WARMUP_ON_START"] = "true" if args.warmup else "false"
+    if args.warmup and not env.get("OPENAI_BASE_URL"):
+        # Without an upstream the warm-up request just fails fast
+        env["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"
+    
+    imports = [measure_imports(root, env) for _ in range(args.runs)]
+    starts: List[Dict[str, Any]] = []
+    for _ in range(args.runs):
+        starts.append(await measure_start(root, env))
+    
+    modules = sorted(imports[0], key=lambda name: -statistics.median(run[name] for run in imports if name in run))
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(root),
+        "config": {"runs": args.runs, "warmup": args.warmup},
+        "listening_s": statistics.median(run["listening_s"] for run in starts),
+        "rss_mb_listening": statistics.median(run["rss_mb_listening"] or 0 for run in starts),
+        "rss_mb_idle": statistics.median(run["rss_mb_idle"] or 0 for run in starts),
+        "import_ms": {
+            name: statistics.median(run[name] for run in imports if name in run) for name in modules
+        },
+        "loaded_at_import": sorted(name for name in THIRD_PARTY if name in imports[0])
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Server cold start: time to listening socket, import times and RSS")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="start with WARMUP_ON_START enabled")
+    parser.add_argument("--output", default=None, help="write results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = asyncio.run(run(args))
+    
+    print(f"time to listening socket  {results['listening_s'] * 1000:8.0f} ms (median of {args.runs})")
+    print(f"RSS listening / idle      {results['rss_mb_listening']:8.1f} / {results['rss_mb_idle']:.1f} MB")
+    print("cumulative import time (ms):")
+    for name, ms in results["import_ms"].items():
+        print(f"  {name:>16} {ms:8.1f}")
+    
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+        print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
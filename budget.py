@@ -0,0 +1,187 @@
+import os
+import re
+import importlib.util
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
+
+# Same approximation the governor uses for its token bucket
+CHARS_PER_TOKEN = 4
+
+# Input budget (tokens) per tool, shared by its free-text fields. Sized well
+# above real profiles and chats, so only pasted walls of text get cut
+TOOL_INPUT_BUDGETS = {
+    "generate_bio": 1000,
+    "opener": 1000,
+    "reply": 1500,
+    "date_plan": 200,
+    "red_flag_check": 1500,
+    "profile_roast": 1200,
+    "analyze_profile_screenshot": 300,
+    "analyze_conversation_screenshot": 600,
+}
+
+# Fields holding chat transcripts keep their most recent messages; all other
+# fields (including the screenshot tools' context instructions) keep their
+# beginning and end
+CONVERSATION_FIELDS = {"partner_msg"}
+
+OMITTED_MARKER = " [...] "
+
+def tiktoken_available() -> bool:
+    """Whether the optional tiktoken tokenizer is installed"""
+    return importlib.util.find_spec("tiktoken") is not None
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # Imported here so the approximation works without tiktoken installed
+    import tiktoken
+    
+    return tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", "o200k_base"))
+
+def estimate_tokens(text: str, exact: bool = False) -> int:
+    """Token count of text: tiktoken when exact, otherwise ~4 chars/token"""
+    if not text:
+        return 0
+    if exact:
+        return len(_encoding().encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def keep_recent(text: str, max_chars: int) -> str:
+    """Keep the last messages (lines) of a conversation that fit in max_chars"""
+    if len(text) <= max_chars:
+        return text
+    
+    # Room for the omission note
+    room = max(max_chars - 32, 0)
+    if room == 0:
+        # Not even the note fits: the end of the last message is all that does
+        return text[len(text) - max_chars:] if max_chars > 0 else ""
+    max_chars = room
+    lines = text.splitlines()
+    kept: List[str] = []
+    used = 0
+    for line in reversed(lines):
+        if kept and used + len(line) + 1 > max_chars:
+            break
+        kept.append(line)
+        used += len(line) + 1
+    kept.reverse()
+    
+    omitted = len(lines) - len(kept)
+    if len(kept[0]) > max_chars:
+        # A single message longer than the budget: keep its end, from a word boundary
+        tail = kept[0][-max_chars:]
+        kept[0] = "..." + tail[tail.find(" ") + 1:] if " " in tail else tail
+    if omitted:
+        kept.insert(0, f"[{omitted} earlier messages omitted]")
+    return "\n".join(kept)
+
+def keep_ends(text: str, max_chars: int) -> str:
+    """Keep the first two thirds and last third of max_chars, cut at word boundaries"""
+    if len(text) <= max_chars:
+        return text
+    
+    room = max(max_chars - len(OMITTED_MARKER), 0)
+    head = text[:room * 2 // 3]
+    tail = text[len(text) - room // 3:] if room // 3 else ""
+    if " " in head:
+        head = head[:head.rfind(" ")]
+    if " " in tail:
+        tail = tail[tail.find(" ") + 1:]
+    return head.rstrip() + OMITTED_MARKER + tail.lstrip()
+
+def allocate(sizes: Dict[str, int], budget: int) -> Dict[str, int]:
+    """Split a token budget across fields: small fields stay whole, large ones share what's left evenly"""
+    shares: Dict[str, int] = {}
+    remaining = budget
+    ordered = sorted(sizes, key=sizes.get)
+    for position, name in enumerate(ordered):
+        share = remaining // (len(ordered) - position)
+        shares[name] = min(sizes[name], share)
+        remaining -= shares[name]
+    return shares
+
+class InputBudget:
+    """Token estimation and content-aware truncation of tool inputs before prompting
+    
+    Every tool passes its free-text fields through fit() with its tool name.
+    When their estimated total exceeds the tool's budget, the budget is split
+    so short fields stay whole, and each oversized field is truncated to its
+    share: conversations keep their most recent messages, profiles and other
+    text keep their beginning and end around an omission marker.
+    """
+    
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, int]] = None,
+        default_budget: int = 2000,
+        exact: bool = False
+    ):
+        self.budgets = dict(TOOL_INPUT_BUDGETS if budgets is None else budgets)
+        self.default_budget = default_budget
+        self.exact = exact
+        self.calls = 0
+        self.truncated_calls = 0
+        self.original_tokens = 0
+        self.sent_tokens = 0
+    
+    def budget_for(self, tool: str) -> int:
+        """Input token budget of a tool"""
+        return self.budgets.get(tool, self.default_budget)
+    
+    def _truncate(self, name: str, text: str, tokens: int) -> str:
+        truncate = keep_recent if name in CONVERSATION_FIELDS else keep_ends
+        max_chars = tokens * CHARS_PER_TOKEN
+        result = truncate(text, max_chars)
+        # The character approximation can overshoot a real tokenizer; shrink until it fits
+        while self.exact and max_chars > 0 and estimate_tokens(result, True) > tokens:
+            max_chars = max_chars * tokens // estimate_tokens(result, True) - 1
+            result = truncate(text, max(max_chars, 0))
+        return result
+    
+    def fit(self, tool: str, **fields: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Fields cut to the tool's budget, plus {"original_tokens", "sent_tokens", "truncated"}"""
+        fields = {name: text or "" for name, text in fields.items()}
+        sizes = {name: estimate_tokens(text, self.exact) for name, text in fields.items()}
+        original = sum(sizes.values())
+        
+        truncated: List[str] = []
+        if original > self.budget_for(tool):
+            shares = allocate(sizes, self.budget_for(tool))
+            for name, share in shares.items():
+                if share < sizes[name]:
+                    fields[name] = self._truncate(name, fields[name], share)
+                    sizes[name] = estimate_tokens(fields[name], self.exact)
+                    truncated.append(name)
+        
+        sent = sum(sizes.values())
+        self.calls += 1
+        self.truncated_calls += bool(truncated)
+        self.original_tokens += original
+        self.sent_tokens += sent
+        return fields, {"original_tokens": original, "sent_tokens": sent, "truncated": truncated}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get input token totals and how often truncation kicked in"""
+        return {
+            "calls": self.calls,
+            "truncated_calls": self.truncated_calls,
+            "original_tokens": self.original_tokens,
+            "sent_tokens": self.sent_tokens,
+            "tokenizer": "tiktoken" if self.exact else "approximate"
+        }
+
+def create_input_budget() -> InputBudget:
+    """Create the input budget configured by the environment (INPUT_BUDGET_<TOOL> overrides)"""
+    budgets = dict(TOOL_INPUT_BUDGETS)
+    for name, value in os.environ.items():
+        match = re.fullmatch(r"INPUT_BUDGET_([A-Z_]+)", name)
+        if match and match.group(1) != "DEFAULT":
+            budgets[match.group(1).lower()] = int(value)
+    
+    tokenizer = os.getenv("INPUT_TOKENIZER", "auto").lower()
+    return InputBudget(
+        budgets,
+        default_budget=int(os.getenv("INPUT_BUDGET_DEFAULT", 2000)),
+        exact=tokenizer == "tiktoken" or (tokenizer == "auto" and tiktoken_available())
+    )
@@ -0,0 +1,512 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Tuple
+
+# Default time-to-live (seconds) for cached completions, per tool
+DEFAULT_TOOL_TTLS = {
+    "generate_bio": 600,
+    "opener": 300,
+    "reply": 120,
+    "date_plan": 3600,
+    "red_flag_check": 1800,
+    "profile_roast": 600,
+}
+
+DEFAULT_TTL = float(os.getenv("LLM_CACHE_DEFAULT_TTL", 300))
+
+def get_tool_ttl(tool: Optional[str]) -> float:
+    """Get the cache TTL for a tool, overridable with CACHE_TTL_<TOOL>"""
+    if not tool:
+        return DEFAULT_TTL
+    
+    override = os.getenv(f"CACHE_TTL_{tool.upper()}")
+    if override is not None:
+        return float(override)
+    
+    return float(DEFAULT_TOOL_TTLS.get(tool, DEFAULT_TTL))
+
+def make_cache_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: int,
+    response_format: Optional[Dict[str, Any]] = None
+) -> str:
+    """Build a stable cache key from the request parameters"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_format": response_format
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache(ABC):
+    """Base class for completion caches with single-flight request coalescing
+    
+    Backends implement ``get``, ``set`` and ``clear``; ``get_or_compute`` makes
+    sure that concurrent identical requests share a single upstream call.
+    """
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    @abstractmethod
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (found, value) for a key"""
+    
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float):
+        """Store a value for ttl seconds"""
+    
+    @abstractmethod
+    def clear(self):
+        """Remove all cached entries"""
+    
+    def __len__(self) -> int:
+        return 0
+    
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """Like get(), but counts the hit or miss"""
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found, value
+    
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: float,
+        bypass: bool = False
+    ) -> Any:
+        """Return a cached value, join an in-flight call, or run compute()"""
+        if not bypass:
+            found, value = self.get(key)
+            if found:
+                self.hits += 1
+                return value
+            
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.coalesced += 1
+                return await asyncio.shield(inflight)
+        
+        self.misses += 1
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = task
+        
+        def _on_done(fut: asyncio.Future):
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+            if not fut.cancelled() and fut.exception() is None and ttl > 0:
+                self.set(key, fut.result(), ttl)
+        
+        task.add_done_callback(_on_done)
+        return await asyncio.shield(task)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "backend": type(self).__name__,
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "in_flight": len(self._inflight),
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0
+        }
+
+class LRUCache(ResponseCache):
+    """In-process size-bounded LRU cache with per-entry TTLs"""
+    
+    def __init__(self, max_entries: int = 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return False, None
+        
+        self._entries.move_to_end(key)
+        return True, value
+    
+    def set(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class NullCache(ResponseCache):
+    """Cache that never stores anything but still coalesces in-flight calls"""
+    
+    def get(self, key: str) -> Tuple[bool, Any]:
+        return False, None
+    
+    def set(self, key: str, value: Any, ttl: float):
+        pass
+    
+    def clear(self):
+        pass
+
+class SQLiteCache(ResponseCache):
+    """On-disk cache shared by every worker process on the host
+    
+    Entries live in one SQLite database in WAL mode, so readers never block
+    each other or the writer and all processes see the same entries. Calls
+    run on the event loop, so a write lock held by another process is waited
+    for at most ``busy_timeout`` seconds; past that the get is a miss and the
+    set or eviction is skipped (counted as ``contended``). Values
+    are stored as JSON with wall-clock expiry times. Once the entry count or
+    total size passes its bound, expired entries go first, then the least
+    recently read. Read times are only refreshed once per ``touch_interval``
+    to keep hits from turning into writes.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        evict_every: int = 64,
+        touch_interval: float = 60.0,
+        busy_timeout: float = 0.05
+    ):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.touch_interval = touch_interval
+        self.busy_timeout = busy_timeout
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._sets = 0
+        self.contended = 0
+    
+    def _contended(self, error: sqlite3.OperationalError) -> bool:
+        """Count a busy/locked database error; False for any other error"""
+        if error.sqlite_errorcode & 0xFF not in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+            return False
+        self.contended += 1
+        return True
+    
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection for this process (reopened after a fork)"""
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA mmap_size=268435456")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL, size INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+    
+    def get(self, key: str) -> Tuple[bool, Any]:
+        try:
+            row = self.connection.execute(
+                "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            
+            value, expires_at, accessed_at = row
+            now = time.time()
+            if expires_at <= now:
+                self.connection.execute("DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now))
+                self.evictions += 1
+                return False, None
+            
+            if now - accessed_at > self.touch_interval:
+                self.connection.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.OperationalError as e:
+            # Another process holds the write lock: a miss beats stalling the event loop
+            if not self._contended(e):
+                raise
+            return False, None
+        return True, json.loads(value)
+    
+    def set(self, key: str, value: Any, ttl: float):
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        now = time.time()
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, now + ttl, now, len(payload))
+            )
+        except sqlite3.OperationalError as e:
+            # Skipped under contention; the next identical call stores it
+            if not self._contended(e):
+                raise
+            return
+        
+        self._sets += 1
+        if self._sets % self.evict_every == 0:
+            self.evict()
+    
+    def evict(self):
+        """Drop expired entries, then least recently read ones until within bounds"""
+        try:
+            self._evict()
+        except sqlite3.OperationalError as e:
+            # Left for a later set
+            if not self._contended(e):
+                raise
+    
+    def _evict(self):
+        connection = self.connection
+        self.evictions += connection.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        
+        count, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        
+        # Trim to 90% so eviction doesn't run again on the very next check
+        excess = max(count - int(self.max_entries * 0.9), 0)
+        if size > self.max_bytes:
+            excess = max(excess, int(count * (1 - 0.9 * self.max_bytes / size)))
+        self.evictions += connection.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)", (excess,)
+        ).rowcount
+    
+    def clear(self):
+        self.connection.execute("DELETE FROM entries")
+    
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters, plus operations skipped because the database was locked"""
+        return {**super().stats(), "contended": self.contended}
+    
+    def close(self):
+        """Close this process's connection"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+def create_response_cache() -> ResponseCache:
+    """Create the response cache configured by the environment"""
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return NullCache()
+    
+    if os.getenv("LLM_CACHE_BACKEND", "memory").lower() == "sqlite":
+        return SQLiteCache(
+            os.getenv("LLM_CACHE_PATH", "cache/wingman.sqlite3"),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 100_000)),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+            busy_timeout=float(os.getenv("LLM_CACHE_BUSY_TIMEOUT", 0.05))
+        )
+    
+    return LRUCache(max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024)))
+
+# Popcount lookup table for NumPy builds without np.bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def hash_to_words(phash: int, bits: int = 256) -> np.ndarray:
+    """Split a perceptual hash into uint64 words"""
+    return np.frombuffer(phash.to_bytes(bits // 8, "big"), dtype=">u8").astype(np.uint64)
+
+def hamming_distances(hashes: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Hamming distance between a query and every column of a (words, n) uint64 array"""
+    distances = np.zeros(hashes.shape[1], dtype=np.uint16)
+    for word, query_word in zip(hashes, query):
+        diff = np.bitwise_xor(word, query_word)
+        if hasattr(np, "bitwise_count"):
+            distances += np.bitwise_count(diff)
+        else:
+            distances += _POPCOUNT_TABLE[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint16)
+    return distances
+
+def _group_id(group: str) -> int:
+    """Reduce a group key (tool, options, context) to 64 bits"""
+    return int.from_bytes(hashlib.blake2b(group.encode("utf-8"), digest_size=8).digest(), "big")
+
+class PerceptualHashIndex:
+    """Bounded index of recent screenshot analyses searchable by Hamming distance
+    
+    Hashes live in fixed-size NumPy arrays so memory stays constant and a lookup
+    is a single vectorized XOR/popcount pass. When full, the least recently used
+    entry is evicted.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl: float = 3600,
+        max_distance: int = 12,
+        hash_bits: int = 256,
+        shared: Optional[ResponseCache] = None
+    ):
+        self.max_entries = max_entries
+        self.hash_bits = hash_bits
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        # Exact-hash matches are also shared with other workers through this cache
+        self.shared = shared
+        
+        # Word-major layout keeps each XOR/popcount pass over contiguous memory
+        self._hashes = np.zeros((hash_bits // 64, max_entries), dtype=np.uint64)
+        self._groups = np.zeros(max_entries, dtype=np.uint64)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._values: List[Any] = [None] * max_entries
+        self._size = 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def _shared_key(self, phash: int, group: str) -> str:
+        return f"screenshot:{_group_id(group):016x}:{phash:0{self.hash_bits // 4}x}"
+    
+    def _lookup_shared(self, phash: int, group: str) -> Optional[Dict[str, Any]]:
+        """Fall back to an exact match stored by another worker"""
+        if self.shared is not None:
+            found, value = self.shared.get(self._shared_key(phash, group))
+            if found:
+                self.hits += 1
+                self.shared_hits += 1
+                self.add(phash, group, value, share=False)
+                return {"value": value, "distance": 0}
+        
+        self.misses += 1
+        return None
+    
+    def lookup(self, phash: int, group: str) -> Optional[Dict[str, Any]]:
+        """Find the closest cached analysis within max_distance for the same group"""
+        if self._size == 0:
+            return self._lookup_shared(phash, group)
+        
+        now = time.monotonic()
+        candidates = self._valid & (self._groups == np.uint64(_group_id(group))) & (self._expires > now)
+        if not candidates.any():
+            return self._lookup_shared(phash, group)
+        
+        distances = hamming_distances(self._hashes, hash_to_words(phash, self.hash_bits))
+        distances = np.where(candidates, distances, self.hash_bits + 1)
+        slot = int(np.argmin(distances))
+        distance = int(distances[slot])
+        
+        if distance > self.max_distance:
+            return self._lookup_shared(phash, group)
+        
+        self.hits += 1
+        self._last_used[slot] = now
+        return {"value": self._values[slot], "distance": distance}
+    
+    def add(self, phash: int, group: str, value: Any, share: bool = True):
+        """Store an analysis, evicting expired or least recently used entries when full"""
+        if share and self.shared is not None:
+            self.shared.set(self._shared_key(phash, group), value, self.ttl)
+        now = time.monotonic()
+        words = hash_to_words(phash, self.hash_bits)
+        group_id = np.uint64(_group_id(group))
+        
+        # The same screenshot again (fresh=True, another worker's entry) replaces its entry
+        same = self._valid & (self._groups == group_id) & (self._hashes == words[:, None]).all(axis=0)
+        if same.any():
+            slot = int(np.argmax(same))
+            self._size -= 1
+        elif self._size < self.max_entries:
+            slot = int(np.argmin(self._valid))
+        else:
+            expired = self._valid & (self._expires <= now)
+            if expired.any():
+                slot = int(np.argmax(expired))
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._size -= 1
+            self.evictions += 1
+        
+        self._hashes[:, slot] = words
+        self._groups[slot] = group_id
+        self._expires[slot] = now + self.ttl
+        self._last_used[slot] = now
+        self._valid[slot] = True
+        self._values[slot] = value
+        self._size += 1
+    
+    def clear(self):
+        """Remove all entries"""
+        self._valid[:] = False
+        self._values = [None] * self.max_entries
+        self._size = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get index counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "shared_hits": self.shared_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+def create_screenshot_cache(shared: Optional[ResponseCache] = None) -> PerceptualHashIndex:
+    """Create the screenshot analysis index configured by the environment
+    
+    Pass the response cache as ``shared`` to share analyses across workers
+    when it is an SQLiteCache.
+    """
+    return PerceptualHashIndex(
+        max_entries=int(os.getenv("SCREENSHOT_CACHE_MAX_ENTRIES", 4096)),
+        ttl=float(os.getenv("SCREENSHOT_CACHE_TTL", 3600)),
+        max_distance=int(os.getenv("SCREENSHOT_CACHE_MAX_DISTANCE", 12)),
+        shared=shared if isinstance(shared, SQLiteCache) else None
+    )
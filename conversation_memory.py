@@ -0,0 +1,224 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Set, Tuple
+from budget import keep_ends
+from metrics import MetricsRegistry
+from ranking import shingles, similarity
+
+Message = Dict[str, str]
+
+def message_size(message: Message) -> int:
+    """Approximate bytes a stored message takes (its sender and text)"""
+    return len(message.get("sender", "")) + len(message.get("text", ""))
+
+def merge_messages(
+    known: List[Message],
+    extracted: List[Message],
+    threshold: float = 0.8
+) -> Tuple[List[Message], int]:
+    """Messages of extracted that aren't already known, plus how many were duplicates
+    
+    Overlapping screenshots repeat the end of what is known at their top, so
+    the longest run at the end of known matching the start of extracted is
+    dropped. A screenshot scrolled back into known messages (two or more of
+    them in a row) is all duplicates. Messages match on sender and character
+    4-gram Jaccard similarity, which tolerates small OCR differences between
+    uploads.
+    """
+    if not known or not extracted:
+        return list(extracted), 0
+    
+    known_grams = [(message.get("sender"), shingles(message.get("text", ""))) for message in known]
+    new_grams = [(message.get("sender"), shingles(message.get("text", ""))) for message in extracted]
+    
+    def same(a: Tuple[Optional[str], Set[str]], b: Tuple[Optional[str], Set[str]]) -> bool:
+        return a[0] == b[0] and similarity(a[1], b[1]) >= threshold
+    
+    for overlap in range(min(len(known_grams), len(new_grams)), 0, -1):
+        tail = known_grams[len(known_grams) - overlap:]
+        if all(same(a, b) for a, b in zip(tail, new_grams)):
+            return list(extracted[overlap:]), overlap
+    
+    # A single message (a "haha") matching an older one is more likely new
+    for start in range(len(known_grams) - len(new_grams) + 1 if len(new_grams) > 1 else 0):
+        if all(same(a, b) for a, b in zip(known_grams[start:], new_grams)):
+            return [], len(extracted)
+    return list(extracted), 0
+
+class ConversationSession:
+    """What is known about one conversation: its latest messages and a summary of all of it"""
+    
+    __slots__ = ("messages", "summary", "compacted", "screenshots", "updated_at", "size")
+    
+    def __init__(self):
+        self.messages: List[Message] = []
+        self.summary = ""
+        self.compacted = 0
+        self.screenshots = 0
+        self.updated_at = time.monotonic()
+        self.size = 0
+
+class ConversationMemory:
+    """Session-scoped memory of conversation screenshots
+    
+    Each session keeps the messages extracted from its earlier screenshots
+    (the latest max_messages of them) and a rolling summary, which is the
+    model's conversation_summary of the previous analysis cut to
+    summary_chars. A new screenshot's prompt carries the summary and the last
+    anchor_messages known messages, so the model reasons about the whole
+    conversation while the prompt stays bounded however long it gets. The
+    model still lists every visible message; the ones already known are
+    dropped here. A screenshot that shares no message with the session is a
+    different conversation, and the session restarts from it. Sessions are
+    evicted least recently used first once their total size exceeds
+    max_bytes, and expire ttl seconds after their last screenshot.
+    """
+    
+    def __init__(
+        self,
+        max_bytes: int = 8 * 1024 * 1024,
+        ttl: float = 3600,
+        max_messages: int = 40,
+        anchor_messages: int = 3,
+        summary_chars: int = 1200,
+        match_threshold: float = 0.8,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.anchor_messages = anchor_messages
+        self.summary_chars = summary_chars
+        self.match_threshold = match_threshold
+        self.metrics = metrics
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self.bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        self.resets = 0
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def _drop(self, key: str):
+        self.bytes -= self._sessions.pop(key).size
+    
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, session in self._sessions.items() if session.updated_at < cutoff]:
+            self._drop(key)
+            self.expired += 1
+    
+    def get(self, key: str) -> Optional[ConversationSession]:
+        """A live session, marked as recently used"""
+        self._expire()
+        session = self._sessions.get(key)
+        if session is not None:
+            self._sessions.move_to_end(key)
+        return session
+    
+    def prompt_context(self, key: str) -> Tuple[str, str]:
+        """(prompt text about what's already known, digest of it); empty for a new conversation"""
+        session = self.get(key)
+        if session is None or not (session.messages or session.summary):
+            return "", ""
+        
+        lines = ["", ""]
+        if session.summary:
+            lines.append(f"Earlier in this conversation: {session.summary}")
+        anchor = session.messages[-self.anchor_messages:] if self.anchor_messages > 0 else []
+        if anchor:
+            lines.append("Last messages already read:")
+            lines.extend(f"{message.get('sender', '')}: {message.get('text', '')}" for message in anchor)
+        lines.append("Still list every visible message in extracted_messages, including any of these.")
+        lines.append(
+            "If the screenshot continues this conversation, summarize all of it, earlier part included, "
+            "in conversation_summary; if it is a different conversation, ignore the earlier part."
+        )
+        text = "\n".join(lines)
+        return text, hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    
+    def update(self, key: str, extracted: List[Message], summary: str) -> Dict[str, Any]:
+        """Merge a screenshot's messages and summary into the session; returns the new messages and counts"""
+        session = self.get(key)
+        if session is None:
+            session = self._sessions[key] = ConversationSession()
+        
+        new, duplicates = merge_messages(session.messages, extracted, self.match_threshold)
+        reset = bool(session.messages and extracted and not duplicates)
+        if reset:
+            # Nothing in common with what is known: another chat, not the next page of this one
+            session.messages = []
+            session.summary = ""
+            session.compacted = 0
+            session.screenshots = 0
+            new = list(extracted)
+            self.resets += 1
+        session.messages.extend(new)
+        compacted = max(len(session.messages) - self.max_messages, 0)
+        if compacted:
+            # The summary covers them from here on
+            del session.messages[:compacted]
+            session.compacted += compacted
+        if summary:
+            session.summary = keep_ends(summary.strip(), self.summary_chars)
+        session.screenshots += 1
+        session.updated_at = time.monotonic()
+        
+        size = sum(message_size(message) for message in session.messages) + len(session.summary)
+        self.bytes += size - session.size
+        session.size = size
+        while self.bytes > self.max_bytes and len(self._sessions) > 1:
+            self._drop(next(iter(self._sessions)))
+            self.evicted += 1
+        
+        if self.metrics is not None:
+            self.metrics.record_conversation_messages(len(new), duplicates, compacted)
+        return {
+            "new": new,
+            "duplicates": duplicates,
+            "known_messages": session.compacted + len(session.messages),
+            "compacted_messages": session.compacted,
+            "screenshots": session.screenshots,
+            "reset": reset
+        }
+    
+    def messages(self, key: str) -> List[Message]:
+        """Latest known messages of a session, oldest first"""
+        session = self.get(key)
+        return list(session.messages) if session is not None else []
+    
+    def forget(self, key: str):
+        """Drop a session's memory"""
+        if key in self._sessions:
+            self._drop(key)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get session count, total and per-session size, evictions, expirations and resets"""
+        self._expire()
+        sizes = [session.size for session in self._sessions.values()]
+        lengths = [len(session.messages) for session in self._sessions.values()]
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "session_bytes_mean": sum(sizes) / len(sizes) if sizes else 0.0,
+            "session_bytes_max": max(sizes, default=0),
+            "session_messages_max": max(lengths, default=0),
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "resets": self.resets
+        }
+
+def create_conversation_memory(metrics: Optional[MetricsRegistry] = None) -> ConversationMemory:
+    """Create the conversation memory configured by the environment"""
+    return ConversationMemory(
+        max_bytes=int(os.getenv("CONVERSATION_MEMORY_MAX_BYTES", 8 * 1024 * 1024)),
+        ttl=float(os.getenv("CONVERSATION_MEMORY_TTL", 3600)),
+        max_messages=int(os.getenv("CONVERSATION_MEMORY_MAX_MESSAGES", 40)),
+        anchor_messages=int(os.getenv("CONVERSATION_MEMORY_ANCHOR_MESSAGES", 3)),
+        summary_chars=int(os.getenv("CONVERSATION_MEMORY_SUMMARY_CHARS", 1200)),
+        metrics=metrics
+    )
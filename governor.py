@@ -0,0 +1,389 @@
+import os
+import time
+import random
+import asyncio
+from typing import Optional, Dict, Any, List, Callable, Awaitable, TypeVar
+
+T = TypeVar("T")
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Rough vision cost per image (high detail, a few 512px tiles)
+IMAGE_TOKEN_ESTIMATE = 1105
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """Estimate the tokens a request will consume (prompt ~4 chars/token + max_tokens)"""
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+    return chars // 4 + images * IMAGE_TOKEN_ESTIMATE + max_tokens
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """HTTP status code of an OpenAI API error, if any"""
+    return getattr(error, "status_code", None)
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed request is worth retrying"""
+    # Imported here so loading this module doesn't pull in the OpenAI SDK
+    import openai
+    
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    return get_status_code(error) in RETRYABLE_STATUS_CODES
+
+def is_overload(error: Exception) -> bool:
+    """Whether a failure signals upstream overload (429 or timeout)"""
+    import openai
+    
+    return get_status_code(error) == 429 or isinstance(error, (openai.APITimeoutError, asyncio.TimeoutError))
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait according to Retry-After / retry-after-ms response headers"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            return float(retry_after_ms) / 1000
+        
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            return float(retry_after)
+    except (TypeError, ValueError):
+        pass
+    
+    return None
+
+class DeadlineExceeded(Exception):
+    """Raised when a request cannot finish before its deadline"""
+
+class TokenBucket:
+    """Per-minute token bucket; a rate of 0 disables the limit"""
+    
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.rate = per_minute / 60
+        self._updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    async def acquire(self, cost: float, deadline_at: Optional[float] = None):
+        """Take cost tokens, waiting for refill but never past the deadline"""
+        if self.per_minute <= 0:
+            return
+        
+        cost = min(cost, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return
+            
+            wait = (cost - self.tokens) / self.rate
+            if deadline_at is not None and time.monotonic() + wait > deadline_at:
+                raise DeadlineExceeded("Rate limit wait would exceed the request deadline")
+            await asyncio.sleep(wait)
+    
+    def try_acquire(self, cost: float = 1) -> float:
+        """Take cost tokens without waiting; returns 0, or the seconds until they'd be available"""
+        if self.per_minute <= 0:
+            return 0.0
+        
+        cost = min(cost, self.capacity)
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+    
+    def refund(self, tokens: float):
+        """Return unused tokens after the real cost is known"""
+        if self.per_minute > 0 and tokens > 0:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit driven by observed latency and overload signals
+    
+    Every fast success raises the limit by 1/limit (about +1 per window of
+    requests); a 429, timeout or slow response halves it. Only requests that
+    started after the last decrease can shrink it again, so a burst of failures
+    from one window counts as a single congestion event.
+    """
+    
+    def __init__(
+        self,
+        initial: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_target: float = 15.0,
+        backoff: float = 0.5
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.waiting = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+    
+    async def acquire(self):
+        """Wait for a free concurrency slot"""
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+    
+    async def release(self, started_at: float, latency: Optional[float], overloaded: bool):
+        """Free a slot and adapt the limit to the outcome"""
+        async with self._condition:
+            self.in_flight -= 1
+            
+            slow = latency is not None and latency > self.latency_target
+            if overloaded or slow:
+                if started_at >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            
+            self._condition.notify_all()
+
+class GovernedStream:
+    """A streamed response that keeps its concurrency slot until the stream ends
+    
+    Every chunk must arrive before the request deadline. Once the stream is
+    exhausted, fails or is closed, the slot is released with the full stream
+    latency and the token bucket is settled with the final usage chunk.
+    """
+    
+    def __init__(
+        self,
+        stream: Any,
+        governor: "RateGovernor",
+        started_at: float,
+        deadline_at: float,
+        estimated_tokens: int
+    ):
+        self._stream = stream
+        self._iterator = stream.__aiter__()
+        self.governor = governor
+        self.started_at = started_at
+        self.deadline_at = deadline_at
+        self.estimated_tokens = estimated_tokens
+        self.usage = None
+        self._released = False
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        try:
+            async with asyncio.timeout_at(self.governor._loop_time(self.deadline_at)):
+                chunk = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            await self._release(time.monotonic() - self.started_at, False)
+            raise
+        except TimeoutError as e:
+            self.governor.deadline_exceeded += 1
+            await self.aclose(overloaded=True)
+            raise DeadlineExceeded("LLM stream deadline exceeded") from e
+        except (Exception, asyncio.CancelledError) as e:
+            await self.aclose(overloaded=isinstance(e, Exception) and is_overload(e))
+            raise
+        
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage
+        return chunk
+    
+    async def _release(self, latency: Optional[float], overloaded: bool):
+        if self._released:
+            return
+        self._released = True
+        await self.governor.limiter.release(self.started_at, latency, overloaded)
+        self.governor.settle(self.estimated_tokens, getattr(self.usage, "total_tokens", None))
+    
+    async def aclose(self, overloaded: bool = False):
+        """Close the upstream stream and free its slot"""
+        try:
+            close = getattr(self._stream, "close", None) or getattr(self._stream, "aclose", None)
+            if close is not None and not self._released:
+                await close()
+        finally:
+            # An abandoned stream says nothing about upstream latency
+            await self._release(None, overloaded)
+    
+    close = aclose
+
+class RateGovernor:
+    """Shared governor for upstream OpenAI calls
+    
+    Combines the adaptive concurrency limit, request/token per-minute buckets,
+    retries with jittered exponential backoff (honoring Retry-After) and a
+    per-request deadline that covers queueing, retries and the calls themselves.
+    """
+    
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 3,
+        deadline: float = 60.0,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.deadline_exceeded = 0
+    
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+    
+    async def call(
+        self,
+        request: Callable[[], Awaitable[T]],
+        estimated_tokens: int,
+        deadline: Optional[float] = None,
+        stream: bool = False
+    ) -> T:
+        """Run request() under the rate limits, retrying transient failures
+        
+        With stream=True the result is wrapped in a GovernedStream, which holds
+        the concurrency slot and the deadline until the stream ends. The token
+        estimate is taken once, whatever the retries, and refunded on failure.
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        self.calls += 1
+        attempt = 0
+        charged = False
+        
+        try:
+            while True:
+                try:
+                    await self.requests.acquire(1, deadline_at)
+                    if not charged:
+                        # Once per call: retries resend the same prompt under this estimate
+                        await self.tokens.acquire(estimated_tokens, deadline_at)
+                        charged = True
+                    async with asyncio.timeout_at(self._loop_time(deadline_at)):
+                        await self.limiter.acquire()
+                except (DeadlineExceeded, TimeoutError):
+                    self.deadline_exceeded += 1
+                    raise DeadlineExceeded("LLM request deadline exceeded while queued")
+                
+                started_at = time.monotonic()
+                latency = None
+                overloaded = False
+                held = False
+                try:
+                    async with asyncio.timeout_at(self._loop_time(deadline_at)):
+                        result = await request()
+                    if stream:
+                        held = True
+                        return GovernedStream(result, self, started_at, deadline_at, estimated_tokens)
+                    latency = time.monotonic() - started_at
+                    return result
+                except Exception as e:
+                    overloaded = is_overload(e)
+                    if get_status_code(e) == 429:
+                        self.rate_limited += 1
+                    if isinstance(e, TimeoutError) and time.monotonic() >= deadline_at:
+                        self.deadline_exceeded += 1
+                        raise DeadlineExceeded("LLM request deadline exceeded") from e
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        raise
+                    
+                    delay = self.backoff_delay(attempt, get_retry_after(e))
+                    if time.monotonic() + delay >= deadline_at:
+                        raise
+                finally:
+                    if not held:
+                        await self.limiter.release(started_at, latency, overloaded)
+                
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+        except Exception:
+            # No usage will settle a failed call, so its estimate goes back to the
+            # bucket (a cancelled call keeps it: the request may have run upstream)
+            if charged:
+                self.tokens.refund(estimated_tokens)
+            raise
+    
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Refund the token bucket once the real usage is known"""
+        if actual_tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+    
+    def _loop_time(self, deadline_at: float) -> float:
+        """Convert a time.monotonic() deadline to event loop time"""
+        return asyncio.get_running_loop().time() + (deadline_at - time.monotonic())
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get governor counters"""
+        return {
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "deadline_exceeded": self.deadline_exceeded,
+            "request_tokens_available": self.requests.tokens if self.requests.per_minute > 0 else None,
+            "llm_tokens_available": self.tokens.tokens if self.tokens.per_minute > 0 else None
+        }
+
+def create_governor() -> RateGovernor:
+    """Create the OpenAI call governor configured by the environment"""
+    limiter = AdaptiveConcurrencyLimiter(
+        initial=int(os.getenv("LLM_INITIAL_CONCURRENCY", 16)),
+        min_limit=int(os.getenv("LLM_MIN_CONCURRENCY", 1)),
+        max_limit=int(os.getenv("LLM_MAX_CONCURRENCY", 64)),
+        latency_target=float(os.getenv("LLM_LATENCY_TARGET", 15))
+    )
+    return RateGovernor(
+        requests_per_minute=float(os.getenv("LLM_RPM", 0)),
+        tokens_per_minute=float(os.getenv("LLM_TPM", 0)),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", 3)),
+        deadline=float(os.getenv("LLM_REQUEST_DEADLINE", 60)),
+        backoff_base=float(os.getenv("LLM_BACKOFF_BASE", 0.5)),
+        backoff_max=float(os.getenv("LLM_BACKOFF_MAX", 20)),
+        limiter=limiter
+    )
@@ -0,0 +1,110 @@
+import os
+import ssl
+import importlib.util
+from typing import Optional, Dict, Any, Union
+import httpx
+
+def http2_available() -> bool:
+    """Whether the h2 package needed for HTTP/2 is installed"""
+    return importlib.util.find_spec("h2") is not None
+
+class HTTPPool:
+    """Shared httpx connection pool for upstream OpenAI traffic
+    
+    One AsyncClient with explicit limits, keep-alive and timeouts is reused
+    by every call, so concurrent tool calls share warm (optionally HTTP/2)
+    connections instead of opening new ones. Connection setup is traced to
+    count TCP connects and TLS handshakes.
+    """
+    
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 50,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 10.0,
+        http2: bool = True,
+        verify: Union[bool, str, ssl.SSLContext] = True
+    ):
+        self.max_connections = max_connections
+        self.http2 = http2 and http2_available()
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout
+        )
+        self.requests = 0
+        self.connects = 0
+        self.tls_handshakes = 0
+        
+        if isinstance(verify, str):
+            verify = ssl.create_default_context(cafile=verify)
+        
+        self.client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=self.timeout,
+            verify=verify,
+            event_hooks={"request": [self._on_request]}
+        )
+    
+    async def _on_request(self, request: httpx.Request):
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+    
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace callback; counts new connections"""
+        if event_name == "connection.connect_tcp.complete":
+            self.connects += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+    
+    def _pool_usage(self) -> Dict[str, int]:
+        """Connections, active, idle and waiting from httpcore's pool; empty if its internals differ"""
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        try:
+            connections = list(getattr(pool, "connections"))
+            idle = sum(1 for connection in connections if connection.is_idle())
+            waiting = sum(1 for request in getattr(pool, "_requests") if request.is_queued())
+        except (AttributeError, TypeError):
+            return {}
+        return {
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "waiting": waiting
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get pool usage: active, idle and waiting (when available) plus connection counters"""
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            **self._pool_usage(),
+            "requests": self.requests,
+            "connects": self.connects,
+            "tls_handshakes": self.tls_handshakes
+        }
+    
+    async def aclose(self):
+        """Close all pooled connections"""
+        await self.client.aclose()
+
+def create_http_pool(verify: Optional[Union[bool, str, ssl.SSLContext]] = None) -> HTTPPool:
+    """Create the upstream HTTP pool configured by the environment"""
+    return HTTPPool(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", 50)),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30)),
+        connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)),
+        read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", 60)),
+        write_timeout=float(os.getenv("HTTP_WRITE_TIMEOUT", 10)),
+        pool_timeout=float(os.getenv("HTTP_POOL_TIMEOUT", 10)),
+        http2=os.getenv("HTTP2_ENABLED", "true").lower() not in ("0", "false", "no"),
+        verify=verify if verify is not None else os.getenv("HTTP_CA_BUNDLE") or True
+    )
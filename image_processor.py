@@ -1,27 +1,420 @@
+import os
+import math
+import time
 import base64
 import io
-from PIL import Image
-from typing import Dict, Any
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
+
+# PIL is imported on first use to keep server start-up fast
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Output formats supported by the vision normalization stage
+VISION_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+# Images whose long edge fits in this many pixels are sent with detail="low"
+LOW_DETAIL_MAX_EDGE = 512
+
+# Fraction of the image height ignored by the perceptual hash (phone status bar)
+HASH_CROP_TOP = 0.06
+
+# Largest share of the height a bar touching the top (status/header) or the
+# bottom (keyboard, input, nav) may take to be cropped as UI chrome
+CHROME_MAX_TOP = 0.2
+CHROME_MAX_BOTTOM = 0.5
+
+# Full-width lines at most this thick separate a header or input bar from content
+DIVIDER_MAX_ROWS = 4
+
+# Thin text bands this close to the top or bottom edge are the status bar or
+# home indicator, not content
+EDGE_BAND_FRACTION = 0.04
+
+# Per-channel difference from the background that counts as foreground (light
+# mode bubbles can be within 25 levels of a white background)
+FOREGROUND_TOLERANCE = 12
+
+# Background rows that end a chat bubble, and the gap left between bubbles
+# when tiling
+BUBBLE_MIN_GAP = 4
+BUBBLE_TILE_GAP = 12
+
+def vision_tokens(width: int, height: int, detail: str) -> int:
+    """Estimated prompt tokens of an image (OpenAI's 512px tile formula)"""
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    return 85 + 170 * math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+
+def find_runs(flags: np.ndarray) -> np.ndarray:
+    """(start, end) of every run of True values, end exclusive, as an (n, 2) array"""
+    padded = np.concatenate(([False], flags, [False]))
+    return np.flatnonzero(padded[1:] != padded[:-1]).reshape(-1, 2)
+
+def dominant_color(pixels: np.ndarray, step: int = 4) -> np.ndarray:
+    """Mean of the most common color (at 4 bits per channel) of an RGB uint8 array, sampled every step pixels"""
+    sample = pixels[::step, ::step].reshape(-1, 3)
+    quantized = sample >> 4
+    packed = (quantized[:, 0].astype(np.int32) << 8) | (quantized[:, 1].astype(np.int32) << 4) | quantized[:, 2]
+    mode = np.bincount(packed, minlength=4096).argmax()
+    return sample[packed == mode].mean(axis=0).round().astype(np.int16)
+
+def color_mask(pixels: np.ndarray, color: np.ndarray, tolerance: int = FOREGROUND_TOLERANCE) -> np.ndarray:
+    """Pixels of an RGB uint8 array within tolerance of a color on every channel"""
+    mask = np.ones(pixels.shape[:2], dtype=bool)
+    for channel in range(3):
+        values = pixels[..., channel]
+        # Compared as uint8 against clipped bounds, which avoids a widened copy of the image
+        low, high = max(int(color[channel]) - tolerance, 0), min(int(color[channel]) + tolerance, 255)
+        mask &= (values >= low) & (values <= high)
+    return mask
+
+def edge_bar(pixels: np.ndarray, background: np.ndarray, from_top: bool, max_rows: int) -> int:
+    """Rows of a bar touching one edge in a color other than the background; 0 if there is none
+    
+    A bar is the run of rows from the edge that each have at least 10% of
+    the edge row's color, which keeps keyboards (keys on a bar-colored
+    backdrop) in one piece. Bars taller than max_rows are content.
+    """
+    zone = pixels[:max_rows + 1] if from_top else pixels[len(pixels) - max_rows - 1:][::-1]
+    bar_color = dominant_color(zone[:1], 1)
+    if (np.abs(bar_color - background) <= FOREGROUND_TOLERANCE).all():
+        return 0
+    rows = color_mask(zone, bar_color).mean(axis=1) >= 0.1
+    height = int(np.argmin(rows)) if not rows.all() else len(rows)
+    return height if height <= max_rows else 0
+
+def content_box(pixels: np.ndarray, background: np.ndarray, foreground: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """(left, top, right, bottom) of a screenshot without its UI chrome and uniform margins; None if nothing is left"""
+    height, width = foreground.shape
+    top = edge_bar(pixels, background, True, int(height * CHROME_MAX_TOP))
+    bottom = height - edge_bar(pixels, background, False, int(height * CHROME_MAX_BOTTOM))
+    
+    # Below the last divider line of the top zone, above the first of the bottom zone
+    dividers = find_runs(foreground[top:bottom].mean(axis=1) >= 0.9) + top
+    dividers = dividers[dividers[:, 1] - dividers[:, 0] <= DIVIDER_MAX_ROWS]
+    upper = dividers[dividers[:, 1] <= height * CHROME_MAX_TOP]
+    lower = dividers[dividers[:, 0] >= height * (1 - CHROME_MAX_BOTTOM)]
+    if len(upper):
+        top = int(upper[-1][1])
+    if len(lower):
+        bottom = int(lower[0][0])
+    
+    bands = find_runs(foreground[top:bottom].sum(axis=1) >= 2) + top
+    if len(bands) == 0:
+        return None
+    # Status bar text and home indicator on the background color
+    edge = height * EDGE_BAND_FRACTION
+    if len(bands) > 1 and bands[0][1] <= edge:
+        bands = bands[1:]
+    if len(bands) > 1 and bands[-1][0] >= height - edge:
+        bands = bands[:-1]
+    
+    columns = np.flatnonzero(foreground[bands[0][0]:bands[-1][1]].any(axis=0))
+    pad = BUBBLE_TILE_GAP
+    return (
+        max(int(columns[0]) - pad, 0),
+        max(int(bands[0][0]) - pad, 0),
+        min(int(columns[-1]) + 1 + pad, width),
+        min(int(bands[-1][1]) + pad, height)
+    )
+
+def find_bubbles(foreground: np.ndarray) -> List[Dict[str, Any]]:
+    """Chat bubbles (and centered lines such as timestamps) of a cropped conversation, top to bottom
+    
+    Every row with foreground is labelled by where its foreground sits: rows
+    hugging the left edge are theirs, rows hugging the right edge are mine.
+    A bubble is a run of rows with one label, ended by a label change or
+    BUBBLE_MIN_GAP background rows, so bubbles a few pixels apart on
+    opposite sides are still told apart.
+    """
+    height, width = foreground.shape
+    # A pixel or two is anti-aliasing at a bubble's rounded edge
+    filled = foreground.sum(axis=1) >= 3
+    if not filled.any():
+        return []
+    
+    lefts = foreground.argmax(axis=1)
+    rights = width - foreground[:, ::-1].argmax(axis=1)
+    slack = width * 0.1
+    # 0 blank, 1 left (them), 2 right (me), 3 center
+    labels = np.where(lefts + slack < width - rights, 1, np.where(width - rights + slack < lefts, 2, 3))
+    labels[~filled] = 0
+    
+    # Blank gaps shorter than BUBBLE_MIN_GAP take the label of the row above them
+    gaps = find_runs(~filled)
+    for start, end in gaps[(gaps[:, 1] - gaps[:, 0] < BUBBLE_MIN_GAP) & (gaps[:, 0] > 0) & (gaps[:, 1] < height)]:
+        if labels[start - 1] == labels[end]:
+            labels[start:end] = labels[start - 1]
+    
+    changes = np.flatnonzero(np.diff(labels)) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes, [height]))
+    columns = np.logical_or.reduceat(foreground, starts, axis=0)
+    keep = (labels[starts] != 0) & (ends - starts >= BUBBLE_MIN_GAP)
+    starts, ends, columns = starts[keep], ends[keep], columns[keep]
+    
+    sides = {1: ("left", "them"), 2: ("right", "me"), 3: ("center", None)}
+    bubbles = []
+    for top, bottom, row in zip(starts, ends, columns):
+        filled_columns = np.flatnonzero(row)
+        side, role = sides[int(labels[top])]
+        bubbles.append({
+            "box": [int(filled_columns[0]), int(top), int(filled_columns[-1]) + 1, int(bottom)],
+            "side": side,
+            "role": role
+        })
+    return bubbles
+
+def tile_bubbles(pixels: np.ndarray, bubbles: List[Dict[str, Any]], background: np.ndarray) -> np.ndarray:
+    """Bubble rows stacked with short gaps, keeping their horizontal position"""
+    heights = [bubble["box"][3] - bubble["box"][1] for bubble in bubbles]
+    canvas = np.empty((sum(heights) + BUBBLE_TILE_GAP * (len(bubbles) + 1), pixels.shape[1], 3), dtype=pixels.dtype)
+    canvas[:] = background.astype(pixels.dtype)
+    
+    y = BUBBLE_TILE_GAP
+    for bubble, rows in zip(bubbles, heights):
+        left, top, right, bottom = bubble["box"]
+        canvas[y:y + rows, left:right] = pixels[top:bottom, left:right]
+        y += rows + BUBBLE_TILE_GAP
+    return canvas
 
 class ImageProcessor:
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        max_edge: Optional[int] = None,
+        output_format: Optional[str] = None,
+        quality: Optional[int] = None,
+        detail: Optional[str] = None,
+        max_payload_bytes: Optional[int] = None,
+        crop: Optional[bool] = None,
+        segment_bubbles: Optional[bool] = None
+    ):
+        self.max_edge = max_edge or int(os.getenv("IMAGE_MAX_EDGE", 1600))
+        self.output_format = (output_format or os.getenv("IMAGE_FORMAT", "jpeg")).lower()
+        self.quality = quality or int(os.getenv("IMAGE_QUALITY", 85))
+        self.detail = (detail or os.getenv("IMAGE_DETAIL", "auto")).lower()
+        self.max_payload_bytes = max_payload_bytes or int(
+            os.getenv("IMAGE_MAX_PAYLOAD_BYTES", 10 * 1024 * 1024)
+        )
+        self.crop = crop if crop is not None else os.getenv("IMAGE_CROP", "true").lower() not in ("0", "false", "no")
+        self.segment_bubbles = segment_bubbles if segment_bubbles is not None else (
+            os.getenv("IMAGE_SEGMENT_BUBBLES", "true").lower() not in ("0", "false", "no")
+        )
+        
+        if self.output_format not in VISION_FORMATS:
+            raise ValueError(f"Unsupported image format: {self.output_format}")
+    
+    def check_payload_size(self, base64_data: str):
+        """Reject payloads larger than max_payload_bytes without decoding them"""
+        # Decoded size is 3/4 of the base64 length (plus a data URL prefix at most)
+        estimated_bytes = len(base64_data) * 3 // 4
+        if estimated_bytes > self.max_payload_bytes:
+            raise ValueError(
+                f"Image too large: ~{estimated_bytes} bytes exceeds the "
+                f"{self.max_payload_bytes} byte limit"
+            )
     
-    def decode_base64_image(self, base64_data: str) -> Image.Image:
+    def decode_base64_bytes(self, base64_data: str) -> bytes:
+        """Convert base64 string (optionally a data URL) to raw bytes"""
+        self.check_payload_size(base64_data)
+        
+        # Remove data URL prefix if present
+        if base64_data.startswith('data:image'):
+            base64_data = base64_data.split(',')[1]
+        
+        return base64.b64decode(base64_data)
+    
+    def decode_base64_image(self, base64_data: str) -> "Image.Image":
         """Convert base64 string to PIL Image"""
+        from PIL import Image
+        
         try:
-            # Remove data URL prefix if present
-            if base64_data.startswith('data:image'):
-                base64_data = base64_data.split(',')[1]
-            
-            # Decode base64
-            image_bytes = base64.b64decode(base64_data)
+            image_bytes = self.decode_base64_bytes(base64_data)
             image = Image.open(io.BytesIO(image_bytes))
             return image
         except Exception as e:
             raise ValueError(f"Failed to decode image: {str(e)}")
     
-    def extract_text_from_image(self, image: Image.Image) -> str:
+    def choose_detail(self, width: int, height: int) -> str:
+        """Pick the vision detail level for an image of the given size"""
+        if self.detail in ("low", "high"):
+            return self.detail
+        
+        return "low" if max(width, height) <= LOW_DETAIL_MAX_EDGE else "high"
+    
+    def normalize_image(self, image: "Image.Image") -> "Image.Image":
+        """Apply EXIF orientation, downscale to max_edge and convert the color mode"""
+        from PIL import Image, ImageOps
+        
+        image = ImageOps.exif_transpose(image)
+        
+        if max(image.size) > self.max_edge:
+            image.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+        
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            if self.output_format == "jpeg":
+                # JPEG has no alpha channel, flatten onto white
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.split()[-1])
+                image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        
+        return image
+    
+    def encode_image(self, image: "Image.Image") -> bytes:
+        """Encode an image with the configured format and quality"""
+        pil_format, _ = VISION_FORMATS[self.output_format]
+        buffer = io.BytesIO()
+        
+        if pil_format == "JPEG":
+            image.save(buffer, format=pil_format, quality=self.quality, optimize=True)
+        else:
+            image.save(buffer, format=pil_format, quality=self.quality, method=4)
+        
+        return buffer.getvalue()
+    
+    def encode_lossless(self, image: "Image.Image") -> bytes:
+        """Encode an image as PNG"""
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    
+    def perceptual_hash(self, image: "Image.Image", hash_size: int = 16) -> int:
+        """Compute a difference hash (dHash, hash_size**2 bits) that survives re-encoding"""
+        from PIL import Image
+        
+        width, height = image.size
+        top = int(height * HASH_CROP_TOP)
+        if top:
+            image = image.crop((0, top, width, height))
+        
+        gray = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = np.asarray(gray, dtype=np.int16)
+        bits = pixels[:, 1:] > pixels[:, :-1]
+        return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+    
+    def crop_for_vision(self, image: "Image.Image", segment: bool = False) -> Tuple["Image.Image", Dict[str, Any]]:
+        """Crop UI chrome and margins; for conversations, tile only the chat bubbles"""
+        from PIL import Image
+        
+        pixels = np.asarray(image.convert("RGB"))
+        background = dominant_color(pixels)
+        foreground = ~color_mask(pixels, background)
+        box = content_box(pixels, background, foreground)
+        if box is None:
+            # Nothing recognizable as content: send the screenshot as it is
+            return image, {"crop_box": None}
+        left, top, right, bottom = box
+        cropped = pixels[top:bottom, left:right]
+        info: Dict[str, Any] = {"crop_box": [left, top, right, bottom]}
+        
+        if segment and self.segment_bubbles:
+            # Full-width rows: with the margins trimmed, a chat with one sender would have no sides
+            bubbles = find_bubbles(foreground[top:bottom])
+            # Only worth it when bubbles were told apart and the gaps between them are dropped
+            if any(bubble["side"] != "center" for bubble in bubbles):
+                tiled = tile_bubbles(pixels[top:bottom], bubbles, background)[:, left:right]
+                if tiled.shape[0] < cropped.shape[0]:
+                    cropped = tiled
+                    info["tiled"] = True
+            for bubble in bubbles:
+                x0, y0, x1, y1 = bubble["box"]
+                bubble["box"] = [x0, y0 + top, x1, y1 + top]
+            info["bubbles"] = bubbles
+        
+        if cropped.shape[:2] == pixels.shape[:2]:
+            return image, info
+        return Image.fromarray(cropped), info
+    
+    def prepare_for_vision(self, base64_data: str, segment: bool = False) -> Dict[str, Any]:
+        """Decode, normalize, crop and re-encode a screenshot for the vision API (segment: chat bubbles)"""
+        from PIL import Image
+        
+        start = time.perf_counter()
+        self.check_payload_size(base64_data)
+        
+        try:
+            original_bytes = self.decode_base64_bytes(base64_data)
+            image = Image.open(io.BytesIO(original_bytes))
+            image.load()
+        except Exception as e:
+            raise ValueError(f"Failed to decode image: {str(e)}")
+        
+        original_format = (image.format or "").lower()
+        original_size = image.size
+        orientation = image.getexif().get(0x0112, 1)
+        
+        normalized = self.normalize_image(image)
+        
+        crop_start = time.perf_counter()
+        layout: Dict[str, Any] = {}
+        sent = normalized
+        if self.crop:
+            sent, layout = self.crop_for_vision(normalized, segment)
+        crop_seconds = time.perf_counter() - crop_start
+        
+        encoded = self.encode_image(sent)
+        _, mime_type = VISION_FORMATS[self.output_format]
+        
+        # Flat-colored PNG screenshots often stay smaller lossless than re-encoded
+        if original_format == "png" and sent.size != original_size and len(encoded) >= len(original_bytes):
+            lossless = self.encode_lossless(sent)
+            if len(lossless) < len(encoded):
+                encoded = lossless
+                mime_type = "image/png"
+        
+        # Never send more bytes than the upload when it can go as-is (the API
+        # downscales it the same way; only the crop's token savings are lost)
+        sendable = orientation == 1 and original_format in ("jpeg", "png", "webp")
+        if sendable and len(encoded) >= len(original_bytes):
+            encoded = original_bytes
+            mime_type = Image.MIME[original_format.upper()]
+            if sent.size != original_size:
+                sent = image
+                layout = {"bubbles": layout.get("bubbles", []), "crop_box": None}
+        
+        width, height = sent.size
+        detail = self.choose_detail(width, height)
+        full_width, full_height = normalized.size
+        
+        return {
+            "image_data": base64.b64encode(encoded).decode("ascii"),
+            "mime_type": mime_type,
+            "detail": detail,
+            # Hashed before cropping so near-duplicate lookups don't depend on it
+            "phash": self.perceptual_hash(normalized),
+            "bubbles": layout.get("bubbles", []),
+            "metadata": {
+                "original_bytes": len(original_bytes),
+                "sent_bytes": len(encoded),
+                "original_pixels": original_size[0] * original_size[1],
+                "sent_pixels": width * height,
+                "original_size": list(original_size),
+                "sent_size": [width, height],
+                "original_format": original_format or None,
+                "mime_type": mime_type,
+                "crop_box": layout.get("crop_box"),
+                "bubbles": len(layout.get("bubbles", [])),
+                "tiled": layout.get("tiled", False),
+                "vision_tokens_uncropped": vision_tokens(full_width, full_height, self.choose_detail(full_width, full_height)),
+                "vision_tokens": vision_tokens(width, height, detail),
+                "crop_ms": round(crop_seconds * 1000, 2),
+                "prepare_ms": round((time.perf_counter() - start) * 1000, 2)
+            }
+        }
+    
+    def extract_text_from_image(self, image: "Image.Image") -> str:
         """Skip OCR - let OpenAI Vision handle text extraction"""
         return "Text extraction handled by AI Vision API"
     
@@ -37,5 +430,91 @@ class ImageProcessor:
             "location": None
         }
 
+class ImageWorkerPool:
+    """Runs image decoding and transforms in a thread or process pool
+    
+    Keeps multi-megabyte decodes and re-encodes off the event loop so text tools
+    stay responsive. At most ``workers + queue_size`` jobs are accepted at once;
+    anything beyond that is rejected immediately instead of piling up in memory.
+    """
+    
+    def __init__(
+        self,
+        processor: ImageProcessor,
+        workers: Optional[int] = None,
+        mode: Optional[str] = None,
+        queue_size: Optional[int] = None
+    ):
+        self.processor = processor
+        self.workers = workers or int(os.getenv("IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+        self.mode = (mode or os.getenv("IMAGE_WORKER_MODE", "thread")).lower()
+        self.queue_size = queue_size if queue_size is not None else int(os.getenv("IMAGE_QUEUE_SIZE", 16))
+        self.rejected = 0
+        self.completed = 0
+        self.vision_tokens_uncropped = 0
+        self.vision_tokens = 0
+        self.crop_ms = 0.0
+        self._pending = 0
+        self._executor: Optional[Executor] = None
+        
+        if self.mode not in ("thread", "process"):
+            raise ValueError(f"Unsupported image worker mode: {self.mode}")
+    
+    @property
+    def executor(self) -> Executor:
+        """Create the executor on first use"""
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="image-worker"
+                )
+        return self._executor
+    
+    async def run(self, func, *args):
+        """Run a picklable callable in the pool, rejecting work when the queue is full"""
+        if self._pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise RuntimeError("Image processing queue is full, please retry shortly")
+        
+        self._pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            self.completed += 1
+            return result
+        finally:
+            self._pending -= 1
+    
+    async def prepare_for_vision(self, base64_data: str, segment: bool = False) -> Dict[str, Any]:
+        """Check the payload size, then decode, normalize and crop it in the pool"""
+        self.processor.check_payload_size(base64_data)
+        prepared = await self.run(self.processor.prepare_for_vision, base64_data, segment)
+        metadata = prepared["metadata"]
+        self.vision_tokens_uncropped += metadata["vision_tokens_uncropped"]
+        self.vision_tokens += metadata["vision_tokens"]
+        self.crop_ms += metadata["crop_ms"]
+        return prepared
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get pool counters"""
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "vision_tokens_uncropped": self.vision_tokens_uncropped,
+            "vision_tokens": self.vision_tokens,
+            "crop_ms_mean": self.crop_ms / self.completed if self.completed else 0.0
+        }
+    
+    def shutdown(self):
+        """Stop the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
 # Initialize global processor
 image_processor = ImageProcessor()
@@ -1,23 +1,365 @@
 import os
-from typing import Optional, Dict, Any
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
+import json
+import time
+import asyncio
+import importlib
+from collections import deque
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, AsyncIterator, Iterator, List, Tuple, Type, Callable, TYPE_CHECKING
+from pydantic import BaseModel
+from cache import ResponseCache, create_response_cache, make_cache_key, get_tool_ttl
+from governor import RateGovernor, create_governor, estimate_request_tokens
+from metrics import MetricsRegistry, metrics as default_metrics
+from routing import ModelRouter, Route, create_router, should_fall_back
+from schemas import json_schema_response_format, strict_json_schema
+from structured import (
+    RETRYABLE_KINDS,
+    StructuredOutputError,
+    classify_failure,
+    downgrade_response_format,
+    parse_structured
+)
 
-load_dotenv()
+if TYPE_CHECKING:
+    from http_pool import HTTPPool
+
+# Counters of the enclosing count_upstream_calls blocks
+_upstream_counters: ContextVar[Tuple[List[int], ...]] = ContextVar("upstream_counters", default=())
+
+@contextmanager
+def count_upstream_calls() -> Iterator[List[int]]:
+    """Count completions that miss the response cache inside the block (tasks it starts included) in the yielded [n]"""
+    counter = [0]
+    reset = _upstream_counters.set(_upstream_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _upstream_counters.reset(reset)
 
 class LLMClient:
     """OpenAI LLM client for AI Wingman"""
     
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = os.getenv("OPENAI_MODEL", "gpt-4o")
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        governor: Optional[RateGovernor] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        http_pool: Optional["HTTPPool"] = None,
+        router: Optional[ModelRouter] = None,
+        on_usage: Optional[Callable[[int], None]] = None
+    ):
+        self._client = None
+        self.http_pool = http_pool
+        self.router = router or create_router()
+        self.cache = cache if cache is not None else create_response_cache()
+        self.governor = governor or create_governor()
+        self.metrics = metrics or default_metrics
+        self.structured_max_retries = int(os.getenv("STRUCTURED_MAX_RETRIES", 1))
+        self._ttft: Dict[str, deque] = {}
+        # Called with each completion's total tokens (per-client quotas)
+        self.on_usage = on_usage
+    
+    @property
+    def client(self):
+        """AsyncOpenAI client, created (and the SDK imported) on first use"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            from http_pool import create_http_pool
+            
+            if self.http_pool is None:
+                self.http_pool = create_http_pool()
+            
+            # Retries are handled by the governor, not the SDK
+            self._client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=self.http_pool.timeout,
+                http_client=self.http_pool.client
+            )
+        return self._client
+    
+    def route_stats(self) -> Dict[str, Any]:
+        """Get the model, fallback and recent latency of every route used so far"""
+        return self.router.stats()
+    
+    def http_stats(self) -> Dict[str, Any]:
+        """Get upstream connection pool usage (empty until the first call)"""
+        return self.http_pool.stats() if self.http_pool is not None else {}
+    
+    async def aclose(self):
+        """Close the upstream connection pool"""
+        if self.http_pool is not None:
+            await self.http_pool.aclose()
+        self._client = None
+        self.http_pool = None
+    
+    async def warm_up(self) -> Dict[str, Any]:
+        """Import the SDK off the event loop and open a pooled upstream connection"""
+        start = time.perf_counter()
+        await asyncio.to_thread(importlib.import_module, "openai")
+        await asyncio.to_thread(importlib.import_module, "http_pool")
+        imported = time.perf_counter() - start
+        
+        # Listing models is free and leaves a TLS connection in the pool
+        await self.client.models.list()
+        return {"import_seconds": imported, "total_seconds": time.perf_counter() - start}
+    
+    async def _create(
+        self,
+        model: str,
+        messages: list,
+        max_tokens: int,
+        temperature: float,
+        tool: Optional[str] = None,
+        **kwargs
+    ):
+        """Call chat.completions.create through the rate governor
+        
+        Non-streamed calls are recorded in metrics here; streamed calls are
+        recorded by _stream_completion once the final usage chunk arrives,
+        and hold their governor slot until the stream is closed.
+        """
+        estimated_tokens = estimate_request_tokens(messages, max_tokens)
+        streaming = kwargs.get("stream", False)
+        start = time.perf_counter()
+        
+        try:
+            response = await self.governor.call(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **kwargs
+                ),
+                estimated_tokens,
+                stream=streaming
+            )
+        except (Exception, asyncio.CancelledError) as e:
+            # Cancelled calls include the losing copy of a hedged request
+            self.metrics.record_llm_call(tool, model, time.perf_counter() - start, error=type(e).__name__)
+            raise
+        
+        if not streaming:
+            usage = getattr(response, "usage", None)
+            self.governor.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+            self.metrics.record_llm_call(tool, model, time.perf_counter() - start, usage=usage)
+            self._charge(usage)
+        return response
+    
+    async def _hedged_create(self, route: Route, model: str, *args, **kwargs):
+        """Run _create, duplicating it to the fallback model if it outlives the route's p95"""
+        delay = self.router.hedge_delay(route)
+        # Don't add load while calls are already queueing for the governor
+        if delay is None or model != route.model or self.governor.limiter.waiting > 0:
+            return await self._create(model, *args, **kwargs), "primary"
+        
+        primary = asyncio.ensure_future(self._create(model, *args, **kwargs))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result(), "primary"
+            
+            hedge = asyncio.ensure_future(self._create(route.fallback_model, *args, **kwargs))
+            pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), "hedge_won" if task is hedge else "hedge_lost"
+            raise primary.exception()
+        finally:
+            # The slower copy is cancelled; its tokens may still be billed upstream
+            for task in pending:
+                task.cancel()
+    
+    async def _routed_create(
+        self,
+        tool: Optional[str],
+        messages: list,
+        max_tokens: int,
+        temperature: float,
+        default_tier: str = "quality",
+        **kwargs
+    ):
+        """Call the model routed for a tool, hedging or falling back when it is slow or failing"""
+        route = self.router.route(tool, default_tier)
+        model = self.router.select(route)
+        outcome = "primary" if model == route.model else "degraded"
+        start = time.perf_counter()
+        
+        try:
+            if kwargs.get("stream"):
+                response = await self._create(model, messages, max_tokens, temperature, tool, **kwargs)
+            else:
+                response, hedge_outcome = await self._hedged_create(
+                    route, model, messages, max_tokens, temperature, tool, **kwargs
+                )
+                if model == route.model:
+                    outcome = hedge_outcome
+        except Exception as e:
+            if not route.fallback_model or model == route.fallback_model or not should_fall_back(e):
+                self.metrics.record_route(route.tool, "failed", time.perf_counter() - start)
+                raise
+            
+            model = route.fallback_model
+            outcome = "fallback"
+            response = await self._create(model, messages, max_tokens, temperature, tool, **kwargs)
+        
+        # Streams are observed by _stream_completion once the last chunk arrives
+        if not kwargs.get("stream"):
+            elapsed = time.perf_counter() - start
+            # A primary outrun by its hedge was cancelled at elapsed; counting it there
+            # keeps the slow tail in the p95 that times the hedges
+            if outcome in ("primary", "hedge_won", "hedge_lost"):
+                self.router.observe(route, route.model, elapsed)
+            self.metrics.record_route(route.tool, outcome, elapsed)
+        return response, model
+    
+    def _charge(self, usage: Any):
+        """Report a completion's token usage to on_usage"""
+        total = getattr(usage, "total_tokens", None)
+        if self.on_usage is not None and total:
+            self.on_usage(total)
+    
+    def _record_ttft(self, tool: Optional[str], seconds: float):
+        """Record a time-to-first-token sample for a tool"""
+        samples = self._ttft.setdefault(tool or "default", deque(maxlen=1000))
+        samples.append(seconds)
+        self.metrics.record_ttft(tool, seconds)
+    
+    def ttft_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get time-to-first-token percentiles (ms) per tool for streamed calls"""
+        stats = {}
+        for tool, samples in self._ttft.items():
+            ordered = sorted(samples)
+            stats[tool] = {
+                "count": len(ordered),
+                "p50_ms": ordered[len(ordered) // 2] * 1000,
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                "max_ms": ordered[-1] * 1000
+            }
+        return stats
+    
+    def _image_messages(
+        self,
+        image_data: str,
+        prompt: str,
+        mime_type: str,
+        detail: str,
+        system_message: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Build the vision request messages"""
+        messages = [{"role": "system", "content": system_message}] if system_message else []
+        return messages + [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{image_data}",
+                            "detail": detail
+                        }
+                    }
+                ]
+            }
+        ]
+    
+    async def _stream_completion(
+        self,
+        messages: list,
+        max_tokens: int,
+        temperature: float,
+        tool: Optional[str],
+        default_tier: str = "quality",
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Yield content deltas from a streamed chat completion"""
+        start = time.perf_counter()
+        first_token = True
+        usage = None
+        
+        stream, model = await self._routed_create(
+            tool, messages, max_tokens, temperature, default_tier,
+            stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                
+                if not chunk.choices:
+                    continue
+                
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                
+                if first_token:
+                    self._record_ttft(tool, time.perf_counter() - start)
+                    first_token = False
+                
+                yield delta
+        except Exception as e:
+            self.metrics.record_llm_call(tool, model, time.perf_counter() - start, error=type(e).__name__)
+            raise
+        finally:
+            # Frees the governor slot and settles the token estimate, also when abandoned early
+            await stream.aclose()
+        
+        self.metrics.record_llm_call(tool, model, time.perf_counter() - start, usage=usage)
+        self._charge(usage)
+        route = self.router.route(tool, default_tier)
+        self.router.observe(route, model, time.perf_counter() - start)
+        self.metrics.record_route(route.tool, "stream", time.perf_counter() - start)
+    
+    async def _cached_completion(
+        self,
+        messages: list,
+        max_tokens: int,
+        temperature: float,
+        response_format: Optional[Dict[str, Any]],
+        tool: Optional[str],
+        bypass_cache: bool
+    ) -> str:
+        """Run a chat completion through the response cache"""
+        # Keyed on the route's primary model so fallbacks and hedges share entries
+        key = make_cache_key(self.router.route(tool).model, messages, temperature, max_tokens, response_format)
+        
+        async def compute() -> str:
+            for counter in _upstream_counters.get():
+                counter[0] += 1
+            kwargs = {}
+            if response_format is not None:
+                kwargs["response_format"] = response_format
+            
+            response, _ = await self._routed_create(tool, messages, max_tokens, temperature, **kwargs)
+            return response.choices[0].message.content
+        
+        return await self.cache.get_or_compute(
+            key, compute, ttl=get_tool_ttl(tool), bypass=bypass_cache
+        )
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get response cache hit/miss/eviction counters"""
+        return self.cache.stats()
     
     async def generate_response(
         self, 
         prompt: str,
         max_tokens: int = 500,
         temperature: float = 0.7,
-        system_message: Optional[str] = None
+        system_message: Optional[str] = None,
+        tool: Optional[str] = None,
+        bypass_cache: bool = False
     ) -> str:
         """Generate a text response using OpenAI"""
         try:
@@ -28,78 +370,162 @@ class LLMClient:
             
             messages.append({"role": "user", "content": prompt})
             
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
+            content = await self._cached_completion(
+                messages, max_tokens, temperature, None, tool, bypass_cache
             )
             
-            return response.choices[0].message.content.strip()
-            
+            return content.strip()
+        
         except Exception as e:
             raise Exception(f"LLM generation failed: {str(e)}")
     
+    async def stream_response(
+        self,
+        prompt: str,
+        max_tokens: int = 500,
+        temperature: float = 0.7,
+        system_message: Optional[str] = None,
+        tool: Optional[str] = None,
+        bypass_cache: bool = False
+    ) -> AsyncIterator[str]:
+        """Stream a text response using OpenAI, yielding content deltas"""
+        messages = []
+        
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        
+        messages.append({"role": "user", "content": prompt})
+        
+        key = make_cache_key(self.router.route(tool).model, messages, temperature, max_tokens, None)
+        if not bypass_cache:
+            found, cached = self.cache.lookup(key)
+            if found:
+                yield cached
+                return
+        
+        parts = []
+        try:
+            # Closed promptly if the caller stops early, so the governor slot is freed
+            async with aclosing(self._stream_completion(messages, max_tokens, temperature, tool)) as deltas:
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            raise Exception(f"LLM generation failed: {str(e)}")
+        
+        self.cache.set(key, "".join(parts), get_tool_ttl(tool))
+    
+    async def stream_image_analysis(
+        self,
+        image_data: str,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        mime_type: str = "image/jpeg",
+        detail: str = "auto",
+        tool: Optional[str] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        system_message: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream an image analysis using OpenAI Vision API, yielding content deltas"""
+        kwargs = {"response_format": response_format} if response_format is not None else {}
+        try:
+            async with aclosing(self._stream_completion(
+                self._image_messages(image_data, prompt, mime_type, detail, system_message),
+                max_tokens,
+                temperature,
+                tool,
+                "vision",
+                **kwargs
+            )) as deltas:
+                async for delta in deltas:
+                    yield delta
+        except Exception as e:
+            raise Exception(f"Image analysis failed: {str(e)}")
+    
     async def analyze_image(
         self, 
         image_data: str, 
         prompt: str,
         max_tokens: int = 1000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        mime_type: str = "image/jpeg",
+        detail: str = "auto",
+        tool: Optional[str] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        system_message: Optional[str] = None
     ) -> str:
         """Analyze an image using OpenAI Vision API"""
+        kwargs = {"response_format": response_format} if response_format is not None else {}
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4o",  # Vision model
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                temperature=temperature,
-                max_tokens=max_tokens
+            response, _ = await self._routed_create(
+                tool,
+                self._image_messages(image_data, prompt, mime_type, detail, system_message),
+                max_tokens,
+                temperature,
+                "vision",
+                **kwargs
             )
             
             return response.choices[0].message.content.strip()
-            
+        
         except Exception as e:
             raise Exception(f"Image analysis failed: {str(e)}")
     
     async def generate_structured_response(
         self, 
         prompt: str,
-        response_format: Dict[str, Any],
+        response_format: Optional[Dict[str, Any]] = None,
         max_tokens: int = 500,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        tool: Optional[str] = None,
+        bypass_cache: bool = False,
+        response_model: Optional[Type[BaseModel]] = None,
+        system_message: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Generate a structured response using OpenAI with response format"""
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=temperature,
-                max_tokens=max_tokens,
-                response_format=response_format
-            )
-            
-            import json
-            return json.loads(response.choices[0].message.content)
+        """Generate a structured response, validated against response_model when given
+        
+        Malformed or truncated JSON is repaired locally. Only failures another
+        attempt can fix (a rejected response_format, unparseable or invalid
+        output) are retried, at most STRUCTURED_MAX_RETRIES times; rate limits
+        and timeouts were already retried by the governor and fail fast.
+        """
+        if response_format is None and response_model is not None:
+            response_format = json_schema_response_format(response_model)
+        
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": prompt})
+        
+        self.metrics.record_structured_call(tool)
+        attempt = 0
+        while True:
+            try:
+                content = await self._cached_completion(
+                    messages, max_tokens, temperature, response_format, tool, bypass_cache
+                )
+                data, repaired = parse_structured(content, response_model)
+                if repaired:
+                    self.metrics.record_structured_fallback(tool, "malformed_json", "repaired")
+                return data
             
-        except Exception as e:
-            # Fallback to regular text generation
-            text_response = await self.generate_response(prompt, max_tokens, temperature)
-            return {"content": text_response}
+            except Exception as e:
+                kind = classify_failure(e)
+                if kind not in RETRYABLE_KINDS or attempt >= self.structured_max_retries:
+                    self.metrics.record_structured_fallback(tool, kind, "failed")
+                    raise StructuredOutputError(kind, str(e)) from e
+                
+                self.metrics.record_structured_fallback(tool, kind, "retried")
+                attempt += 1
+                bypass_cache = True
+                if kind == "unsupported_format":
+                    response_format = downgrade_response_format(response_format)
+                    if response_model is not None:
+                        schema = json.dumps(strict_json_schema(response_model))
+                        instruction = f"Respond only with a JSON object matching this JSON schema: {schema}"
+                        # One system message, with the tool's stable prefix still first
+                        messages = [
+                            {"role": "system", "content": f"{system_message}\n\n{instruction}" if system_message else instruction},
+                            {"role": "user", "content": prompt}
+                        ]
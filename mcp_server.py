@@ -1,25 +1,427 @@
 import os
+import math
 import asyncio
-from typing import Any, Dict, List
-from fastmcp import FastMCP
+import logging
+from contextlib import aclosing, asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel
+from fastmcp import FastMCP, Context
+from fastmcp.server.dependencies import get_http_headers
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
-from llm import LLMClient
-from auth import verify_bearer_token
-from image_processor import ImageProcessor
 
-# Load environment variables
+# Load environment variables before the modules below read their settings
 load_dotenv()
 
-# Initialize components
-llm = LLMClient()
-image_processor = ImageProcessor()
+from llm import LLMClient, count_upstream_calls
+from auth import TokenContextMiddleware, current_token, extract_bearer_token, hash_token, token_registry
+from image_processor import ImageWorkerPool, image_processor
+from cache import create_screenshot_cache
+from budget import create_input_budget, estimate_tokens
+from prompts import prompt_stats, render_prompt
+from ranking import create_candidate_ranker
+from speculation import create_prefetcher
+from conversation_memory import create_conversation_memory
+from prescreen import create_red_flag_screen, describe_hits, focused_instructions
+from plan_cache import create_plan_cache, date_plan_prompt, normalize_plan_request, plan_key
+from metrics import metrics, ToolMetricsMiddleware
+from admission import AdmissionMiddleware, create_admission_controller
+from structured import StructuredOutputError, parse_structured
+from schemas import (
+    BatchCompletion,
+    OpenerCandidates,
+    ReplyCandidates,
+    ScreenshotAnalysisResponse,
+    ConversationAnalysisResponse,
+    SCREENSHOT_ECHO_FIELDS,
+    json_schema_response_format
+)
+
+logger = logging.getLogger(__name__)
+
+# Initialize components (the OpenAI SDK, PIL and worker pools load on first use)
+llm = LLMClient(on_usage=token_registry.charge_current)
+image_pool = ImageWorkerPool(image_processor)
+screenshot_cache = create_screenshot_cache(shared=llm.cache)
+plan_cache = create_plan_cache(llm.cache)
+red_flag_screen = create_red_flag_screen()
+input_budget = create_input_budget()
+candidate_ranker = create_candidate_ranker()
+admission = create_admission_controller(metrics)
+
+# Pre-open the upstream connection in the background once the server starts
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() not in ("0", "false", "no")
+
+async def _warm_up():
+    """Load the OpenAI SDK and open a pooled connection before the first request"""
+    try:
+        timings = await llm.warm_up()
+        logger.info("Warm-up finished in %.2fs", timings["total_seconds"])
+    except Exception as e:
+        logger.warning("Warm-up failed: %s", e)
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[Dict[str, Any]]:
+    """Start the optional warm-up and release worker and connection pools on shutdown"""
+    warmup = asyncio.create_task(_warm_up()) if WARMUP_ON_START else None
+    try:
+        yield {}
+    finally:
+        if warmup is not None:
+            warmup.cancel()
+        prefetcher.cancel_all()
+        image_pool.shutdown()
+        await llm.aclose()
 
 # Initialize FastMCP server
-mcp = FastMCP("AI Wingman MCP")
+mcp = FastMCP("AI Wingman MCP", lifespan=lifespan)
+mcp.add_middleware(ToolMetricsMiddleware(metrics))
+
+# Queue tool calls per class and shed them under overload (after metrics, so
+# rejected calls are still counted)
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() not in ("0", "false", "no")
+if ADMISSION_ENABLED:
+    mcp.add_middleware(AdmissionMiddleware(admission))
+
+# Opt-in: after a screenshot analysis, generate the likely follow-up (openers,
+# a reply) in the background for the caller's next call; never while calls queue
+SPECULATIVE_ENABLED = os.getenv("SPECULATIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+prefetcher = create_prefetcher(
+    busy=lambda: ADMISSION_ENABLED and any(queue.queued for queue in admission.queues.values()),
+    metrics=metrics
+)
+
+# Messages and a rolling summary of each session's conversation screenshots
+CONVERSATION_MEMORY_ENABLED = os.getenv("CONVERSATION_MEMORY_ENABLED", "true").lower() not in ("0", "false", "no")
+conversation_memory = create_conversation_memory(metrics=metrics)
+mcp.add_middleware(TokenContextMiddleware())
+
+# Component stats exported as gauges on /metrics
+metrics.register_collector("response_cache", llm.cache_stats)
+metrics.register_collector("governor", llm.governor.stats)
+metrics.register_collector("http_pool", llm.http_stats)
+metrics.register_collector("routing", llm.route_stats)
+metrics.register_collector("image_pool", image_pool.stats)
+metrics.register_collector("screenshot_cache", screenshot_cache.stats)
+metrics.register_collector("plan_cache", plan_cache.stats)
+metrics.register_collector("admission", admission.stats)
+metrics.register_collector("auth", token_registry.stats)
+metrics.register_collector("input_budget", input_budget.stats)
+metrics.register_collector("prompts", prompt_stats)
+metrics.register_collector("speculation", prefetcher.stats)
+metrics.register_collector("conversation_memory", conversation_memory.stats)
 
 # Bearer token for authentication
 BEARER_TOKEN = os.getenv("MCP_BEARER_TOKEN", "puch2024")
 
+# Stream long-form tool output to clients as progress notifications
+STREAMING_ENABLED = os.getenv("STREAMING_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Output budget for structured screenshot analyses (openers/replies included)
+SCREENSHOT_MAX_TOKENS = int(os.getenv("SCREENSHOT_MAX_TOKENS", 1500))
+
+# Batch tools: items per call, concurrent upstream requests per call, and how
+# many short items may share a single structured request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 50))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", 5))
+BATCH_PACK_MAX_CHARS = int(os.getenv("BATCH_PACK_MAX_CHARS", 500))
+
+# Date plans are served from the stale-while-revalidate plan cache; variants
+# are generated a little hotter so the pool per key isn't near-identical
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+DATE_PLAN_MAX_TOKENS = 500
+DATE_PLAN_TEMPERATURE = 0.9 if PLAN_CACHE_ENABLED else 0.7
+
+# opener and reply ask for extra candidates in one structured request, so the
+# local ranker can drop near-duplicates and over-long ones and still return count
+CANDIDATE_OVERSAMPLE = float(os.getenv("CANDIDATE_OVERSAMPLE", 2))
+CANDIDATE_MAX = int(os.getenv("CANDIDATE_MAX", 10))
+CANDIDATE_MAX_TOKENS = int(os.getenv("CANDIDATE_MAX_TOKENS", 120))
+
+def _fit_inputs(tool: str, **fields: str) -> Dict[str, str]:
+    """Truncate a tool's free-text fields to its input token budget before they go into a prompt"""
+    fitted, usage = input_budget.fit(tool, **fields)
+    metrics.record_input_tokens(tool, usage["original_tokens"], usage["sent_tokens"], usage["truncated"])
+    return fitted
+
+def _candidates_requested(count: int) -> int:
+    """Candidates to ask the model for so count are left after ranking"""
+    return min(max(count, math.ceil(count * CANDIDATE_OVERSAMPLE)), CANDIDATE_MAX)
+
+def _session_key() -> str:
+    """Caller a speculation belongs to: the MCP session if the transport has one, else the bearer token"""
+    # Stateless HTTP has no session id, so fall back to the token quotas are charged to
+    session = get_http_headers(include_all=True).get("mcp-session-id")
+    if session:
+        return session
+    token = current_token.get()
+    # No token outside HTTP: stdio serves a single client
+    return hash_token(token) if token else "local"
+
+def _conversation_key(conversation_id: str) -> Optional[str]:
+    """Memory key of a conversation; None unless the caller names it or the transport has an MCP session"""
+    # A bearer token alone may be shared by many users and chats
+    if conversation_id:
+        return f"{_session_key()}|{conversation_id}"
+    session = get_http_headers(include_all=True).get("mcp-session-id")
+    return f"{session}|" if session else None
+
+def _speculate(tool: str, text: str, params: Dict[str, Any], run: Callable[[], Any]):
+    """Start a follow-up tool's work for this caller before it is called"""
+    if not SPECULATIVE_ENABLED:
+        return
+    cost = estimate_tokens(text) + _candidates_requested(params["count"]) * CANDIDATE_MAX_TOKENS
+    prefetcher.start(_session_key(), tool, text, params, cost, run)
+
+async def _ranked_candidates(
+    tool: str,
+    response_model: Type[BaseModel],
+    list_key: str,
+    text_key: str,
+    context: str,
+    app: str,
+    count: int,
+    temperature: float,
+    fresh: bool = False,
+    **values: Any
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Generate oversampled candidates in one structured request and keep the best distinct ones"""
+    requested = _candidates_requested(count)
+    system_message, prompt = render_prompt(
+        f"{tool}_candidates", count=requested, max_chars=candidate_ranker.limit_for(app), **values
+    )
+    generated = await llm.generate_structured_response(
+        prompt,
+        response_model=response_model,
+        max_tokens=CANDIDATE_MAX_TOKENS * requested,
+        temperature=temperature,
+        tool=tool,
+        bypass_cache=fresh,
+        system_message=system_message
+    )
+    
+    selected, counts = candidate_ranker.rank(generated[list_key], text_key, context, app, count)
+    metrics.record_candidates(tool, counts)
+    return selected, counts
+
+async def _collect_stream(
+    ctx: Context,
+    chunks: AsyncIterator[str],
+    max_tokens: int
+) -> str:
+    """Forward streamed chunks to the client as progress notifications and return the full text"""
+    parts = []
+    async with aclosing(chunks):
+        async for delta in chunks:
+            parts.append(delta)
+            await ctx.report_progress(progress=len(parts), total=max_tokens, message=delta)
+    return "".join(parts).strip()
+
+async def _generate_long_form(
+    ctx: Optional[Context],
+    prompt: str,
+    max_tokens: int,
+    temperature: float,
+    tool: str,
+    fresh: bool = False,
+    system_message: Optional[str] = None
+) -> str:
+    """Generate text, streaming partial output when the client can receive it"""
+    if ctx is None or not STREAMING_ENABLED:
+        return await llm.generate_response(
+            prompt, max_tokens=max_tokens, temperature=temperature, system_message=system_message,
+            tool=tool, bypass_cache=fresh
+        )
+    
+    return await _collect_stream(
+        ctx,
+        llm.stream_response(
+            prompt, max_tokens=max_tokens, temperature=temperature, system_message=system_message,
+            tool=tool, bypass_cache=fresh
+        ),
+        max_tokens
+    )
+
+async def _analyze_screenshot(
+    prepared: Dict[str, Any],
+    prompt: str,
+    response_model: Type[BaseModel],
+    cache_group: str,
+    fresh: bool = False,
+    ctx: Optional[Context] = None,
+    tool: Optional[str] = None,
+    system_message: Optional[str] = None
+) -> Dict[str, Any]:
+    """Run a structured vision analysis, reusing a cached one for near-duplicate screenshots"""
+    phash = prepared["phash"]
+    prepared["metadata"]["phash"] = f"{phash:064x}"
+    
+    if not fresh:
+        cached = screenshot_cache.lookup(phash, cache_group)
+        if cached is not None:
+            prepared["metadata"]["cache_hit"] = True
+            prepared["metadata"]["hash_distance"] = cached["distance"]
+            return dict(cached["value"])
+    
+    response_format = json_schema_response_format(response_model, exclude=SCREENSHOT_ECHO_FIELDS)
+    
+    if ctx is not None and STREAMING_ENABLED:
+        content = await _collect_stream(
+            ctx,
+            llm.stream_image_analysis(
+                prepared["image_data"],
+                prompt,
+                max_tokens=SCREENSHOT_MAX_TOKENS,
+                mime_type=prepared["mime_type"],
+                detail=prepared["detail"],
+                tool=tool,
+                response_format=response_format,
+                system_message=system_message
+            ),
+            SCREENSHOT_MAX_TOKENS
+        )
+    else:
+        content = await llm.analyze_image(
+            prepared["image_data"],
+            prompt,
+            max_tokens=SCREENSHOT_MAX_TOKENS,
+            mime_type=prepared["mime_type"],
+            detail=prepared["detail"],
+            tool=tool,
+            response_format=response_format,
+            system_message=system_message
+        )
+    
+    # Vision calls are too expensive to retry; repair what came back instead
+    metrics.record_structured_call(tool)
+    try:
+        analysis, repaired = parse_structured(content, response_model, exclude=SCREENSHOT_ECHO_FIELDS)
+    except StructuredOutputError as e:
+        metrics.record_structured_fallback(tool, e.kind, "failed")
+        raise
+    if repaired:
+        metrics.record_structured_fallback(tool, "malformed_json", "repaired")
+    
+    screenshot_cache.add(phash, cache_group, analysis)
+    prepared["metadata"]["cache_hit"] = False
+    return dict(analysis)
+
+def _pack_batch(items: List[str]) -> List[List[int]]:
+    """Group item indexes so short items share a request and long ones go alone"""
+    groups = []
+    pack = []
+    for index, item in enumerate(items):
+        if BATCH_PACK_SIZE <= 1 or len(item) > BATCH_PACK_MAX_CHARS:
+            groups.append([index])
+            continue
+        
+        pack.append(index)
+        if len(pack) == BATCH_PACK_SIZE:
+            groups.append(pack)
+            pack = []
+    
+    if pack:
+        groups.append(pack)
+    return groups
+
+async def _run_batch(
+    items: List[str],
+    single_prompt: Callable[[str], Tuple[str, str]],
+    packed_prompt: Callable[[str], Tuple[str, str]],
+    build_result: Callable[[str, str], Dict[str, Any]],
+    tool: str,
+    field: str,
+    max_tokens: int,
+    temperature: float,
+    fresh: bool = False,
+    ctx: Optional[Context] = None
+) -> Dict[str, Any]:
+    """Run a tool over many items with bounded fan-out, returning per-item results in input order"""
+    if not items:
+        raise ValueError("No items provided")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {BATCH_MAX_ITEMS} items per batch")
+    
+    # Prompts get budgeted copies; results still echo what was sent in
+    sent = [_fit_inputs(tool, **{field: item})[field] for item in items]
+    results: List[Dict[str, Any]] = [{"index": index} for index in range(len(items))]
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    done = 0
+    
+    async def finish(index: int, content: Optional[str] = None, error: Optional[str] = None):
+        nonlocal done
+        if error is None:
+            results[index]["result"] = build_result(content, items[index])
+        else:
+            results[index]["error"] = error
+        
+        done += 1
+        if ctx is not None:
+            await ctx.report_progress(progress=done, total=len(items))
+    
+    async def run_single(index: int):
+        try:
+            # Same tool as the single-item tool, so it shares its route (and, for
+            # red_flag_check, its prompt and cache entries)
+            system_message, prompt = single_prompt(sent[index])
+            content = await llm.generate_response(
+                prompt, max_tokens=max_tokens, temperature=temperature, system_message=system_message,
+                tool=tool, bypass_cache=fresh
+            )
+        except Exception as e:
+            await finish(index, error=str(e))
+            return
+        await finish(index, content)
+    
+    async def run_packed(group: List[int]):
+        system_message, prompt = packed_prompt("\n\n".join(f"[{index}] {sent[index]}" for index in group))
+        
+        try:
+            packed = await llm.generate_structured_response(
+                prompt,
+                response_model=BatchCompletion,
+                system_message=system_message,
+                max_tokens=max_tokens * len(group),
+                temperature=temperature,
+                tool=f"batch_{tool}",
+                bypass_cache=fresh
+            )
+        except Exception as e:
+            for index in group:
+                await finish(index, error=str(e))
+            return
+        
+        contents = {item["index"]: item["content"] for item in packed["results"]}
+        for index in group:
+            if index in contents:
+                await finish(index, contents[index].strip())
+            else:
+                # The model skipped this item; ask for it on its own
+                await run_single(index)
+    
+    async def run_group(group: List[int]):
+        async with semaphore:
+            if len(group) == 1:
+                await run_single(group[0])
+            else:
+                await run_packed(group)
+    
+    # Only requests that miss the response cache are upstream calls
+    with count_upstream_calls() as upstream_calls:
+        await asyncio.gather(*[run_group(group) for group in _pack_batch(sent)])
+    
+    failed = sum(1 for result in results if "error" in result)
+    return {
+        "results": results,
+        "count": len(items),
+        "succeeded": len(items) - failed,
+        "failed": failed,
+        "upstream_calls": upstream_calls[0]
+    }
+
 @mcp.tool()
 async def validate() -> str:
     """Required by Puch AI - returns phone number in country_code+number format"""
@@ -31,17 +433,21 @@ async def generate_bio(
     profile_text: str,
     tone: str = "confident",
     length: str = "medium",
-    app: str = "tinder"
+    app: str = "tinder",
+    fresh: bool = False,
+    ctx: Context = None
 ) -> Dict[str, Any]:
     """Generate improved dating app bios"""
     try:
-        prompt = f"""You are an expert dating coach specializing in creating compelling dating app bios. 
-        Create a {tone} bio that's {length} length for {app}.
-        Make it authentic, engaging, and conversation-starting. Include personality traits, interests, and a subtle call-to-action.
+        inputs = _fit_inputs("generate_bio", profile_text=profile_text)
+        system_message, prompt = render_prompt(
+            "generate_bio", tone=tone, length=length, app=app, profile_text=inputs["profile_text"]
+        )
         
-        Create a bio based on: {profile_text}"""
-        
-        bio = await llm.generate_response(prompt, max_tokens=300, temperature=0.7)
+        bio = await _generate_long_form(
+            ctx, prompt, max_tokens=300, temperature=0.7, tool="generate_bio", fresh=fresh,
+            system_message=system_message
+        )
         
         return {
             "improved_bio": bio,
@@ -59,59 +465,122 @@ async def generate_bio(
     except Exception as e:
         return {"error": f"Bio generation failed: {str(e)}"}
 
+def _opener_prompt(their_profile_text: str, tone: str, count: int) -> Tuple[str, str]:
+    return render_prompt("opener", count=count, tone=tone, profile_text=their_profile_text)
+
+def _opener_result(content: str, tone: str, count: int) -> Dict[str, Any]:
+    # Free text from a packed request; "openers" is kept for opener's ranked list
+    return {
+        "openers_text": content,
+        "tone": tone,
+        "count": count,
+        "strategy": "Personalized based on profile interests and details"
+    }
+
+async def _generate_openers(
+    their_profile_text: str,
+    tone: str,
+    count: int,
+    app: str,
+    fresh: bool = False
+) -> Dict[str, Any]:
+    inputs = _fit_inputs("opener", their_profile_text=their_profile_text)
+    openers, counts = await _ranked_candidates(
+        "opener", OpenerCandidates, "openers", "text", inputs["their_profile_text"], app, count,
+        temperature=0.8, fresh=fresh, tone=tone, profile_text=inputs["their_profile_text"]
+    )
+    if not openers:
+        raise ValueError("No usable opener candidates")
+    
+    return {
+        "openers": openers,
+        "tone": tone,
+        "count": len(openers),
+        "app": app,
+        "strategy": "Personalized based on profile interests and details",
+        "candidates": counts
+    }
+
 @mcp.tool()
 async def opener(
     their_profile_text: str,
     tone: str = "friendly",
-    count: int = 3
+    count: int = 3,
+    app: str = "tinder",
+    fresh: bool = False
 ) -> Dict[str, Any]:
     """Generate conversation openers"""
     try:
-        prompt = f"""You are a dating expert who creates personalized, engaging conversation starters.
-        Generate {count} openers with a {tone} tone.
-        Make them specific to the person's profile, avoid generic messages, and include follow-up suggestions.
-        
-        Profile info: {their_profile_text}"""
+        count = max(1, min(count, CANDIDATE_MAX))
+        if SPECULATIVE_ENABLED and not fresh:
+            prefetched = await prefetcher.claim(
+                _session_key(), "opener", their_profile_text, {"tone": tone, "count": count, "app": app}
+            )
+            if prefetched is not None:
+                return {**prefetched, "prefetched": True}
         
-        content = await llm.generate_response(prompt, max_tokens=400, temperature=0.8)
-        
-        return {
-            "openers": content,
-            "tone": tone,
-            "count": count,
-            "strategy": "Personalized based on profile interests and details"
-        }
+        return await _generate_openers(their_profile_text, tone, count, app, fresh)
         
     except Exception as e:
         return {"error": f"Opener generation failed: {str(e)}"}
 
+def _reply_prompt(partner_msg: str, intent: str, tone: str) -> Tuple[str, str]:
+    return render_prompt("reply", tone=tone, intent=intent, partner_msg=partner_msg)
+
+def _reply_result(reply_text: str, intent: str, tone: str) -> Dict[str, Any]:
+    return {
+        "suggested_reply": reply_text,
+        "tone": tone,
+        "intent": intent,
+        "conversation_tips": [
+            "Ask open-ended questions",
+            "Show genuine interest",
+            "Share something about yourself",
+            "Keep the energy positive"
+        ]
+    }
+
+async def _generate_replies(
+    partner_msg: str,
+    intent: str,
+    tone: str,
+    count: int,
+    app: str,
+    fresh: bool = False
+) -> Dict[str, Any]:
+    inputs = _fit_inputs("reply", partner_msg=partner_msg)
+    replies, counts = await _ranked_candidates(
+        "reply", ReplyCandidates, "replies", "reply", inputs["partner_msg"], app, count,
+        temperature=0.7, fresh=fresh, tone=tone, intent=intent, partner_msg=inputs["partner_msg"]
+    )
+    if not replies:
+        raise ValueError("No usable reply candidates")
+    
+    result = _reply_result(replies[0]["reply"], intent, tone)
+    result.update({"replies": replies, "app": app, "candidates": counts})
+    return result
+
 @mcp.tool()
 async def reply(
     partner_msg: str,
     intent: str = "continue",
-    tone: str = "friendly"
+    tone: str = "friendly",
+    count: int = 3,
+    app: str = "tinder",
+    fresh: bool = False
 ) -> Dict[str, Any]:
     """Generate conversation replies"""
     try:
-        prompt = f"""You are a dating conversation expert. Generate thoughtful replies with a {tone} tone.
-        Intent: {intent}. 
-        Make responses engaging, authentic, and keep the conversation flowing naturally.
+        count = max(1, min(count, CANDIDATE_MAX))
+        if SPECULATIVE_ENABLED and not fresh:
+            prefetched = await prefetcher.claim(
+                _session_key(), "reply", partner_msg,
+                {"intent": intent, "tone": tone, "count": count, "app": app}
+            )
+            if prefetched is not None:
+                return {**prefetched, "prefetched": True}
         
-        They said: {partner_msg}"""
-        
-        reply_text = await llm.generate_response(prompt, max_tokens=200, temperature=0.7)
-        
-        return {
-            "suggested_reply": reply_text,
-            "tone": tone,
-            "intent": intent,
-            "conversation_tips": [
-                "Ask open-ended questions",
-                "Show genuine interest",
-                "Share something about yourself",
-                "Keep the energy positive"
-            ]
-        }
+        return await _generate_replies(partner_msg, intent, tone, count, app, fresh)
         
     except Exception as e:
         return {"error": f"Reply generation failed: {str(e)}"}
@@ -121,18 +590,34 @@ async def date_plan(
     city: str,
     budget: str = "medium",
     interests: str = "",
-    vibe: str = "casual"
+    vibe: str = "casual",
+    fresh: bool = False,
+    ctx: Context = None
 ) -> Dict[str, Any]:
     """Generate date plans"""
     try:
-        prompt = f"""You are a local dating expert who creates perfect first date plans.
-        Budget: {budget}
-        Vibe: {vibe}
-        Create specific, actionable date ideas with venues, activities, and timing.
-        
-        Plan a date in {city} for people interested in: {interests}"""
-        
-        plan = await llm.generate_response(prompt, max_tokens=500, temperature=0.7)
+        inputs = _fit_inputs("date_plan", city=city, interests=interests, vibe=vibe)
+        request = normalize_plan_request(inputs["city"], budget, inputs["interests"], inputs["vibe"])
+        system_message, prompt = date_plan_prompt(request)
+        key = plan_key(request)
+        
+        cached = None
+        if PLAN_CACHE_ENABLED and not fresh:
+            cached = plan_cache.lookup(key)
+        
+        if cached is not None:
+            plan = cached["plan"]
+            plan_cache.revalidate(key, cached, lambda: llm.generate_response(
+                prompt, max_tokens=DATE_PLAN_MAX_TOKENS, temperature=DATE_PLAN_TEMPERATURE,
+                system_message=system_message, tool="date_plan", bypass_cache=True
+            ))
+        else:
+            plan = await _generate_long_form(
+                ctx, prompt, max_tokens=DATE_PLAN_MAX_TOKENS, temperature=DATE_PLAN_TEMPERATURE,
+                tool="date_plan", fresh=fresh, system_message=system_message
+            )
+            if PLAN_CACHE_ENABLED and plan:
+                plan_cache.add(key, plan)
         
         return {
             "date_plan": plan,
@@ -140,6 +625,7 @@ async def date_plan(
             "budget": budget,
             "vibe": vibe,
             "interests": interests,
+            "cached": cached is not None,
             "success_tips": [
                 "Arrive on time",
                 "Be present and engaged",
@@ -151,29 +637,48 @@ async def date_plan(
     except Exception as e:
         return {"error": f"Date plan generation failed: {str(e)}"}
 
+def _red_flag_prompt(profile_text: str, focus: str = "") -> Tuple[str, str]:
+    # The pre-screen's focus varies per text, so it goes in the user message
+    return render_prompt("red_flag_check", focus=f"{focus}\n\n" if focus else "", profile_text=profile_text)
+
+def _red_flag_result(analysis: str, profile_text: str) -> Dict[str, Any]:
+    return {
+        "safety_analysis": analysis,
+        "profile_text": profile_text,
+        "general_safety_tips": [
+            "Meet in public places",
+            "Tell friends about your plans",
+            "Trust your instincts",
+            "Video call before meeting",
+            "Take your time getting to know them"
+        ]
+    }
+
+async def _screened_red_flag_check(profile_text: str, screen: Dict[str, Any], fresh: bool = False) -> Dict[str, Any]:
+    """Red-flag result for a pre-screened text: local for conclusive hits, else a (focused) LLM call"""
+    if screen["decision"] == "skip":
+        analysis = describe_hits(screen)
+    else:
+        focus = focused_instructions(screen) if screen["decision"] == "focused" else ""
+        inputs = _fit_inputs("red_flag_check", profile_text=profile_text)
+        system_message, prompt = _red_flag_prompt(inputs["profile_text"], focus)
+        analysis = await llm.generate_response(
+            prompt, max_tokens=400, temperature=0.3, system_message=system_message,
+            tool="red_flag_check", bypass_cache=fresh
+        )
+    
+    result = _red_flag_result(analysis, profile_text)
+    result["prescreen"] = {key: screen[key] for key in ("score", "decision", "categories", "hits")}
+    return result
+
 @mcp.tool()
-async def red_flag_check(profile_text: str) -> Dict[str, Any]:
+async def red_flag_check(profile_text: str, fresh: bool = False) -> Dict[str, Any]:
     """Check for red flags"""
     try:
-        prompt = f"""You are a dating safety expert. Analyze profiles/messages for potential red flags.
-        Be thorough but balanced - point out genuine concerns while not being overly paranoid.
-        Provide safety advice and trust-your-gut guidance.
-        
-        Analyze this for red flags: {profile_text}"""
-        
-        analysis = await llm.generate_response(prompt, max_tokens=400, temperature=0.3)
-        
-        return {
-            "safety_analysis": analysis,
-            "profile_text": profile_text,
-            "general_safety_tips": [
-                "Meet in public places",
-                "Tell friends about your plans",
-                "Trust your instincts",
-                "Video call before meeting",
-                "Take your time getting to know them"
-            ]
-        }
+        # Obvious scams are answered from the local pre-screen without an LLM call
+        screen = red_flag_screen.scan(profile_text)
+        metrics.record_prescreen("red_flag_check", screen["decision"])
+        return await _screened_red_flag_check(profile_text, screen, fresh)
         
     except Exception as e:
         return {"error": f"Safety check failed: {str(e)}"}
@@ -181,18 +686,19 @@ async def red_flag_check(profile_text: str) -> Dict[str, Any]:
 @mcp.tool()
 async def profile_roast(
     bio: str,
-    images_desc: str = ""
+    images_desc: str = "",
+    fresh: bool = False,
+    ctx: Context = None
 ) -> Dict[str, Any]:
     """Profile roast and feedback"""
     try:
-        prompt = f"""You are a witty dating coach who gives brutally honest but constructive feedback.
-        Roast the profile with humor while providing actionable improvement suggestions.
-        Be funny but helpful - the goal is to make them laugh while helping them improve.
+        inputs = _fit_inputs("profile_roast", bio=bio, images_desc=images_desc)
+        system_message, prompt = render_prompt("profile_roast", bio=inputs["bio"], images_desc=inputs["images_desc"])
         
-        Bio: {bio}
-        Images described: {images_desc}"""
-        
-        roast = await llm.generate_response(prompt, max_tokens=400, temperature=0.8)
+        roast = await _generate_long_form(
+            ctx, prompt, max_tokens=400, temperature=0.8, tool="profile_roast", fresh=fresh,
+            system_message=system_message
+        )
         
         return {
             "roast": roast,
@@ -209,56 +715,150 @@ async def profile_roast(
     except Exception as e:
         return {"error": f"Profile roast failed: {str(e)}"}
 
+@mcp.tool()
+async def batch_opener(
+    profiles: List[str],
+    tone: str = "friendly",
+    count: int = 3,
+    fresh: bool = False,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Generate conversation openers for many profiles at once (as text in openers_text, not ranked like opener)"""
+    try:
+        return await _run_batch(
+            profiles,
+            lambda profile_text: _opener_prompt(profile_text, tone, count),
+            lambda listed: render_prompt("batch_opener", count=count, tone=tone, items=listed),
+            lambda content, profile_text: _opener_result(content, tone, count),
+            tool="opener", field="their_profile_text", max_tokens=400, temperature=0.8, fresh=fresh, ctx=ctx
+        )
+        
+    except Exception as e:
+        return {"error": f"Batch opener generation failed: {str(e)}"}
+
+@mcp.tool()
+async def batch_reply(
+    messages: List[str],
+    intent: str = "continue",
+    tone: str = "friendly",
+    fresh: bool = False,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Generate replies for many messages at once"""
+    try:
+        return await _run_batch(
+            messages,
+            lambda partner_msg: _reply_prompt(partner_msg, intent, tone),
+            lambda listed: render_prompt("batch_reply", tone=tone, intent=intent, items=listed),
+            lambda content, partner_msg: _reply_result(content, intent, tone),
+            tool="reply", field="partner_msg", max_tokens=200, temperature=0.7, fresh=fresh, ctx=ctx
+        )
+        
+    except Exception as e:
+        return {"error": f"Batch reply generation failed: {str(e)}"}
+
+@mcp.tool()
+async def batch_red_flag_check(
+    profile_texts: List[str],
+    fresh: bool = False,
+    ctx: Context = None
+) -> Dict[str, Any]:
+    """Check many profiles or messages for red flags at once"""
+    try:
+        if not profile_texts:
+            raise ValueError("No items provided")
+        if len(profile_texts) > BATCH_MAX_ITEMS:
+            raise ValueError(f"At most {BATCH_MAX_ITEMS} items per batch")
+        
+        # Pre-screened like red_flag_check: conclusive hits are answered locally and
+        # flagged texts get red_flag_check's focused call; only clean texts are packed
+        screens = [red_flag_screen.scan(profile_text) for profile_text in profile_texts]
+        for screen in screens:
+            metrics.record_prescreen("batch_red_flag_check", screen["decision"])
+        general = [index for index, screen in enumerate(screens) if screen["decision"] == "general"]
+        screened = [index for index, screen in enumerate(screens) if screen["decision"] != "general"]
+        
+        batch = {"results": []}
+        if general:
+            batch = await _run_batch(
+                [profile_texts[index] for index in general],
+                _red_flag_prompt,
+                lambda listed: render_prompt("batch_red_flag_check", items=listed),
+                _red_flag_result,
+                tool="red_flag_check", field="profile_text", max_tokens=400, temperature=0.3, fresh=fresh, ctx=ctx
+            )
+        
+        results: List[Dict[str, Any]] = [{"index": index} for index in range(len(profile_texts))]
+        for index, item in zip(general, batch["results"]):
+            if "result" in item:
+                item["result"]["prescreen"] = {key: screens[index][key] for key in ("score", "decision", "categories", "hits")}
+            results[index].update({key: value for key, value in item.items() if key != "index"})
+        
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        
+        async def check(index: int):
+            async with semaphore:
+                try:
+                    results[index]["result"] = await _screened_red_flag_check(profile_texts[index], screens[index], fresh)
+                except Exception as e:
+                    results[index]["error"] = str(e)
+        
+        with count_upstream_calls() as upstream_calls:
+            await asyncio.gather(*[check(index) for index in screened])
+        
+        failed = sum(1 for result in results if "error" in result)
+        return {
+            "results": results,
+            "count": len(profile_texts),
+            "succeeded": len(profile_texts) - failed,
+            "failed": failed,
+            "upstream_calls": batch.get("upstream_calls", 0) + upstream_calls[0],
+            "prescreen_skipped": sum(1 for screen in screens if screen["decision"] == "skip")
+        }
+        
+    except Exception as e:
+        return {"error": f"Batch safety check failed: {str(e)}"}
+
 @mcp.tool()
 async def analyze_profile_screenshot(
     image_data: str,
     analysis_type: str = "profile",
-    context: str = ""
+    context: str = "",
+    fresh: bool = False,
+    ctx: Context = None
 ) -> Dict[str, Any]:
     """Analyze dating profile screenshots using AI Vision"""
     try:
         if not image_data:
             return {"error": "No image data provided"}
         
-        # Decode and validate image
-        image = image_processor.decode_base64_image(image_data)
+        inputs = _fit_inputs("analyze_profile_screenshot", context=context)
         
-        prompt = f"""Analyze this dating profile screenshot and provide detailed insights:
-
-1. Extract all visible text (name, age, bio, interests, etc.)
-2. Identify the person's interests, hobbies, and personality traits
-3. Note their education, work, location if visible
-4. Generate 3-5 personalized conversation openers based on their profile
-5. Identify any potential red flags or concerns
-6. Provide an overall analysis and dating strategy advice
-
-Context: {context}
-Analysis type: {analysis_type}"""
+        # Decode, validate, shrink and crop the image in the worker pool
+        prepared = await image_pool.prepare_for_vision(image_data)
+        
+        system_message, prompt = render_prompt(
+            "analyze_profile_screenshot", context=inputs["context"], analysis_type=analysis_type
+        )
+        
+        analysis = await _analyze_screenshot(
+            prepared, prompt, ScreenshotAnalysisResponse,
+            f"profile|{analysis_type}|{inputs['context']}", fresh,
+            ctx=ctx, tool="analyze_profile_screenshot", system_message=system_message
+        )
         
-        analysis_content = await llm.analyze_image(image_data, prompt)
+        # The usual next call asks for openers from the extracted text with the default arguments
+        profile_text = analysis.get("extracted_text", "")
+        _speculate(
+            "opener", profile_text, {"tone": "friendly", "count": 3, "app": "tinder"},
+            lambda: _generate_openers(profile_text, "friendly", 3, "tinder")
+        )
         
         return {
-            "extracted_text": "Text extraction handled by AI Vision API",
-            "profile_data": {
-                "name": None,
-                "age": None,
-                "bio": None,
-                "interests": [],
-                "education": None,
-                "work": None,
-                "location": None
-            },
-            "suggested_openers": [
-                {
-                    "text": "Personalized opener based on AI Vision analysis",
-                    "follow_ups": ["Follow up suggestion 1", "Follow up suggestion 2"],
-                    "rationale": "Based on profile analysis"
-                }
-            ],
-            "red_flags": [],
-            "analysis_summary": analysis_content,
+            **analysis,
             "context": context,
-            "analysis_type": analysis_type
+            "analysis_type": analysis_type,
+            "image_metadata": prepared["metadata"]
         }
         
     except Exception as e:
@@ -268,48 +868,77 @@ Analysis type: {analysis_type}"""
             "analysis_summary": "Unable to analyze screenshot. Please try uploading a clearer image."
         }
 
+def _bubble_layout(bubbles: List[Dict[str, Any]]) -> str:
+    """Prompt note on who sent each chat bubble found in the screenshot (right-aligned ones are mine)"""
+    roles = [bubble["role"] for bubble in bubbles if bubble["role"]]
+    if not roles:
+        return ""
+    return "\nBubble senders, top to bottom (right-aligned bubbles are mine): " + ", ".join(roles)
+
 @mcp.tool()
 async def analyze_conversation_screenshot(
     image_data: str,
     my_role: str = "sender",
-    context: str = ""
+    context: str = "",
+    conversation_id: str = "",
+    fresh: bool = False,
+    ctx: Context = None
 ) -> Dict[str, Any]:
     """Analyze conversation screenshots and suggest replies"""
     try:
         if not image_data:
             return {"error": "No image data provided"}
         
-        # Decode and validate image
-        image = image_processor.decode_base64_image(image_data)
-        
-        prompt = f"""Analyze this dating conversation screenshot and provide strategic advice:
-
-1. Extract all visible messages and identify who said what
-2. Analyze the conversation tone, flow, and current momentum
-3. Suggest 3-5 thoughtful reply options with different vibes (playful, serious, flirty, etc.)
-4. Provide conversation analysis and strategy advice
-5. Suggest next steps for the conversation
-
-My role in conversation: {my_role}
-Context: {context}"""
-        
-        analysis_content = await llm.analyze_image(image_data, prompt)
+        inputs = _fit_inputs("analyze_conversation_screenshot", context=context)
+        
+        # Decode, validate, shrink and crop the image to its chat bubbles in the worker pool
+        prepared = await image_pool.prepare_for_vision(image_data, segment=True)
+        
+        # Earlier screenshots of this conversation: only what follows them needs reading
+        memory_key = _conversation_key(conversation_id) if CONVERSATION_MEMORY_ENABLED else None
+        memory, memory_digest = conversation_memory.prompt_context(memory_key) if memory_key is not None else ("", "")
+        
+        system_message, prompt = render_prompt(
+            "analyze_conversation_screenshot", my_role=my_role, context=inputs["context"],
+            layout=_bubble_layout(prepared["bubbles"]), memory=memory
+        )
+        
+        cache_group = f"conversation|{my_role}|{inputs['context']}"
+        analysis = await _analyze_screenshot(
+            prepared, prompt, ConversationAnalysisResponse,
+            f"{cache_group}|{memory_digest}" if memory_digest else cache_group, fresh,
+            ctx=ctx, tool="analyze_conversation_screenshot", system_message=system_message
+        )
+        
+        if memory_key is not None:
+            merged = conversation_memory.update(
+                memory_key, analysis.get("extracted_messages", []), analysis.get("conversation_summary", "")
+            )
+            analysis["extracted_messages"] = conversation_memory.messages(memory_key)
+            analysis["conversation_memory"] = {
+                "new_messages": len(merged["new"]),
+                "duplicate_messages": merged["duplicates"],
+                "known_messages": merged["known_messages"],
+                "compacted_messages": merged["compacted_messages"],
+                "screenshots": merged["screenshots"],
+                "reset": merged["reset"]
+            }
+        
+        # ... and after a conversation, for a reply to their last message
+        last_message = next(
+            (message["text"] for message in reversed(analysis.get("extracted_messages", [])) if message.get("sender") == "them"),
+            ""
+        )
+        _speculate(
+            "reply", last_message, {"intent": "continue", "tone": "friendly", "count": 3, "app": "tinder"},
+            lambda: _generate_replies(last_message, "continue", "friendly", 3, "tinder")
+        )
         
         return {
-            "extracted_messages": [],
-            "conversation_summary": analysis_content,
-            "suggested_replies": [
-                {
-                    "reply": "Contextual reply suggestion based on AI analysis",
-                    "vibe_level": "medium",
-                    "boundary_safe_variant": "Alternative safe version",
-                    "rationale": "Based on conversation flow analysis"
-                }
-            ],
-            "conversation_analysis": "Analysis of conversation tone and momentum based on AI Vision",
-            "next_step_advice": "Strategic advice for continuing the conversation",
+            **analysis,
             "my_role": my_role,
-            "context": context
+            "context": context,
+            "image_metadata": prepared["metadata"]
         }
         
     except Exception as e:
@@ -322,22 +951,48 @@ Context: {context}"""
             "next_step_advice": "Please try uploading a clearer image."
         }
 
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request) -> PlainTextResponse:
+    """Prometheus metrics (exempt from bearer auth)"""
+    return PlainTextResponse(
+        metrics.render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
+
+# Paths served without a bearer token
+PUBLIC_PATHS = {"/health", "/metrics"}
+
 # Set up authentication middleware
-@mcp.middleware
 async def auth_middleware(request, call_next):
-    """Bearer token authentication middleware"""
-    if not verify_bearer_token(request):
-        # Allow unauthenticated access for MCP discovery endpoints
-        if request.url.path in ["/", "/mcp", "/health"]:
+    """Bearer token authentication, per-token rate limit and daily quota middleware"""
+    record = token_registry.lookup(extract_bearer_token(request.headers))
+    if record is None:
+        # Only monitoring is public; every tool call goes through /mcp and its limits
+        if request.url.path in PUBLIC_PATHS:
             return await call_next(request)
         
-        return {"error": "Unauthorized", "message": "Valid bearer token required"}
+        return JSONResponse(
+            {"error": "Unauthorized", "message": "Valid bearer token required"},
+            status_code=401
+        )
+    
+    allowed, reason, retry_after = record.check()
+    if not allowed:
+        metrics.record_auth_rejection(record.name, reason)
+        message = "Daily token quota exhausted" if reason == "daily_quota" else "Rate limit exceeded"
+        return JSONResponse(
+            {"error": "Too Many Requests", "message": message, "retry_after": retry_after},
+            status_code=429,
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        )
     
     return await call_next(request)
 
+# HTTP middleware passed to mcp.run()
+http_middleware = [Middleware(BaseHTTPMiddleware, dispatch=auth_middleware)]
+
 if __name__ == "__main__":
     # Run the MCP server
     port = int(os.getenv("PORT", 8000))
     print(f"Starting AI Wingman MCP Server on port {port}")
     print(f"Bearer token: {BEARER_TOKEN}")
-    asyncio.run(mcp.run(port=port, host="0.0.0.0"))
+    mcp.run(transport="http", port=port, host="0.0.0.0", middleware=http_middleware)
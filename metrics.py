@@ -0,0 +1,447 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Optional, Dict, Any, Callable, List, Tuple
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+
+# Latency histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+}
+
+def get_model_prices(model: str) -> Optional[Tuple[float, float, float]]:
+    """Prices for a model, matching dated snapshots by their longest known prefix"""
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return MODEL_PRICES[name]
+    return None
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of a completion"""
+    prices = get_model_prices(model)
+    if prices is None:
+        return 0.0
+    
+    input_price, cached_price, output_price = prices
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+def get_usage_counts(usage: Any) -> Dict[str, int]:
+    """Prompt, cached and completion token counts from an OpenAI usage object"""
+    if usage is None:
+        return {"prompt": 0, "cached": 0, "completion": 0}
+    
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt": getattr(usage, "prompt_tokens", 0) or 0,
+        "cached": (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+        "completion": getattr(usage, "completion_tokens", 0) or 0
+    }
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative on export, like Prometheus)"""
+    
+    __slots__ = ("buckets", "counts", "sum", "count")
+    
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given percentile"""
+        if self.count == 0:
+            return 0.0
+        
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99)
+        }
+
+def _labels(**labels: str) -> str:
+    """Format Prometheus labels with escaped values"""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+class MetricsRegistry:
+    """In-process metrics for tools and upstream LLM calls
+    
+    Recording is a few dict updates, cheap enough for every call. Read it in
+    process with ``snapshot()`` or over HTTP in Prometheus text format with
+    ``render_prometheus()``.
+    """
+    
+    def __init__(self):
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self.reset()
+    
+    def reset(self):
+        """Clear all recorded values (collectors stay registered)"""
+        self.tool_calls: Dict[str, int] = defaultdict(int)
+        self.tool_errors: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.tool_latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self.llm_calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.llm_errors: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.llm_latency: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.llm_tokens: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.llm_cost: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.llm_ttft: Dict[str, Histogram] = defaultdict(Histogram)
+        self.structured_calls: Dict[str, int] = defaultdict(int)
+        self.structured_fallbacks: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.route_requests: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.route_latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self.admission_requests: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.admission_wait: Dict[str, Histogram] = defaultdict(Histogram)
+        self.auth_rejections: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.prescreen_decisions: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.input_tokens: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.input_truncations: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.candidates: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.speculations: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.conversation_messages: Dict[str, int] = defaultdict(int)
+    
+    def register_collector(self, name: str, collect: Callable[[], Dict[str, Any]]):
+        """Export the numeric values of collect() as wingman_<name>_<key> gauges"""
+        self._collectors[name] = collect
+    
+    def record_tool_call(self, tool: str, seconds: float, error: Optional[str] = None):
+        """Record one MCP tool invocation"""
+        self.tool_calls[tool] += 1
+        self.tool_latency[tool].observe(seconds)
+        if error:
+            self.tool_errors[(tool, error)] += 1
+    
+    def record_llm_call(
+        self,
+        tool: Optional[str],
+        model: str,
+        seconds: float,
+        usage: Any = None,
+        error: Optional[str] = None
+    ):
+        """Record one upstream completion with its token usage and cost"""
+        tool = tool or "unknown"
+        key = (tool, model)
+        self.llm_calls[key] += 1
+        self.llm_latency[key].observe(seconds)
+        
+        if error:
+            self.llm_errors[(tool, model, error)] += 1
+            return
+        
+        counts = get_usage_counts(usage)
+        for kind, count in counts.items():
+            self.llm_tokens[(tool, model, kind)] += count
+        self.llm_cost[key] += estimate_cost(model, counts["prompt"], counts["cached"], counts["completion"])
+    
+    def record_ttft(self, tool: Optional[str], seconds: float):
+        """Record time to first token of a streamed completion"""
+        self.llm_ttft[tool or "unknown"].observe(seconds)
+    
+    def record_structured_call(self, tool: Optional[str]):
+        """Record one structured-output request"""
+        self.structured_calls[tool or "unknown"] += 1
+    
+    def record_structured_fallback(self, tool: Optional[str], reason: str, action: str):
+        """Record a structured-output fallback (action: repaired, retried or failed)"""
+        self.structured_fallbacks[(tool or "unknown", reason, action)] += 1
+    
+    def record_route(self, route: str, outcome: str, seconds: float):
+        """Record one routed request end to end (outcome: primary, degraded, fallback, hedge_won, hedge_lost, stream or failed)"""
+        self.route_requests[(route, outcome)] += 1
+        self.route_latency[route].observe(seconds)
+    
+    def record_admission(self, queue: str, outcome: str, waited: Optional[float]):
+        """Record an admission decision (admitted, or rejected as full, overloaded or timeout)"""
+        self.admission_requests[(queue, outcome)] += 1
+        if waited is not None:
+            self.admission_wait[queue].observe(waited)
+    
+    def record_auth_rejection(self, client: str, reason: str):
+        """Record a request refused by a per-token limit (rate_limit or daily_quota)"""
+        self.auth_rejections[(client, reason)] += 1
+    
+    def record_prescreen(self, tool: str, decision: str):
+        """Record a local pre-screen decision (skip, focused or general)"""
+        self.prescreen_decisions[(tool, decision)] += 1
+    
+    def record_input_tokens(self, tool: str, original: int, sent: int, truncated: List[str]):
+        """Record a tool's estimated input tokens before and after budgeting, and which fields were cut"""
+        self.input_tokens[(tool, "original")] += original
+        self.input_tokens[(tool, "sent")] += sent
+        for field in truncated:
+            self.input_truncations[(tool, field)] += 1
+    
+    def record_candidates(self, tool: str, counts: Dict[str, int]):
+        """Record a ranked candidate set (generated, too_long, duplicates, relaxed and returned counts)"""
+        for outcome, count in counts.items():
+            self.candidates[(tool, outcome)] += count
+    
+    def record_speculation(self, tool: str, outcome: str):
+        """Record a speculative prefetch event (started, hit, joined, miss, failed, expired, replaced, evicted, cancelled, skipped_busy or skipped_budget)"""
+        self.speculations[(tool, outcome)] += 1
+    
+    def record_conversation_messages(self, new: int, duplicates: int, compacted: int):
+        """Record a conversation screenshot merged into memory (new, duplicate and compacted message counts)"""
+        self.conversation_messages["new"] += new
+        self.conversation_messages["duplicate"] += duplicates
+        self.conversation_messages["compacted"] += compacted
+    
+    def cached_ratio(self, tool: str, model: str) -> float:
+        """Share of a tool's prompt tokens on a model served from the upstream prompt cache"""
+        prompt = self.llm_tokens.get((tool, model, "prompt"), 0)
+        return self.llm_tokens.get((tool, model, "cached"), 0) / prompt if prompt else 0.0
+    
+    def route_cost(self, route: str) -> float:
+        """Estimated spend of a route across all the models it called"""
+        return sum(cost for (tool, model), cost in self.llm_cost.items() if tool == route)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Nested dict of everything recorded so far"""
+        tools: Dict[str, Any] = {}
+        for tool, calls in self.tool_calls.items():
+            tools[tool] = {
+                "calls": calls,
+                "errors": {error: count for (name, error), count in self.tool_errors.items() if name == tool},
+                "latency": self.tool_latency[tool].snapshot()
+            }
+        
+        llm: Dict[str, Any] = {}
+        for (tool, model), calls in self.llm_calls.items():
+            llm.setdefault(tool, {})[model] = {
+                "calls": calls,
+                "errors": {
+                    error: count for (name, call_model, error), count in self.llm_errors.items()
+                    if name == tool and call_model == model
+                },
+                "tokens": {
+                    kind: count for (name, call_model, kind), count in self.llm_tokens.items()
+                    if name == tool and call_model == model
+                },
+                "cached_ratio": self.cached_ratio(tool, model),
+                "cost_usd": self.llm_cost[(tool, model)],
+                "latency": self.llm_latency[(tool, model)].snapshot()
+            }
+        
+        structured: Dict[str, Any] = {}
+        for tool, calls in self.structured_calls.items():
+            structured[tool] = {
+                "calls": calls,
+                "fallbacks": {
+                    f"{reason}:{action}": count for (name, reason, action), count in self.structured_fallbacks.items()
+                    if name == tool
+                }
+            }
+        
+        routes: Dict[str, Any] = {}
+        for route, histogram in self.route_latency.items():
+            routes[route] = {
+                "requests": {outcome: count for (name, outcome), count in self.route_requests.items() if name == route},
+                "cost_usd": self.route_cost(route),
+                "latency": histogram.snapshot()
+            }
+        
+        admission: Dict[str, Any] = {}
+        for (queue, outcome), count in self.admission_requests.items():
+            admission.setdefault(queue, {"requests": {}})["requests"][outcome] = count
+        for queue, histogram in self.admission_wait.items():
+            admission.setdefault(queue, {"requests": {}})["wait"] = histogram.snapshot()
+        
+        return {
+            "tools": tools,
+            "llm": llm,
+            "ttft": {tool: histogram.snapshot() for tool, histogram in self.llm_ttft.items()},
+            "structured": structured,
+            "routes": routes,
+            "admission": admission,
+            "input": {
+                "tokens": {f"{tool}:{kind}": count for (tool, kind), count in self.input_tokens.items()},
+                "truncations": {f"{tool}:{field}": count for (tool, field), count in self.input_truncations.items()}
+            },
+            "candidates": {f"{tool}:{outcome}": count for (tool, outcome), count in self.candidates.items()},
+            "speculation": {f"{tool}:{outcome}": count for (tool, outcome), count in self.speculations.items()},
+            "conversation_messages": dict(self.conversation_messages),
+            "prescreen": {f"{tool}:{decision}": count for (tool, decision), count in self.prescreen_decisions.items()},
+            "auth_rejections": {f"{client}:{reason}": count for (client, reason), count in self.auth_rejections.items()},
+            "collectors": {name: collect() for name, collect in self._collectors.items()}
+        }
+    
+    def _render_histogram(self, lines: list, name: str, histogram: Histogram, **labels: str):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=str(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP wingman_tool_calls_total MCP tool invocations",
+            "# TYPE wingman_tool_calls_total counter"
+        ]
+        for tool, calls in self.tool_calls.items():
+            lines.append(f"wingman_tool_calls_total{_labels(tool=tool)} {calls}")
+        
+        lines += ["# HELP wingman_tool_errors_total Failed MCP tool invocations", "# TYPE wingman_tool_errors_total counter"]
+        for (tool, error), count in self.tool_errors.items():
+            lines.append(f"wingman_tool_errors_total{_labels(tool=tool, error=error)} {count}")
+        
+        lines += ["# HELP wingman_tool_latency_seconds MCP tool latency", "# TYPE wingman_tool_latency_seconds histogram"]
+        for tool, histogram in self.tool_latency.items():
+            self._render_histogram(lines, "wingman_tool_latency_seconds", histogram, tool=tool)
+        
+        lines += ["# HELP wingman_llm_calls_total Upstream completions", "# TYPE wingman_llm_calls_total counter"]
+        for (tool, model), calls in self.llm_calls.items():
+            lines.append(f"wingman_llm_calls_total{_labels(tool=tool, model=model)} {calls}")
+        
+        lines += ["# HELP wingman_llm_errors_total Failed upstream completions", "# TYPE wingman_llm_errors_total counter"]
+        for (tool, model, error), count in self.llm_errors.items():
+            lines.append(f"wingman_llm_errors_total{_labels(tool=tool, model=model, error=error)} {count}")
+        
+        lines += ["# HELP wingman_llm_tokens_total Tokens by kind (prompt, cached, completion)", "# TYPE wingman_llm_tokens_total counter"]
+        for (tool, model, kind), count in self.llm_tokens.items():
+            lines.append(f"wingman_llm_tokens_total{_labels(tool=tool, model=model, kind=kind)} {count}")
+        
+        lines += ["# HELP wingman_llm_cached_token_ratio Share of prompt tokens served from the upstream prompt cache", "# TYPE wingman_llm_cached_token_ratio gauge"]
+        for tool, model in self.llm_calls:
+            lines.append(f"wingman_llm_cached_token_ratio{_labels(tool=tool, model=model)} {self.cached_ratio(tool, model):.4f}")
+        
+        lines += ["# HELP wingman_llm_cost_usd_total Estimated upstream spend", "# TYPE wingman_llm_cost_usd_total counter"]
+        for (tool, model), cost in self.llm_cost.items():
+            lines.append(f"wingman_llm_cost_usd_total{_labels(tool=tool, model=model)} {cost:.6f}")
+        
+        lines += ["# HELP wingman_llm_latency_seconds Upstream completion latency", "# TYPE wingman_llm_latency_seconds histogram"]
+        for (tool, model), histogram in self.llm_latency.items():
+            self._render_histogram(lines, "wingman_llm_latency_seconds", histogram, tool=tool, model=model)
+        
+        lines += ["# HELP wingman_llm_ttft_seconds Time to first token of streamed completions", "# TYPE wingman_llm_ttft_seconds histogram"]
+        for tool, histogram in self.llm_ttft.items():
+            self._render_histogram(lines, "wingman_llm_ttft_seconds", histogram, tool=tool)
+        
+        lines += ["# HELP wingman_structured_calls_total Structured-output requests", "# TYPE wingman_structured_calls_total counter"]
+        for tool, calls in self.structured_calls.items():
+            lines.append(f"wingman_structured_calls_total{_labels(tool=tool)} {calls}")
+        
+        lines += [
+            "# HELP wingman_structured_fallbacks_total Structured-output repairs, retries and failures by reason",
+            "# TYPE wingman_structured_fallbacks_total counter"
+        ]
+        for (tool, reason, action), count in self.structured_fallbacks.items():
+            lines.append(f"wingman_structured_fallbacks_total{_labels(tool=tool, reason=reason, action=action)} {count}")
+        
+        lines += ["# HELP wingman_route_requests_total Routed requests by outcome", "# TYPE wingman_route_requests_total counter"]
+        for (route, outcome), count in self.route_requests.items():
+            lines.append(f"wingman_route_requests_total{_labels(route=route, outcome=outcome)} {count}")
+        
+        lines += ["# HELP wingman_route_cost_usd_total Estimated spend per route", "# TYPE wingman_route_cost_usd_total counter"]
+        for route in self.route_latency:
+            lines.append(f"wingman_route_cost_usd_total{_labels(route=route)} {self.route_cost(route):.6f}")
+        
+        lines += ["# HELP wingman_route_latency_seconds Routed request latency including fallbacks and hedges", "# TYPE wingman_route_latency_seconds histogram"]
+        for route, histogram in self.route_latency.items():
+            self._render_histogram(lines, "wingman_route_latency_seconds", histogram, route=route)
+        
+        lines += ["# HELP wingman_admission_requests_total Tool calls admitted or shed by queue", "# TYPE wingman_admission_requests_total counter"]
+        for (queue, outcome), count in self.admission_requests.items():
+            lines.append(f"wingman_admission_requests_total{_labels(queue=queue, outcome=outcome)} {count}")
+        
+        lines += ["# HELP wingman_admission_wait_seconds Time admitted tool calls spent queued", "# TYPE wingman_admission_wait_seconds histogram"]
+        for queue, histogram in self.admission_wait.items():
+            self._render_histogram(lines, "wingman_admission_wait_seconds", histogram, queue=queue)
+        
+        lines += ["# HELP wingman_candidates_total opener/reply candidates generated, dropped (too_long, duplicates) and returned", "# TYPE wingman_candidates_total counter"]
+        for (tool, outcome), count in self.candidates.items():
+            lines.append(f"wingman_candidates_total{_labels(tool=tool, outcome=outcome)} {count}")
+        
+        lines += ["# HELP wingman_speculation_total Speculative prefetches by outcome (hit and joined were served to a real call)", "# TYPE wingman_speculation_total counter"]
+        for (tool, outcome), count in self.speculations.items():
+            lines.append(f"wingman_speculation_total{_labels(tool=tool, outcome=outcome)} {count}")
+        
+        lines += ["# HELP wingman_conversation_messages_total Conversation screenshot messages merged into memory (new), already known (duplicate) or folded into the summary (compacted)", "# TYPE wingman_conversation_messages_total counter"]
+        for kind, count in self.conversation_messages.items():
+            lines.append(f"wingman_conversation_messages_total{_labels(kind=kind)} {count}")
+        
+        lines += ["# HELP wingman_prescreen_total Local pre-screen decisions (skip means no LLM call)", "# TYPE wingman_prescreen_total counter"]
+        for (tool, decision), count in self.prescreen_decisions.items():
+            lines.append(f"wingman_prescreen_total{_labels(tool=tool, decision=decision)} {count}")
+        
+        lines += ["# HELP wingman_input_tokens_total Estimated tool input tokens before (original) and after (sent) budgeting", "# TYPE wingman_input_tokens_total counter"]
+        for (tool, kind), count in self.input_tokens.items():
+            lines.append(f"wingman_input_tokens_total{_labels(tool=tool, kind=kind)} {count}")
+        
+        lines += ["# HELP wingman_input_truncations_total Tool input fields truncated to fit the input budget", "# TYPE wingman_input_truncations_total counter"]
+        for (tool, field), count in self.input_truncations.items():
+            lines.append(f"wingman_input_truncations_total{_labels(tool=tool, field=field)} {count}")
+        
+        lines += ["# HELP wingman_auth_rejections_total Requests refused by per-token rate limits and quotas", "# TYPE wingman_auth_rejections_total counter"]
+        for (client, reason), count in self.auth_rejections.items():
+            lines.append(f"wingman_auth_rejections_total{_labels(client=client, reason=reason)} {count}")
+        
+        for name, collect in self._collectors.items():
+            for key, value in collect().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f"wingman_{name}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        
+        return "\n".join(lines) + "\n"
+
+class ToolMetricsMiddleware(Middleware):
+    """FastMCP middleware recording calls, errors and latency for every tool"""
+    
+    def __init__(self, registry: "MetricsRegistry"):
+        self.registry = registry
+    
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        tool = context.message.name
+        start = time.perf_counter()
+        try:
+            result = await call_next(context)
+        except Exception as e:
+            self.registry.record_tool_call(tool, time.perf_counter() - start, type(e).__name__)
+            raise
+        
+        # Tools report failures as {"error": ...} payloads rather than raising
+        content = getattr(result, "structured_content", None)
+        error = None
+        if getattr(result, "is_error", False):
+            error = "ToolError"
+        elif isinstance(content, dict) and content.get("error"):
+            error = "ErrorResponse"
+        
+        self.registry.record_tool_call(tool, time.perf_counter() - start, error)
+        return result
+
+# Global metrics registry
+metrics = MetricsRegistry()
@@ -0,0 +1,257 @@
+import os
+import re
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Set, Tuple
+from cache import ResponseCache, create_response_cache
+from prompts import render_prompt
+
+# Common spellings mapped to one canonical city name
+CITY_ALIASES = {
+    "nyc": "new york",
+    "new york city": "new york",
+    "ny": "new york",
+    "manhattan": "new york",
+    "brooklyn": "new york",
+    "sf": "san francisco",
+    "san fran": "san francisco",
+    "the bay": "san francisco",
+    "la": "los angeles",
+    "l.a.": "los angeles",
+    "dc": "washington",
+    "washington dc": "washington",
+    "washington d.c.": "washington",
+    "philly": "philadelphia",
+    "chi": "chicago",
+    "chi-town": "chicago",
+    "atx": "austin",
+    "vegas": "las vegas",
+    "nola": "new orleans",
+    "bombay": "mumbai",
+    "bengaluru": "bangalore",
+    "new delhi": "delhi",
+    "london uk": "london",
+}
+
+BUDGET_ALIASES = {
+    "low": "low", "cheap": "low", "budget": "low", "free": "low", "$": "low",
+    "medium": "medium", "mid": "medium", "moderate": "medium", "average": "medium", "$$": "medium",
+    "high": "high", "expensive": "high", "luxury": "high", "splurge": "high", "$$$": "high",
+}
+
+VIBE_ALIASES = {
+    "casual": "casual", "chill": "casual", "relaxed": "casual", "laid back": "casual", "laid-back": "casual",
+    "romantic": "romantic", "cute": "romantic", "intimate": "romantic", "fancy": "romantic",
+    "adventurous": "adventurous", "adventure": "adventurous", "active": "adventurous", "outdoorsy": "adventurous",
+    "cultural": "cultural", "culture": "cultural", "museum": "cultural", "museums": "cultural",
+    "creative": "cultural", "artsy": "cultural", "arty": "cultural", "quirky": "cultural", "unique": "cultural",
+}
+
+# Canonical vibes the warm command fills by default (DatePlanRequest.vibe)
+WARM_VIBES = ["casual", "romantic", "adventurous", "cultural"]
+
+def _clean(text: str) -> str:
+    """Lowercase and collapse whitespace"""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+def normalize_city(city: str) -> str:
+    """Canonical city name: 'NYC', ' New York City ' and 'new york, ny' all become 'new york'"""
+    city = _clean(city)
+    city = CITY_ALIASES.get(city, city)
+    # Drop a trailing state or country ("austin, tx")
+    city = city.split(",")[0].strip()
+    return CITY_ALIASES.get(city, city)
+
+def normalize_interests(interests: str) -> str:
+    """Sorted, de-duplicated, comma-separated interests"""
+    parts = re.split(r",|;|/|&|\band\b|\+", _clean(interests))
+    return ", ".join(sorted({part.strip(" .") for part in parts if part.strip(" .")}))
+
+def normalize_plan_request(city: str, budget: str, interests: str, vibe: str) -> Tuple[str, str, str, str]:
+    """(city, budget, interests, vibe) with aliases resolved; unknown budgets and vibes are kept as typed"""
+    budget = _clean(budget) or "medium"
+    vibe = _clean(vibe) or "casual"
+    return (
+        normalize_city(city),
+        BUDGET_ALIASES.get(budget, budget),
+        normalize_interests(interests),
+        VIBE_ALIASES.get(vibe, vibe)
+    )
+
+def plan_key(request: Tuple[str, str, str, str]) -> str:
+    """Cache key of a normalized request"""
+    return "date_plan:" + "|".join(request)
+
+def date_plan_prompt(request: Tuple[str, str, str, str]) -> Tuple[str, str]:
+    """(system message, user message) of the date_plan prompt for a normalized request"""
+    city, budget, interests, vibe = request
+    return render_prompt(
+        "date_plan", budget=budget, vibe=vibe, city=city.title(), interests=interests or "anything fun"
+    )
+
+class PlanCache:
+    """Stale-while-revalidate cache of date plans with a pool of variants per key
+    
+    Plans are served straight from the cache. Once the oldest variant passes
+    ``soft_ttl`` it is regenerated in the background, and until a key holds
+    ``variants`` plans each hit adds another one, so repeat requests get
+    different text. Variants older than ``hard_ttl`` are never served. The
+    backing store is a ResponseCache, so an SQLiteCache shares plans across
+    workers and keeps what the warm command precomputed.
+    """
+    
+    def __init__(
+        self,
+        store: ResponseCache,
+        soft_ttl: float = 3600,
+        hard_ttl: float = 86400,
+        variants: int = 3
+    ):
+        self.store = store
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.variants = variants
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def _load(self, key: str) -> List[Dict[str, Any]]:
+        """Variants of a key that are still servable"""
+        found, value = self.store.get(key)
+        if not found:
+            return []
+        cutoff = time.time() - self.hard_ttl
+        return [variant for variant in value["variants"] if variant["created_at"] > cutoff]
+    
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """A random cached variant as {"plan", "stale", "variants"}, or None on a miss"""
+        variants = self._load(key)
+        if not variants:
+            self.misses += 1
+            return None
+        
+        stale = min(variant["created_at"] for variant in variants) < time.time() - self.soft_ttl
+        self.hits += 1
+        self.stale_hits += stale
+        return {"plan": random.choice(variants)["plan"], "stale": stale, "variants": len(variants)}
+    
+    def add(self, key: str, plan: str, replace_oldest: bool = False):
+        """Store a plan, keeping at most ``variants`` per key"""
+        variants = self._load(key)
+        if replace_oldest and variants:
+            variants.remove(min(variants, key=lambda variant: variant["created_at"]))
+        variants.append({"plan": plan, "created_at": time.time()})
+        variants = sorted(variants, key=lambda variant: variant["created_at"])[-self.variants:]
+        self.store.set(key, {"variants": variants}, self.hard_ttl)
+    
+    def revalidate(self, key: str, hit: Dict[str, Any], generate: Callable[[], Awaitable[str]]):
+        """After a hit, refresh a stale key or grow its variant pool in the background"""
+        if not hit["stale"] and hit["variants"] >= self.variants:
+            return
+        if key in self._refreshing:
+            return
+        
+        async def refresh():
+            try:
+                self.add(key, await generate(), replace_oldest=hit["stale"])
+                self.refreshes += 1
+            except Exception:
+                self.refresh_errors += 1
+            finally:
+                self._refreshing.discard(key)
+        
+        self._refreshing.add(key)
+        task = asyncio.ensure_future(refresh())
+        # Held so the task isn't garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get plan cache counters"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "refreshing": len(self._refreshing),
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+def create_plan_cache(store: Optional[ResponseCache] = None) -> PlanCache:
+    """Create the date plan cache configured by the environment"""
+    return PlanCache(
+        store if store is not None else create_response_cache(),
+        soft_ttl=float(os.getenv("PLAN_CACHE_SOFT_TTL", 3600)),
+        hard_ttl=float(os.getenv("PLAN_CACHE_HARD_TTL", 86400)),
+        variants=int(os.getenv("PLAN_CACHE_VARIANTS", 3))
+    )
+
+async def warm(cities: List[str], budgets: List[str], vibes: List[str], variants: int, concurrency: int):
+    """Precompute plans for every city x budget x vibe (no interests)"""
+    from mcp_server import DATE_PLAN_MAX_TOKENS, DATE_PLAN_TEMPERATURE, llm, plan_cache
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+    total = len(cities) * len(budgets) * len(vibes)
+    
+    async def fill(city: str, budget: str, vibe: str):
+        nonlocal done
+        request = normalize_plan_request(city, budget, "", vibe)
+        key = plan_key(request)
+        async with semaphore:
+            system_message, prompt = date_plan_prompt(request)
+            while len(plan_cache._load(key)) < variants:
+                plan = await llm.generate_response(
+                    prompt, max_tokens=DATE_PLAN_MAX_TOKENS, temperature=DATE_PLAN_TEMPERATURE,
+                    system_message=system_message, tool="date_plan", bypass_cache=True
+                )
+                plan_cache.add(key, plan)
+        done += 1
+        print(f"[{done}/{total}] {' / '.join(part for part in request if part)}")
+    
+    await asyncio.gather(*[
+        fill(city, budget, vibe) for city in cities for budget in budgets for vibe in vibes
+    ])
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute date plans into the plan cache")
+    parser.add_argument("cities", nargs="*", help="city names (or use --cities-file)")
+    parser.add_argument("--cities-file", default=None, help="file with one city per line")
+    parser.add_argument("--budgets", default="low,medium,high")
+    parser.add_argument("--vibes", default=",".join(WARM_VIBES))
+    parser.add_argument("--variants", type=int, default=None, help="plans per key (default PLAN_CACHE_VARIANTS)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    
+    cities = list(args.cities)
+    if args.cities_file:
+        with open(args.cities_file) as f:
+            cities += [line.strip() for line in f if line.strip()]
+    if not cities:
+        parser.error("no cities given")
+    
+    os.environ.setdefault("LLM_CACHE_BACKEND", "sqlite")
+    # Offline: wait for the server's writes rather than dropping plans
+    os.environ.setdefault("LLM_CACHE_BUSY_TIMEOUT", "5")
+    if os.environ["LLM_CACHE_BACKEND"].lower() != "sqlite":
+        print("LLM_CACHE_BACKEND is not sqlite; warmed plans will be lost on exit", file=sys.stderr)
+    
+    asyncio.run(warm(
+        cities,
+        args.budgets.split(","),
+        args.vibes.split(","),
+        args.variants or int(os.getenv("PLAN_CACHE_VARIANTS", 3)),
+        args.concurrency
+    ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import re
+from typing import Optional, Dict, Any, List, Tuple
+
+# (rule, category, weight, triggers, pattern). A rule's regex only runs when
+# one of its trigger substrings occurs in the text (lowercased, whitespace
+# collapsed, with a leading space); a text's score is the sum of the weights
+# of the distinct rules it matches
+RED_FLAG_RULES: List[Tuple[str, str, float, Tuple[str, ...], str]] = [
+    # Payment requests
+    # Gift cards only count when asked for (or with an amount), not when mentioned
+    ("gift_card", "payment", 1.0, ("gift", "steam", "itunes", "google"),
+     r"(?:send|buy|get|grab|need)\s+(?:me\s+)?(?:an?\s+|some\s+|\$?\d+\s+(?:in\s+)?)?"
+     r"(?:steam\s?|itunes\s?|google\s?play\s?|apple\s?|amazon\s?)?(?:gift\s?)?cards?"
+     r"|\$?\d+\s+(?:in\s+)?(?:steam\s?|itunes\s?|google\s?play\s?|apple\s?|amazon\s?)?gift\s?cards?"),
+    ("wire_transfer", "payment", 1.0, ("western", "moneygram", "wire"),
+     r"western\s?union|moneygram|wire\s+(?:me|the\s+money)"),
+    ("send_money", "payment", 1.0, ("send", "lend", "loan", "wire"),
+     r"(?:send|lend|loan|wire)\s+me\s+(?:some\s+)?(?:money|cash|\$\s?\d+)"),
+    ("payment_app", "payment", 0.5, ("cash", "venmo", "zelle", "paypal", "$"),
+     r"cash\s?app|venmo|zelle|paypal|\$[a-z][a-z0-9_]{2,}"),
+    ("emergency_money", "payment", 0.5, ("hospital", "airport", "customs", "visa", "emergency"),
+     r"hospital\s+bills?|stuck\s+at\s+(?:the\s+)?airport|customs\s+fees?|visa\s+fees?|emergency\s+(?:fund|money|surgery)"),
+    # Crypto and investment pitches
+    ("crypto", "crypto", 0.5, ("bitcoin", "btc", "eth", "usdt", "tether", "crypto", "binance"),
+     r"bitcoin|\bbtc\b|\beth\b|ethereum|\busdt\b|tether|crypto(?:currency)?|binance"),
+    ("investment", "crypto", 0.5, ("invest", "trading", "forex", "mining"),
+     r"invest(?:ment|ing)?\s+(?:platform|opportunity|plan)|trading\s+(?:platform|app|account)|\bforex\b|mining\s+pool"),
+    ("guaranteed_returns", "crypto", 1.0, ("guaranteed", "double", "%"),
+     r"guaranteed\s+(?:returns?|profits?|income)|double\s+your\s+(?:money|investment)|\d+\s?%\s+(?:daily|weekly)\s+(?:returns?|profit)"),
+    ("passive_income", "crypto", 0.5, ("passive",),
+     r"passive\s+income"),
+    # Moving the conversation off the app
+    ("messenger", "off_platform", 0.5, ("telegram", "whats", "kik", "signal", "hangout", "wechat", "line"),
+     r"telegram|whats\s?app|\bkik\b|signal\s+app|google\s+hangouts?|wechat|line\s+app"),
+    ("move_off_app", "off_platform", 0.5, (" me on", " me up on", "rarely", "deleting", "leaving"),
+     r"(?:text|message|add|find|hit)\s+me\s+(?:up\s+)?on\b|rarely\s+(?:on|use)\s+(?:this|here)|(?:deleting|leaving)\s+(?:this|the)\s+app"),
+    ("link", "off_platform", 0.25, ("http", "www", ".com", ".net", ".io", ".xyz", ".me", ".ly"),
+     r"https?://\S+|www\.\S+|\b[a-z0-9-]+\.(?:com|net|io|xyz|me|ly)/\S*"),
+    ("social_handle", "off_platform", 0.25, ("snap", "insta", " ig", "onlyfans"),
+     r"(?:snap(?:chat)?|insta(?:gram)?|\big\b|onlyfans)\s*[:@-]?\s*@?[a-z0-9_.]{3,}"),
+    # Contact details
+    # Grouped like a phone number (optionally +country code), or + and 9-13 digits;
+    # runs of years or prices don't fit either
+    ("phone_number", "contact", 0.5, tuple("0123456789"),
+     r"(?<![\w+])(?:(?:\+\d{1,3}[\s.-]?)?(?:\(\d{3}\)\s?|\d{3}[\s.-]?)\d{3}[\s.-]?\d{4}|\+\d{1,3}(?:[\s.-]?\d){8,12})(?!\w)"),
+    ("email", "contact", 0.25, ("@",),
+     r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}"),
+    # Sugar dating and solicitation
+    ("sugar", "solicitation", 1.0, ("sugar", "pig", "findom"),
+     r"sugar\s?(?:daddy|baby|mommy|momma)|pay\s?pig|findom"),
+    # An allowance only near money or arrangement terms ("my parents' allowance" isn't one)
+    ("allowance", "solicitation", 0.5, ("allowance",),
+     r"(?:\$\s?\d|\d+\s?k\b|weekly|monthly|generous|\bppm\b|arrangement|spoil)[^.!?]{0,40}\ballowance\b"
+     r"|\ballowance\b[^.!?]{0,40}(?:\$\s?\d|\d+\s?k\b|weekly|monthly|\bppm\b|arrangement|spoil)"),
+    ("paid_content", "solicitation", 0.5, ("onlyfans", "link", "premium", "selling"),
+     r"onlyfans|\bof\s+link|premium\s+snap|selling\s+(?:pics|content)"),
+    # Verification-code and account scams
+    ("verification_code", "account", 1.0, ("verif", "code"),
+     r"(?:send|tell|give|share|forward|read)\s+(?:me\s+)?(?:the|your|that)\s+(?:\d-digit\s+)?(?:verification\s+)?code"
+     r"|verify\s+(?:you(?:'re|\s+are)?\s+real|yourself)\s+(?:at|on|with|here)"),
+]
+
+CATEGORY_ADVICE = {
+    "payment": "Never send money, gift cards or payment-app transfers to someone you haven't met, whatever the story.",
+    "crypto": "Crypto and 'investment' tips from matches are a common romance-scam pattern (pig butchering).",
+    "off_platform": "Pushing to move off the app early avoids the app's safety tools; keep chatting in-app until you've met.",
+    "contact": "Sharing contact details in the first messages is unusual; don't share yours until you're comfortable.",
+    "solicitation": "This looks like sugar dating or paid-content solicitation rather than dating.",
+    "account": "Never share verification codes; they're used to take over your accounts.",
+}
+
+# Focus for the LLM when the pre-screen found something but not enough to decide alone
+FOCUSED_PROMPT_HINTS = {
+    "payment": "It mentions money or payment methods: judge whether this is a financial scam setup.",
+    "crypto": "It mentions crypto or investing: judge whether this is an investment/romance scam.",
+    "off_platform": "It pushes to other apps or links: judge whether the move off-platform is suspicious.",
+    "contact": "It shares contact details early: judge whether this is a scam or spam pattern.",
+    "solicitation": "It hints at paid arrangements: judge whether this is solicitation rather than dating.",
+    "account": "It mentions codes or verification: judge whether this is an account-takeover attempt.",
+}
+
+class RedFlagScreen:
+    """Weighted red-flag rules behind a substring prefilter
+    
+    The text is normalized once and every rule's trigger substrings are
+    checked with ``in`` (a C-speed search) in one pass, so on clean text
+    almost no regex runs; only rules whose triggers occur are searched.
+    Python's regex engine tries every alternative at every position, so one
+    combined pattern would cost the sum of all rules on every text. The
+    score decides how much LLM work is needed: ``skip`` at or above
+    skip_threshold with hits in at least skip_categories categories (the hits
+    alone are conclusive, never a single phrase), ``focused`` for weaker
+    hits, ``general`` when nothing matched.
+    """
+    
+    def __init__(
+        self,
+        rules: Optional[List[Tuple[str, str, float, Tuple[str, ...], str]]] = None,
+        skip_threshold: float = 2.0,
+        skip_categories: int = 2
+    ):
+        rules = rules or RED_FLAG_RULES
+        self.rules = [(name, category, weight, re.compile(pattern)) for name, category, weight, _, pattern in rules]
+        # Flattened (trigger, rule index) pairs for a single comprehension per scan
+        self._triggers = [(trigger, index) for index, rule in enumerate(rules) for trigger in rule[3]]
+        self.skip_threshold = skip_threshold
+        self.skip_categories = skip_categories
+    
+    def scan(self, text: str) -> Dict[str, Any]:
+        """Match every rule against text; returns hits, score, categories and the decision"""
+        normalized = " " + " ".join(text.lower().split())
+        candidates = sorted({index for trigger, index in self._triggers if trigger in normalized})
+        
+        hits: List[Dict[str, Any]] = []
+        for index in candidates:
+            name, category, weight, pattern = self.rules[index]
+            match = pattern.search(normalized)
+            if match is not None:
+                hits.append({"rule": name, "category": category, "weight": weight, "match": match.group().strip()})
+        
+        score = sum(hit["weight"] for hit in hits)
+        categories = sorted({hit["category"] for hit in hits})
+        if score >= self.skip_threshold and len(categories) >= self.skip_categories:
+            decision = "skip"
+        elif hits:
+            decision = "focused"
+        else:
+            decision = "general"
+        return {"score": score, "decision": decision, "categories": categories, "hits": hits}
+
+def describe_hits(screen: Dict[str, Any]) -> str:
+    """Plain-language analysis for texts the pre-screen flags on its own"""
+    lines = [f"High risk (pre-screen score {screen['score']:.2f}). Detected:"]
+    for hit in screen["hits"]:
+        lines.append(f"- {hit['category'].replace('_', ' ')}: \"{hit['match']}\"")
+    lines.append("")
+    lines += [CATEGORY_ADVICE[category] for category in screen["categories"]]
+    lines.append("Consider unmatching and reporting the profile in the app.")
+    return "\n".join(lines)
+
+def focused_instructions(screen: Dict[str, Any]) -> str:
+    """Extra prompt lines pointing the LLM at what the pre-screen found"""
+    found = ", ".join(f"\"{hit['match']}\"" for hit in screen["hits"])
+    hints = " ".join(FOCUSED_PROMPT_HINTS[category] for category in screen["categories"])
+    return f"A keyword pre-screen flagged: {found}. {hints}"
+
+def create_red_flag_screen() -> RedFlagScreen:
+    """Create the red-flag pre-screen configured by the environment"""
+    return RedFlagScreen(
+        skip_threshold=float(os.getenv("PRESCREEN_SKIP_THRESHOLD", 2.0)),
+        skip_categories=int(os.getenv("PRESCREEN_SKIP_CATEGORIES", 2))
+    )
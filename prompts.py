@@ -0,0 +1,190 @@
+import hashlib
+from typing import Dict, Any, Tuple
+
+class PromptTemplate:
+    """A tool prompt split into a static system prefix and a per-call user suffix
+    
+    The system text is never formatted, so it is byte-identical on every
+    call and upstream prefix caching can reuse it. Everything that varies
+    (tone, counts, the user's text) goes into the user template.
+    """
+    
+    def __init__(self, name: str, system: str, user: str):
+        self.name = name
+        self.system = system
+        self.user = user
+        self.digest = hashlib.sha256(system.encode("utf-8")).hexdigest()
+    
+    def render(self, **values: Any) -> Tuple[str, str]:
+        """(system message, user message) for one call"""
+        return self.system, self.user.format(**values)
+
+# Tool name -> template
+PROMPTS: Dict[str, PromptTemplate] = {}
+
+def register_prompt(name: str, system: str, user: str) -> PromptTemplate:
+    """Add a template to the registry"""
+    if name in PROMPTS:
+        raise ValueError(f"Prompt {name} is already registered")
+    PROMPTS[name] = PromptTemplate(name, system, user)
+    return PROMPTS[name]
+
+def render_prompt(name: str, **values: Any) -> Tuple[str, str]:
+    """(system message, user message) of a registered template"""
+    return PROMPTS[name].render(**values)
+
+def prompt_stats() -> Dict[str, Any]:
+    """Get the number of templates and the size of their static prefixes (~4 chars/token)"""
+    sizes = [len(template.system) // 4 for template in PROMPTS.values()]
+    return {
+        "templates": len(PROMPTS),
+        "prefix_tokens_min": min(sizes, default=0),
+        "prefix_tokens_max": max(sizes, default=0)
+    }
+
+register_prompt(
+    "generate_bio",
+    "You are an expert dating coach specializing in creating compelling dating app bios.\n"
+    "Make every bio authentic, engaging, and conversation-starting. Include personality traits, interests, and a subtle call-to-action.",
+    "Create a {tone} bio that's {length} length for {app}.\n"
+    "\n"
+    "Create a bio based on: {profile_text}"
+)
+
+register_prompt(
+    "opener",
+    "You are a dating expert who creates personalized, engaging conversation starters.\n"
+    "Make them specific to the person's profile, avoid generic messages, and include follow-up suggestions.",
+    "Generate {count} openers with a {tone} tone.\n"
+    "\n"
+    "Profile info: {profile_text}"
+)
+
+register_prompt(
+    "reply",
+    "You are a dating conversation expert. Generate thoughtful replies in the requested tone and intent.\n"
+    "Make responses engaging, authentic, and keep the conversation flowing naturally.",
+    "Tone: {tone}\n"
+    "Intent: {intent}\n"
+    "\n"
+    "They said: {partner_msg}"
+)
+
+register_prompt(
+    "opener_candidates",
+    "You are a dating expert who creates personalized, engaging conversation starters.\n"
+    "Make each opener specific to the person's profile, avoid generic messages, and give it follow-up suggestions and a short rationale.\n"
+    "Make the openers clearly different from each other in angle and wording.",
+    "Generate {count} openers with a {tone} tone, each under {max_chars} characters.\n"
+    "\n"
+    "Profile info: {profile_text}"
+)
+
+register_prompt(
+    "reply_candidates",
+    "You are a dating conversation expert. Generate thoughtful reply options in the requested tone and intent.\n"
+    "Make responses engaging, authentic, and keep the conversation flowing naturally.\n"
+    "Make the options clearly different from each other; give each a vibe_level (low|medium|high), a boundary_safe_variant and a short rationale.",
+    "Generate {count} replies, each under {max_chars} characters.\n"
+    "Tone: {tone}\n"
+    "Intent: {intent}\n"
+    "\n"
+    "They said: {partner_msg}"
+)
+
+register_prompt(
+    "date_plan",
+    "You are a local dating expert who creates perfect first date plans.\n"
+    "Create specific, actionable date ideas with venues, activities, and timing.",
+    "Budget: {budget}\n"
+    "Vibe: {vibe}\n"
+    "\n"
+    "Plan a date in {city} for people interested in: {interests}"
+)
+
+register_prompt(
+    "red_flag_check",
+    "You are a dating safety expert. Analyze profiles/messages for potential red flags.\n"
+    "Be thorough but balanced - point out genuine concerns while not being overly paranoid.\n"
+    "Provide safety advice and trust-your-gut guidance.",
+    "{focus}Analyze this for red flags: {profile_text}"
+)
+
+register_prompt(
+    "profile_roast",
+    "You are a witty dating coach who gives brutally honest but constructive feedback.\n"
+    "Roast the profile with humor while providing actionable improvement suggestions.\n"
+    "Be funny but helpful - the goal is to make them laugh while helping them improve.",
+    "Bio: {bio}\n"
+    "Images described: {images_desc}"
+)
+
+register_prompt(
+    "analyze_profile_screenshot",
+    """Analyze this dating profile screenshot and provide detailed insights:
+
+1. Extract all visible text (name, age, bio, interests, etc.)
+2. Identify the person's interests, hobbies, and personality traits
+3. Note their education, work, location if visible
+4. Generate 3-5 personalized conversation openers based on their profile
+5. Identify any potential red flags or concerns
+6. Provide an overall analysis and dating strategy advice
+
+Fill every field of the JSON schema: extracted_text with all visible text, profile_data with
+the details you can see (null when not visible), 3-5 suggested_openers with follow-ups and a
+rationale, red_flags (empty if none) and analysis_summary with the overall analysis and strategy.""",
+    "Context: {context}\n"
+    "Analysis type: {analysis_type}"
+)
+
+register_prompt(
+    "analyze_conversation_screenshot",
+    """Analyze this dating conversation screenshot and provide strategic advice:
+
+1. Extract all visible messages and identify who said what
+2. Analyze the conversation tone, flow, and current momentum
+3. Suggest 3-5 thoughtful reply options with different vibes (playful, serious, flirty, etc.)
+4. Provide conversation analysis and strategy advice
+5. Suggest next steps for the conversation
+
+Fill every field of the JSON schema: extracted_messages in order with sender "me" or "them",
+conversation_summary, 3-5 suggested_replies (vibe_level low|medium|high, with a
+boundary_safe_variant and rationale), conversation_analysis and next_step_advice.""",
+    "My role in conversation: {my_role}\n"
+    "Context: {context}"
+    "{layout}"
+    "{memory}"
+)
+
+# Packed batch requests: several numbered items in one structured call
+BATCH_INSTRUCTIONS = "Handle each numbered item separately. Return one result per item with its index and the content for that item only."
+
+register_prompt(
+    "batch_opener",
+    "You are a dating expert who creates personalized, engaging conversation starters.\n"
+    "Make them specific to that person's profile, avoid generic messages, and include follow-up suggestions.\n"
+    + BATCH_INSTRUCTIONS,
+    "For each profile, generate {count} openers with a {tone} tone.\n"
+    "\n"
+    "{items}"
+)
+
+register_prompt(
+    "batch_reply",
+    "You are a dating conversation expert. For each message they sent, generate a thoughtful reply in the requested tone and intent.\n"
+    "Make responses engaging, authentic, and keep the conversation flowing naturally.\n"
+    + BATCH_INSTRUCTIONS,
+    "Tone: {tone}\n"
+    "Intent: {intent}\n"
+    "\n"
+    "{items}"
+)
+
+register_prompt(
+    "batch_red_flag_check",
+    "You are a dating safety expert. Analyze each profile/message for potential red flags.\n"
+    "Be thorough but balanced - point out genuine concerns while not being overly paranoid.\n"
+    "Provide safety advice and trust-your-gut guidance.\n"
+    + BATCH_INSTRUCTIONS,
+    "{items}"
+)
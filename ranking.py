@@ -0,0 +1,148 @@
+import os
+import re
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+# Longest message (characters) that reads well as a first message or reply on
+# each app; Hinge comments on a prompt are capped at 150
+APP_MESSAGE_LIMITS = {
+    "tinder": 500,
+    "bumble": 500,
+    "hinge": 150,
+    "other": 500,
+}
+
+# Openings that make a message generic when there's little else to it
+GENERIC_OPENINGS = ("hey", "hi", "hello", "how are you", "how's it going", "what's up", "wyd", "sup")
+
+STOPWORDS = {
+    "about", "after", "also", "been", "being", "from", "have", "into", "just", "like", "love", "loves",
+    "more", "really", "some", "than", "that", "their", "them", "then", "there", "they", "this", "what",
+    "when", "where", "which", "will", "with", "would", "your", "you're", "looking", "someone",
+}
+
+def _normalize(text: str) -> str:
+    """Lowercase, punctuation dropped, whitespace collapsed"""
+    return " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+
+def shingles(text: str, size: int = 4) -> Set[str]:
+    """Character n-grams of the normalized text (robust to small rewordings and punctuation)"""
+    normalized = _normalize(text)
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[index:index + size] for index in range(len(normalized) - size + 1)}
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    """Jaccard similarity of two shingle sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def key_terms(text: str) -> Set[str]:
+    """Content words of a profile or message, used to reward personalized candidates"""
+    return {word for word in _normalize(text).split() if len(word) >= 4 and word not in STOPWORDS}
+
+def fit_length(text: str, limit: int) -> Optional[str]:
+    """Text if it fits, else cut at the last sentence end within the limit; None if that loses over half"""
+    text = text.strip()
+    if len(text) <= limit:
+        return text
+    cut = max(text.rfind(mark, 0, limit) for mark in ".!?")
+    if cut + 1 < limit // 2:
+        return None
+    return text[:cut + 1]
+
+def score_candidate(text: str, terms: Set[str]) -> float:
+    """Higher for candidates that reference the profile or message and invite an answer"""
+    normalized = _normalize(text)
+    score = min(len(terms & set(normalized.split())), 3)
+    if "?" in text:
+        score += 0.5
+    if len(normalized) < 40 and normalized.startswith(GENERIC_OPENINGS):
+        score -= 1.0
+    if len(normalized) < 20:
+        score -= 0.5
+    return score
+
+class CandidateRanker:
+    """Local ranking of model-generated candidates: length limits, dedup, then best first
+    
+    Candidates longer than the app's limit are cut at a sentence end or
+    dropped. The rest are ordered by score_candidate and picked greedily,
+    skipping any whose character-shingle Jaccard similarity to one already
+    picked reaches similarity_threshold. If that leaves fewer than asked for,
+    skipped candidates are added back under relaxed_threshold, so only
+    near-identical ones are dropped. Candidate lists are a handful of short
+    strings, so exact pairwise Jaccard is cheaper than MinHash here.
+    """
+    
+    def __init__(
+        self,
+        similarity_threshold: float = 0.5,
+        relaxed_threshold: float = 0.8,
+        limits: Optional[Dict[str, int]] = None
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.relaxed_threshold = max(relaxed_threshold, similarity_threshold)
+        self.limits = dict(APP_MESSAGE_LIMITS if limits is None else limits)
+    
+    def limit_for(self, app: str) -> int:
+        """Message length limit of an app (unknown apps get the "other" limit)"""
+        return self.limits.get((app or "").strip().lower(), self.limits["other"])
+    
+    def rank(
+        self,
+        candidates: List[Dict[str, Any]],
+        text_key: str,
+        context: str,
+        app: str,
+        count: int
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Best `count` distinct candidates, plus {"generated", "too_long", "duplicates", "relaxed", "returned"}"""
+        limit = self.limit_for(app)
+        terms = key_terms(context)
+        counts = {"generated": len(candidates), "too_long": 0, "duplicates": 0, "relaxed": 0, "returned": 0}
+        
+        scored = []
+        for position, candidate in enumerate(candidates):
+            text = fit_length(candidate.get(text_key) or "", limit)
+            if not text:
+                counts["too_long"] += 1
+                continue
+            # Ties keep the model's order
+            scored.append((-score_candidate(text, terms), position, {**candidate, text_key: text}))
+        scored.sort(key=lambda item: item[:2])
+        
+        selected: List[Tuple[int, Dict[str, Any]]] = []
+        picked: List[Set[str]] = []
+        skipped: List[Tuple[int, Dict[str, Any], Set[str]]] = []
+        for rank, (_, _, candidate) in enumerate(scored):
+            if len(selected) == count:
+                break
+            grams = shingles(candidate[text_key])
+            if any(similarity(grams, other) >= self.similarity_threshold for other in picked):
+                skipped.append((rank, candidate, grams))
+                continue
+            selected.append((rank, candidate))
+            picked.append(grams)
+        
+        # Too few distinct ones: fill up with the next best that aren't near-identical
+        for rank, candidate, grams in skipped:
+            if len(selected) == count:
+                break
+            if any(similarity(grams, other) >= self.relaxed_threshold for other in picked):
+                continue
+            selected.append((rank, candidate))
+            picked.append(grams)
+            counts["relaxed"] += 1
+        
+        counts["duplicates"] = len(skipped) - counts["relaxed"]
+        counts["returned"] = len(selected)
+        # Best first, whichever pass picked them
+        return [candidate for _, candidate in sorted(selected, key=lambda item: item[0])], counts
+
+def create_candidate_ranker() -> CandidateRanker:
+    """Create the candidate ranker configured by the environment"""
+    return CandidateRanker(
+        similarity_threshold=float(os.getenv("CANDIDATE_SIMILARITY", 0.5)),
+        relaxed_threshold=float(os.getenv("CANDIDATE_SIMILARITY_RELAXED", 0.8))
+    )
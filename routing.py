@@ -0,0 +1,165 @@
+import os
+import time
+from collections import deque
+from typing import Optional, Dict, Any
+from governor import DeadlineExceeded, get_status_code, is_retryable
+
+# Cost/latency tier per tool; tools not listed use the "quality" tier
+TOOL_TIERS = {
+    "reply": "fast",
+    "opener": "fast",
+    "batch_reply": "fast",
+    "batch_opener": "fast",
+    "generate_bio": "quality",
+    "date_plan": "quality",
+    "red_flag_check": "quality",
+    "batch_red_flag_check": "quality",
+    "profile_roast": "quality",
+    "analyze_profile_screenshot": "vision",
+    "analyze_conversation_screenshot": "vision",
+}
+
+def get_tier_models() -> Dict[str, Dict[str, Any]]:
+    """Primary model, fallback model and latency budget (seconds) for each tier"""
+    quality = os.getenv("OPENAI_MODEL", "gpt-4o")
+    fast = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+    return {
+        "fast": {"model": fast, "fallback": quality, "latency_budget": 8.0},
+        "quality": {"model": quality, "fallback": fast, "latency_budget": 20.0},
+        "vision": {
+            "model": os.getenv("OPENAI_VISION_MODEL", "gpt-4o"),
+            "fallback": os.getenv("OPENAI_VISION_FALLBACK_MODEL", "gpt-4o-mini"),
+            "latency_budget": 30.0
+        },
+    }
+
+def should_fall_back(error: Exception) -> bool:
+    """Whether another model could succeed where this request failed"""
+    if isinstance(error, DeadlineExceeded):
+        return True
+    # 404: the model is unavailable to this key or region
+    return is_retryable(error) or get_status_code(error) == 404
+
+class Route:
+    """Model selection for one tool"""
+    
+    def __init__(
+        self,
+        tool: str,
+        tier: str,
+        model: str,
+        fallback_model: Optional[str] = None,
+        latency_budget: float = 20.0
+    ):
+        self.tool = tool
+        self.tier = tier
+        self.model = model
+        self.fallback_model = fallback_model if fallback_model != model else None
+        self.latency_budget = latency_budget
+        self.latencies: deque = deque(maxlen=200)
+        self.degraded_until = 0.0
+    
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency percentile of recent primary-model calls"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class ModelRouter:
+    """Picks a model per tool, degrades slow routes and times hedged requests
+    
+    A route whose recent p95 latency exceeds its tier's budget sends traffic
+    to its fallback model for ``degrade_cooldown`` seconds. With hedging
+    enabled, a non-streamed call still running after the route's p95 latency
+    is duplicated to the fallback model and the first answer wins.
+    """
+    
+    def __init__(
+        self,
+        tiers: Optional[Dict[str, Dict[str, Any]]] = None,
+        tool_tiers: Optional[Dict[str, str]] = None,
+        hedge_enabled: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.5,
+        min_samples: int = 20,
+        degrade_cooldown: float = 30.0
+    ):
+        self.tiers = tiers or get_tier_models()
+        self.tool_tiers = tool_tiers if tool_tiers is not None else TOOL_TIERS
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.min_samples = min_samples
+        self.degrade_cooldown = degrade_cooldown
+        self._routes: Dict[str, Route] = {}
+    
+    def route(self, tool: Optional[str], default_tier: str = "quality") -> Route:
+        """Get the route for a tool, overridable with MODEL_<TOOL> / FALLBACK_MODEL_<TOOL>"""
+        name = tool or ("default" if default_tier == "quality" else default_tier)
+        route = self._routes.get(name)
+        if route is None:
+            tier = self.tool_tiers.get(name, default_tier)
+            config = self.tiers[tier]
+            fallback = os.getenv(f"FALLBACK_MODEL_{name.upper()}", config["fallback"])
+            route = Route(
+                name,
+                tier,
+                os.getenv(f"MODEL_{name.upper()}", config["model"]),
+                fallback or None,
+                config["latency_budget"]
+            )
+            self._routes[name] = route
+        return route
+    
+    def select(self, route: Route) -> str:
+        """Model to call first: the primary, or the fallback while the route is degraded"""
+        if route.fallback_model and time.monotonic() < route.degraded_until:
+            return route.fallback_model
+        return route.model
+    
+    def observe(self, route: Route, model: str, seconds: float):
+        """Record a completed call; degrade the route when its p95 exceeds the budget"""
+        if model != route.model:
+            return
+        
+        route.latencies.append(seconds)
+        if len(route.latencies) < self.min_samples or not route.fallback_model:
+            return
+        
+        p95 = route.percentile(0.95)
+        if p95 > route.latency_budget:
+            route.degraded_until = time.monotonic() + self.degrade_cooldown
+            # Start the next window fresh so recovery is judged on new samples
+            route.latencies.clear()
+    
+    def hedge_delay(self, route: Route) -> Optional[float]:
+        """Seconds to wait before hedging, or None when the route shouldn't hedge"""
+        if not self.hedge_enabled or not route.fallback_model or len(route.latencies) < self.min_samples:
+            return None
+        return max(self.hedge_min_delay, route.percentile(self.hedge_quantile))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get per-route models and recent latency"""
+        now = time.monotonic()
+        return {
+            name: {
+                "tier": route.tier,
+                "model": route.model,
+                "fallback_model": route.fallback_model,
+                "degraded": now < route.degraded_until,
+                "p95_seconds": route.percentile(0.95),
+                "samples": len(route.latencies)
+            }
+            for name, route in self._routes.items()
+        }
+
+def create_router() -> ModelRouter:
+    """Create the model router configured by the environment"""
+    return ModelRouter(
+        hedge_enabled=os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes"),
+        hedge_quantile=float(os.getenv("HEDGE_QUANTILE", 0.95)),
+        hedge_min_delay=float(os.getenv("HEDGE_MIN_DELAY", 0.5)),
+        min_samples=int(os.getenv("ROUTE_MIN_SAMPLES", 20)),
+        degrade_cooldown=float(os.getenv("ROUTE_DEGRADE_COOLDOWN", 30))
+    )
@@ -1,4 +1,5 @@
-from typing import Optional, List, Dict, Any
+import copy
+from typing import Optional, List, Dict, Any, Type, Iterable
 from pydantic import BaseModel, Field
 
 class ValidateResponse(BaseModel):
@@ -21,23 +22,14 @@ class OpenerRequest(BaseModel):
     their_profile_text: str = Field(..., description="Their profile information")
     tone: str = Field("friendly", description="friendly|playful|flirty|casual")
     count: int = Field(3, description="Number of openers to generate")
-
-class OpenerResponse(BaseModel):
-    openers: str
-    tone: str
-    count: int
-    strategy: str
+    app: str = Field("tinder", description="tinder|bumble|hinge|other (sets the length limit)")
 
 class ReplyRequest(BaseModel):
     partner_msg: str = Field(..., description="What they said")
     intent: str = Field("continue", description="continue|flirt|ask_out|deflect")
     tone: str = Field("friendly", description="friendly|playful|witty|serious")
-
-class ReplyResponse(BaseModel):
-    suggested_reply: str
-    tone: str
-    intent: str
-    conversation_tips: List[str]
+    count: int = Field(3, description="Number of alternative replies to return")
+    app: str = Field("tinder", description="tinder|bumble|hinge|other (sets the length limit)")
 
 class DatePlanRequest(BaseModel):
     city: str = Field(..., description="City/location for the date")
@@ -80,6 +72,7 @@ class ConversationScreenshotRequest(BaseModel):
     image_data: str = Field(..., description="Base64 encoded conversation screenshot")
     my_role: str = Field("sender", description="sender|receiver")
     context: Optional[str] = Field("", description="Additional context")
+    conversation_id: Optional[str] = Field("", description="Identifies the chat across screenshots; memory is off without it unless the transport has an MCP session")
 
 class ExtractedProfileData(BaseModel):
     name: Optional[str] = None
@@ -103,6 +96,11 @@ class ScreenshotAnalysisResponse(BaseModel):
     analysis_summary: str
     context: str = ""
     analysis_type: str = "profile"
+    image_metadata: Optional[Dict[str, Any]] = None
+
+class ExtractedMessage(BaseModel):
+    sender: str = Field(..., description="me|them")
+    text: str
 
 class SuggestedReply(BaseModel):
     reply: str
@@ -110,14 +108,96 @@ class SuggestedReply(BaseModel):
     boundary_safe_variant: str = ""
     rationale: str
 
+class OpenerCandidates(BaseModel):
+    openers: List[SuggestedOpener]
+
+class ReplyCandidates(BaseModel):
+    replies: List[SuggestedReply]
+
+class OpenerResponse(BaseModel):
+    openers: List[SuggestedOpener]
+    tone: str
+    count: int
+    app: str
+    strategy: str
+    candidates: Dict[str, int]
+
+class ReplyResponse(BaseModel):
+    suggested_reply: str
+    replies: List[SuggestedReply]
+    tone: str
+    intent: str
+    app: str
+    conversation_tips: List[str]
+    candidates: Dict[str, int]
+
 class ConversationAnalysisResponse(BaseModel):
-    extracted_messages: List[Dict[str, Any]] = []
+    extracted_messages: List[ExtractedMessage] = []
     conversation_summary: str
     suggested_replies: List[SuggestedReply]
     conversation_analysis: str
     next_step_advice: str
     my_role: str = "sender"
     context: str = ""
+    conversation_memory: Optional[Dict[str, Any]] = None
+    image_metadata: Optional[Dict[str, Any]] = None
+
+# Fields the server fills in itself rather than asking the model for
+SCREENSHOT_ECHO_FIELDS = {"context", "analysis_type", "my_role", "conversation_memory", "image_metadata"}
+
+def _make_strict(node: Any):
+    """Recursively adapt a JSON schema to OpenAI strict structured output rules"""
+    if isinstance(node, dict):
+        node.pop("default", None)
+        if node.get("type") == "object" and "properties" in node:
+            node["additionalProperties"] = False
+            node["required"] = list(node["properties"])
+        for value in node.values():
+            _make_strict(value)
+    elif isinstance(node, list):
+        for item in node:
+            _make_strict(item)
+
+def strict_json_schema(model: Type[BaseModel], exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """JSON schema for a Pydantic model in OpenAI strict mode, without the excluded fields"""
+    schema = copy.deepcopy(model.model_json_schema())
+    for field in exclude:
+        schema.get("properties", {}).pop(field, None)
+    _make_strict(schema)
+    return schema
+
+def json_schema_response_format(
+    model: Type[BaseModel],
+    exclude: Iterable[str] = ()
+) -> Dict[str, Any]:
+    """OpenAI response_format requesting output that matches a Pydantic model"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "schema": strict_json_schema(model, exclude),
+            "strict": True
+        }
+    }
+
+class BatchItemOutput(BaseModel):
+    index: int
+    content: str
+
+class BatchCompletion(BaseModel):
+    results: List[BatchItemOutput]
+
+class BatchItemResult(BaseModel):
+    index: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
+    count: int
+    succeeded: int
+    failed: int
+    upstream_calls: int
 
 class ErrorResponse(BaseModel):
     error: str
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple
+from governor import TokenBucket
+from metrics import MetricsRegistry
+from ranking import shingles, similarity
+
+class Speculation:
+    """A follow-up result being generated ahead of the call that will ask for it"""
+    
+    __slots__ = ("task", "grams", "params", "created_at", "cost")
+    
+    def __init__(self, task: asyncio.Task, text: str, params: Dict[str, Any], cost: int):
+        self.task = task
+        self.grams = shingles(text)
+        self.params = params
+        self.created_at = time.monotonic()
+        self.cost = cost
+
+def speculation_key(session: str, tool: str, text: str, params: Dict[str, Any]) -> Tuple[str, str, str]:
+    """(session, tool, digest of the whitespace- and case-normalized text and the arguments)"""
+    payload = json.dumps([" ".join(text.lower().split()), params], sort_keys=True, default=str)
+    return session, tool, hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+class SpeculativePrefetcher:
+    """Per-session prefetch of the likely next tool call
+    
+    After a screenshot analysis the server starts the follow-up (openers for
+    a profile, a reply to their last message) in the background, keyed by
+    session, tool and a digest of its input. A later call to that tool in
+    the session claims it only if its input matches: the same digest, or
+    the same arguments and text within match_threshold shingle similarity
+    (small OCR differences). A finished result is served at once, an
+    in-flight one is joined. Callers sharing a session key (one bearer token
+    over stateless HTTP) therefore neither overwrite nor consume each
+    other's speculations. Speculative spend is capped by a per-minute token
+    bucket, nothing starts while busy() says the server is loaded, and
+    unclaimed work is cancelled after ttl seconds or when max_entries is
+    exceeded.
+    """
+    
+    def __init__(
+        self,
+        tokens_per_minute: float = 20000,
+        ttl: float = 300,
+        match_threshold: float = 0.8,
+        max_entries: int = 1000,
+        busy: Optional[Callable[[], bool]] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.budget = TokenBucket(tokens_per_minute)
+        self.ttl = ttl
+        self.match_threshold = match_threshold
+        self.max_entries = max_entries
+        self.busy = busy
+        self.metrics = metrics
+        self._entries: "OrderedDict[Tuple[str, str, str], Speculation]" = OrderedDict()
+        self.started = 0
+        self.hits = 0
+        self.joined = 0
+        self.misses = 0
+        self.wasted_tokens = 0
+    
+    def _record(self, tool: str, outcome: str):
+        if self.metrics is not None:
+            self.metrics.record_speculation(tool, outcome)
+    
+    def _discard(self, key: Tuple[str, str, str], outcome: str):
+        """Drop an entry, cancelling it if still running, and count its spend as wasted"""
+        entry = self._entries.pop(key)
+        entry.task.cancel()
+        self.wasted_tokens += entry.cost
+        self._record(key[1], outcome)
+    
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, entry in self._entries.items() if entry.created_at < cutoff]:
+            self._discard(key, "expired")
+    
+    def start(
+        self,
+        session: Optional[str],
+        tool: str,
+        text: str,
+        params: Dict[str, Any],
+        cost: int,
+        run: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> bool:
+        """Start generating a tool's result for a session in the background; False if skipped"""
+        if not session or not text:
+            return False
+        self._expire()
+        if self.busy is not None and self.busy():
+            self._record(tool, "skipped_busy")
+            return False
+        if self.budget.try_acquire(cost) > 0:
+            self._record(tool, "skipped_budget")
+            return False
+        
+        key = speculation_key(session, tool, text, params)
+        if key in self._entries:
+            self._discard(key, "replaced")
+        while len(self._entries) >= self.max_entries:
+            self._discard(next(iter(self._entries)), "evicted")
+        
+        task = asyncio.ensure_future(run())
+        # Retrieve a failure here so an unclaimed one isn't logged as never retrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._entries[key] = Speculation(task, text, params, cost)
+        self.started += 1
+        self._record(tool, "started")
+        return True
+    
+    async def claim(
+        self,
+        session: Optional[str],
+        tool: str,
+        text: str,
+        params: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """The prefetched result for this call, waiting for it if still running; None on a miss"""
+        if not session:
+            return None
+        self._expire()
+        key = speculation_key(session, tool, text, params)
+        entry = self._entries.get(key)
+        if entry is None:
+            # Nearly the same text (re-extracted, lightly edited) with the same arguments
+            grams = shingles(text)
+            for other_key, other in self._entries.items():
+                if (
+                    other_key[:2] == key[:2]
+                    and other.params == params
+                    and similarity(other.grams, grams) >= self.match_threshold
+                ):
+                    key, entry = other_key, other
+                    break
+        if entry is None:
+            # Left for whoever it was started for; expires if nobody claims it
+            self.misses += 1
+            self._record(tool, "miss")
+            return None
+        
+        del self._entries[key]
+        outcome = "hit" if entry.task.done() else "joined"
+        try:
+            result = await entry.task
+        except Exception:
+            self.misses += 1
+            self._record(tool, "failed")
+            return None
+        
+        if outcome == "hit":
+            self.hits += 1
+        else:
+            self.joined += 1
+        self._record(tool, outcome)
+        return result
+    
+    def cancel_all(self):
+        """Cancel every pending speculation (server shutdown)"""
+        for key in list(self._entries):
+            self._discard(key, "cancelled")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get speculation counts, hit rate and wasted token estimate"""
+        claimed = self.hits + self.joined
+        # Refill so the available budget is current
+        self.budget.try_acquire(0)
+        return {
+            "pending": len(self._entries),
+            "started": self.started,
+            "hits": self.hits,
+            "joined": self.joined,
+            "misses": self.misses,
+            "hit_rate": claimed / self.started if self.started else 0.0,
+            "wasted_tokens": self.wasted_tokens,
+            "budget_tokens_available": self.budget.tokens if self.budget.per_minute > 0 else 0
+        }
+
+def create_prefetcher(
+    busy: Optional[Callable[[], bool]] = None,
+    metrics: Optional[MetricsRegistry] = None
+) -> SpeculativePrefetcher:
+    """Create the speculative prefetcher configured by the environment"""
+    return SpeculativePrefetcher(
+        tokens_per_minute=float(os.getenv("SPECULATIVE_TOKENS_PER_MINUTE", 20000)),
+        ttl=float(os.getenv("SPECULATIVE_TTL", 300)),
+        match_threshold=float(os.getenv("SPECULATIVE_MATCH_THRESHOLD", 0.8)),
+        max_entries=int(os.getenv("SPECULATIVE_MAX_ENTRIES", 1000)),
+        busy=busy,
+        metrics=metrics
+    )
@@ -0,0 +1,137 @@
+import re
+import json
+from typing import Optional, Dict, Any, Tuple, Type, Iterable
+from pydantic import BaseModel, ValidationError
+from governor import DeadlineExceeded, get_status_code, is_overload
+
+# Failure kinds where asking the model again can produce a different outcome.
+# Rate limits, timeouts and 5xx are already retried by the governor, so
+# retrying them here would only multiply the load on a struggling upstream.
+RETRYABLE_KINDS = {"unsupported_format", "parse", "validation"}
+
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_DANGLING_KEY = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?$')
+
+class StructuredOutputError(Exception):
+    """Raised when no valid structured response could be produced"""
+    
+    def __init__(self, kind: str, message: str, content: Optional[str] = None):
+        super().__init__(f"Structured output failed ({kind}): {message}")
+        self.kind = kind
+        self.content = content
+
+def classify_failure(error: Exception) -> str:
+    """Name the reason a structured request failed"""
+    if isinstance(error, StructuredOutputError):
+        return error.kind
+    if isinstance(error, DeadlineExceeded):
+        return "deadline"
+    if isinstance(error, ValidationError):
+        return "validation"
+    if isinstance(error, json.JSONDecodeError):
+        return "parse"
+    
+    status = get_status_code(error)
+    if status == 400 and "response_format" in str(error):
+        return "unsupported_format"
+    if status == 429:
+        return "rate_limited"
+    if is_overload(error):
+        return "timeout"
+    if status is not None and status >= 500:
+        return "upstream"
+    if status is not None:
+        return "bad_request"
+    return "unknown"
+
+def _close_json(text: str) -> Tuple[str, bool]:
+    """Close unterminated strings, objects and arrays of truncated JSON"""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    
+    if not in_string and not stack:
+        return text, False
+    
+    if in_string:
+        text = text[:-1] if escaped else text
+        text += '"'
+    text = text.rstrip()
+    
+    # Drop an object key that never got its value, then any dangling separator
+    if stack and stack[-1] == "}":
+        text = _DANGLING_KEY.sub(r"\1", text)
+    text = text.rstrip().rstrip(",:")
+    return text + "".join(reversed(stack)), True
+
+def repair_json(content: str) -> Tuple[Any, bool]:
+    """Parse model output as JSON, repairing common defects locally
+    
+    Handles code fences, prose around the payload, trailing commas and
+    output cut off by max_tokens. Returns (value, repaired) and raises
+    StructuredOutputError when nothing usable is left.
+    """
+    try:
+        return json.loads(content), False
+    except (TypeError, json.JSONDecodeError):
+        pass
+    
+    if not content:
+        raise StructuredOutputError("empty", "Model returned no content", content)
+    
+    text = _CODE_FENCE.sub("", content.strip())
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        raise StructuredOutputError("parse", "No JSON object in model output", content)
+    
+    text = _TRAILING_COMMA.sub(r"\1", text[min(starts):])
+    for candidate in (text, text[:max(text.rfind("}"), text.rfind("]")) + 1]):
+        try:
+            return json.loads(candidate), True
+        except json.JSONDecodeError:
+            pass
+    
+    closed, truncated = _close_json(text)
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", closed)), True
+    except json.JSONDecodeError as e:
+        kind = "truncated" if truncated else "parse"
+        raise StructuredOutputError(kind, f"Could not repair JSON: {e.msg}", content)
+
+def parse_structured(
+    content: str,
+    response_model: Optional[Type[BaseModel]] = None,
+    exclude: Iterable[str] = ()
+) -> Tuple[Dict[str, Any], bool]:
+    """Repair and validate model output, returning (data, repaired)"""
+    data, repaired = repair_json(content)
+    if response_model is None:
+        if not isinstance(data, dict):
+            raise StructuredOutputError("validation", "Expected a JSON object", content)
+        return data, repaired
+    
+    try:
+        return response_model.model_validate(data).model_dump(exclude=set(exclude)), repaired
+    except ValidationError as e:
+        raise StructuredOutputError("validation", f"{e.error_count()} schema errors", content) from e
+
+def downgrade_response_format(response_format: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Next weaker response_format for models that reject the current one"""
+    if response_format and response_format.get("type") == "json_schema":
+        return {"type": "json_object"}
+    return None
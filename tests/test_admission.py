@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from admission import AdmissionController, AdmissionMiddleware, AdmissionQueue, AdmissionRejected
+from metrics import MetricsRegistry
+
+async def _serve_order(queue: AdmissionQueue, calls):
+    """Names of queued calls in the order they get the single slot"""
+    order = []
+    await queue.acquire("holder", 0)
+    
+    async def call(name, token, priority):
+        await queue.acquire(token, priority)
+        order.append(name)
+        queue.release(0.01)
+    
+    tasks = []
+    for name, token, priority in calls:
+        tasks.append(asyncio.create_task(call(name, token, priority)))
+        # Let each waiter queue before the next one arrives
+        await asyncio.sleep(0)
+    queue.release(0.01)
+    await asyncio.gather(*tasks)
+    return order
+
+def test_higher_priority_runs_first():
+    queue = AdmissionQueue("text", concurrency=1, max_queue=10)
+    order = asyncio.run(_serve_order(queue, [("batch", "a", 2), ("bio", "a", 1), ("reply", "a", 0)]))
+    assert order == ["reply", "bio", "batch"]
+
+def test_round_robin_between_tokens_within_a_priority():
+    queue = AdmissionQueue("text", concurrency=1, max_queue=10)
+    calls = [("a1", "a", 0), ("a2", "a", 0), ("a3", "a", 0), ("b1", "b", 0), ("c1", "c", 0)]
+    order = asyncio.run(_serve_order(queue, calls))
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+    assert queue.running == 0 and queue.queued == 0
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def run():
+        queue = AdmissionQueue("text", concurrency=1, max_queue=1)
+        queue.service_time = 3.0
+        await queue.acquire("a", 0)
+        waiter = asyncio.create_task(queue.acquire("b", 0))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire("c", 0)
+        queue.release(1.0)
+        await waiter
+        return rejected.value
+    
+    rejected = asyncio.run(run())
+    assert rejected.reason == "full"
+    # One call queued ahead on one slot: 2 service times
+    assert rejected.retry_after == pytest.approx(6.0)
+
+def test_overloaded_queue_is_shed_on_estimated_wait():
+    async def run():
+        queue = AdmissionQueue("text", concurrency=1, max_queue=10, max_estimated_wait=5.0)
+        queue.service_time = 8.0
+        await queue.acquire("a", 0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire("b", 0)
+        assert queue.queued == 0
+        return rejected.value
+    
+    rejected = asyncio.run(run())
+    assert rejected.reason == "overloaded"
+    assert rejected.retry_after == pytest.approx(8.0)
+
+def test_queued_call_times_out_and_gives_up_its_place():
+    async def run():
+        queue = AdmissionQueue("text", concurrency=1, max_queue=10, max_wait=0.05)
+        await queue.acquire("a", 0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire("b", 0)
+        assert queue.queued == 0
+        queue.release(0.1)
+        assert queue.running == 0
+        return rejected.value
+    
+    rejected = asyncio.run(run())
+    assert rejected.reason == "timeout"
+    assert rejected.retry_after >= 1.0
+
+def test_middleware_turns_shedding_into_tool_error():
+    fastmcp = pytest.importorskip("fastmcp")
+    from fastmcp.exceptions import ToolError
+    
+    metrics = MetricsRegistry()
+    queue = AdmissionQueue("text", concurrency=1, max_queue=0)
+    controller = AdmissionController({"text": queue}, tool_admission={}, metrics=metrics)
+    server = fastmcp.FastMCP("admission-test")
+    server.add_middleware(AdmissionMiddleware(controller))
+    
+    @server.tool()
+    async def echo(text: str) -> str:
+        return text
+    
+    async def run():
+        async with fastmcp.Client(server) as client:
+            assert (await client.call_tool("echo", {"text": "hi"})).data == "hi"
+            # Busy slot, nothing may queue, one call takes 7.4s
+            queue.running = 1
+            queue.service_time = 7.4
+            with pytest.raises(ToolError) as error:
+                await client.call_tool("echo", {"text": "hi"})
+            return str(error.value)
+    
+    message = asyncio.run(run())
+    assert message == "Server busy (text queue full), retry after 7s"
+    assert metrics.admission_requests[("text", "admitted")] == 1
+    assert metrics.admission_requests[("text", "full")] == 1
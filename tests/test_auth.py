@@ -0,0 +1,108 @@
+import os
+import json
+import asyncio
+from types import SimpleNamespace
+import pytest
+from auth import TokenRecord, TokenRegistry, hash_token
+
+def _write_tokens(path, entries):
+    with open(path, "w") as f:
+        json.dump({"tokens": entries}, f)
+
+def test_rate_limit_rejects_with_retry_after():
+    record = TokenRecord(hash_token("t"), "client", requests_per_minute=2)
+    assert record.check() == (True, None, 0.0)
+    assert record.check() == (True, None, 0.0)
+    allowed, reason, retry_after = record.check()
+    assert (allowed, reason) == (False, "rate_limit")
+    # One request refills every 30s
+    assert 29 < retry_after <= 30
+
+def test_daily_quota_blocks_until_midnight_and_resets_next_day():
+    record = TokenRecord(hash_token("t"), "client", daily_tokens=1000)
+    record.charge(600)
+    assert record.check()[0]
+    record.charge(600)
+    allowed, reason, retry_after = record.check()
+    assert (allowed, reason) == (False, "daily_quota")
+    assert 0 < retry_after <= 86400
+    
+    record.day = "2000-01-01"
+    assert record.check() == (True, None, 0.0)
+    assert record.used_tokens == 0
+
+def test_zero_limits_are_disabled():
+    record = TokenRecord(hash_token("t"), "client")
+    record.charge(10 ** 9)
+    assert all(record.check()[0] for _ in range(1000))
+
+def test_registry_stores_only_digests():
+    registry = TokenRegistry(default_tokens=["secret"])
+    assert registry.lookup("secret") is not None
+    assert registry.lookup("Secret") is None
+    assert registry.lookup("") is None
+    assert "secret" not in registry._records
+    assert hash_token("secret") in registry._records
+
+def test_hot_reload_replaces_tokens_and_keeps_usage(tmp_path):
+    path = tmp_path / "tokens.json"
+    _write_tokens(path, [
+        {"token": "alpha", "name": "alpha", "daily_tokens": 100},
+        {"sha256": hash_token("beta").upper(), "name": "beta"},
+    ])
+    registry = TokenRegistry(path=str(path), reload_interval=0)
+    assert registry.lookup("beta").name == "beta"
+    registry.lookup("alpha").charge(70)
+    
+    _write_tokens(path, [{"token": "alpha", "name": "alpha", "daily_tokens": 100}, {"token": "gamma"}])
+    os.utime(path, ns=(1, 1))
+    assert registry.lookup("beta") is None
+    assert registry.lookup("gamma") is not None
+    assert registry.lookup("alpha").used_tokens == 70
+    assert registry.stats() == {"tokens": 2, "reloads": 2}
+
+def test_invalid_token_file_keeps_the_old_set(tmp_path):
+    path = tmp_path / "tokens.json"
+    _write_tokens(path, [{"token": "alpha"}])
+    registry = TokenRegistry(path=str(path), reload_interval=0)
+    
+    path.write_text("{not json")
+    assert registry.lookup("alpha") is not None
+    assert registry.reloads == 1
+
+def _request(path, token=None):
+    headers = {"authorization": f"Bearer {token}"} if token else {}
+    return SimpleNamespace(headers=headers, url=SimpleNamespace(path=path))
+
+def test_http_auth_401_and_429(monkeypatch):
+    pytest.importorskip("fastmcp")
+    import mcp_server
+    from metrics import MetricsRegistry
+    from starlette.responses import PlainTextResponse
+    
+    registry = TokenRegistry()
+    registry.add("limited", name="limited", requests_per_minute=1)
+    registry.add("spent", name="spent", daily_tokens=10).charge(10)
+    metrics = MetricsRegistry()
+    monkeypatch.setattr(mcp_server, "token_registry", registry)
+    monkeypatch.setattr(mcp_server, "metrics", metrics)
+    
+    async def call_next(request):
+        return PlainTextResponse("ok")
+    
+    def status(request):
+        response = asyncio.run(mcp_server.auth_middleware(request, call_next))
+        return response.status_code, response.headers.get("retry-after")
+    
+    assert status(_request("/mcp"))[0] == 401
+    assert status(_request("/mcp", "unknown"))[0] == 401
+    assert status(_request("/health")) == (200, None)
+    assert status(_request("/metrics")) == (200, None)
+    
+    assert status(_request("/mcp", "limited")) == (200, None)
+    code, retry_after = status(_request("/mcp", "limited"))
+    assert code == 429 and 59 <= int(retry_after) <= 60
+    code, retry_after = status(_request("/mcp", "spent"))
+    assert code == 429 and 1 <= int(retry_after) <= 86400
+    assert metrics.auth_rejections[("limited", "rate_limit")] == 1
+    assert metrics.auth_rejections[("spent", "daily_quota")] == 1
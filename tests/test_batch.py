@@ -0,0 +1,72 @@
+import re
+import json
+import asyncio
+from types import SimpleNamespace
+import pytest
+
+mcp_server = pytest.importorskip("mcp_server")
+
+def _response(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))]), "model"
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake completions: packed requests answer out of order and skip the item mentioning 'skip'"""
+    calls = []
+    
+    async def routed_create(tool, messages, max_tokens, temperature, default_tier="quality", **kwargs):
+        prompt = messages[-1]["content"]
+        calls.append(tool)
+        if tool.startswith("batch_"):
+            items = re.findall(r"^\[(\d+)\] (.*)$", prompt, re.MULTILINE)
+            results = [{"index": int(index), "content": f"packed reply to {text}"} for index, text in items if "skip" not in text]
+            return _response(json.dumps({"results": results[::-1]}))
+        return _response(f"single reply to {prompt.splitlines()[-1]}")
+    
+    monkeypatch.setattr(mcp_server.llm, "_routed_create", routed_create)
+    monkeypatch.setattr(mcp_server, "BATCH_PACK_SIZE", 3)
+    return calls
+
+def _batch_reply(messages, fresh=False):
+    return asyncio.run(mcp_server.batch_reply(messages, fresh=fresh))
+
+def test_pack_batch_groups_short_items_and_isolates_long_ones(monkeypatch):
+    monkeypatch.setattr(mcp_server, "BATCH_PACK_SIZE", 2)
+    monkeypatch.setattr(mcp_server, "BATCH_PACK_MAX_CHARS", 10)
+    items = ["a", "b", "x" * 11, "c", "d", "e"]
+    assert mcp_server._pack_batch(items) == [[0, 1], [2], [3, 4], [5]]
+
+def test_packed_results_are_reordered_and_missing_items_run_alone(upstream):
+    messages = ["tacos tonight?", "please skip me", "hiking sunday", "nice dog"]
+    data = _batch_reply(messages, fresh=True)
+    
+    assert [item["index"] for item in data["results"]] == [0, 1, 2, 3]
+    replies = [item["result"]["suggested_reply"] for item in data["results"]]
+    assert replies[0] == "packed reply to tacos tonight?"
+    assert replies[2] == "packed reply to hiking sunday"
+    assert replies[1].startswith("single reply to") and "please skip me" in replies[1]
+    # One pack of three, its skipped item alone, and the fourth item alone
+    assert upstream.count("batch_reply") == 1
+    assert upstream.count("reply") == 2
+    assert data["upstream_calls"] == 3
+    assert data["succeeded"] == 4 and data["failed"] == 0
+
+def test_cached_results_are_not_upstream_calls(upstream):
+    messages = ["coffee or tea?", "favorite hike nearby?"]
+    first = _batch_reply(messages)
+    second = _batch_reply(messages)
+    
+    assert first["upstream_calls"] == 1
+    assert second["upstream_calls"] == 0
+    assert second["results"] == first["results"]
+    assert len(upstream) == 1
+
+def test_failed_pack_reports_errors_per_item(monkeypatch):
+    async def routed_create(tool, messages, max_tokens, temperature, default_tier="quality", **kwargs):
+        raise RuntimeError("upstream down")
+    
+    monkeypatch.setattr(mcp_server.llm, "_routed_create", routed_create)
+    monkeypatch.setattr(mcp_server.llm, "structured_max_retries", 0)
+    data = _batch_reply(["one", "two"], fresh=True)
+    assert data["failed"] == 2
+    assert all("upstream down" in item["error"] for item in data["results"])
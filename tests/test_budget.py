@@ -0,0 +1,26 @@
+import pytest
+from budget import CONVERSATION_FIELDS, InputBudget, keep_recent
+
+CHAT = "\n".join(f"them: message number {index} about tacos and hiking" for index in range(50))
+
+@pytest.mark.parametrize("max_chars", [0, 1, 10, 32, 33, 40, 100, 500])
+def test_keep_recent_stays_within_budget(max_chars):
+    assert len(keep_recent(CHAT, max_chars)) <= max_chars
+
+def test_keep_recent_keeps_latest_messages():
+    kept = keep_recent(CHAT, 200)
+    assert kept.startswith("[")
+    assert kept.endswith("message number 49 about tacos and hiking")
+
+def test_keep_recent_single_long_message():
+    kept = keep_recent("word " * 100, 60)
+    assert len(kept) <= 60
+    assert kept.startswith("...")
+
+def test_context_keeps_its_beginning():
+    assert "context" not in CONVERSATION_FIELDS
+    budget = InputBudget({"analyze_conversation_screenshot": 20})
+    context = "Always answer in Spanish. " + "filler " * 100 + "Keep it short."
+    fields, info = budget.fit("analyze_conversation_screenshot", context=context)
+    assert fields["context"].startswith("Always answer in Spanish.")
+    assert info["truncated"] == ["context"]
@@ -0,0 +1,60 @@
+import time
+import sqlite3
+import pytest
+from cache import LRUCache, PerceptualHashIndex, ResponseCache, SQLiteCache
+
+def test_response_cache_is_abstract():
+    with pytest.raises(TypeError):
+        ResponseCache()
+
+def test_lru_cache_round_trip():
+    cache = LRUCache(max_entries=1)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") == (False, None)
+    assert cache.get("b") == (True, 2)
+
+def test_sqlite_write_lock_is_skipped_not_waited_for(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SQLiteCache(path, busy_timeout=0.05)
+    cache.set("stored", {"text": "hi"}, ttl=60)
+    
+    # Another process holding the write lock
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.monotonic()
+        cache.set("new", "value", ttl=60)
+        cache.evict()
+        assert time.monotonic() - start < 1.0
+        assert cache.contended == 2
+        # WAL readers aren't blocked by the writer
+        assert cache.get("stored") == (True, {"text": "hi"})
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    
+    assert cache.get("new") == (False, None)
+    cache.set("new", "value", ttl=60)
+    assert cache.get("new") == (True, "value")
+    assert cache.stats()["contended"] == 2
+    cache.close()
+
+def test_phash_index_updates_identical_hash_in_place():
+    index = PerceptualHashIndex(max_entries=8)
+    phash = (1 << 200) | 12345
+    for version in range(5):
+        index.add(phash, "conversation", {"version": version})
+    index.add(phash, "profile", {"version": "other group"})
+    
+    assert len(index) == 2
+    assert index.lookup(phash, "conversation")["value"] == {"version": 4}
+    assert index.stats()["evictions"] == 0
+
+def test_phash_index_evicts_least_recently_used_when_full():
+    index = PerceptualHashIndex(max_entries=2)
+    for phash in (1, 2, 3):
+        index.add(phash << 100, "group", phash)
+    
+    assert len(index) == 2
+    assert index.stats()["evictions"] == 1
@@ -0,0 +1,89 @@
+import io
+import json
+import base64
+import asyncio
+import pytest
+from PIL import Image, ImageDraw
+from conversation_memory import ConversationMemory, merge_messages
+
+ALICE = [
+    {"sender": "them", "text": "Hey Alice here, loved your hiking photos"},
+    {"sender": "me", "text": "Thanks! Which trail do you like best?"},
+    {"sender": "them", "text": "Probably the one up to the lighthouse"},
+]
+ALICE_NEXT = ALICE[1:] + [{"sender": "me", "text": "Want to walk it this weekend?"}]
+BOB = [
+    {"sender": "them", "text": "Bob here, do you play any instruments?"},
+    {"sender": "me", "text": "Only a little guitar, you?"},
+]
+
+def test_overlapping_screenshot_keeps_only_new_messages():
+    new, duplicates = merge_messages(ALICE, ALICE_NEXT)
+    assert duplicates == 2
+    assert new == ALICE_NEXT[2:]
+
+def test_unrelated_chat_resets_the_session():
+    memory = ConversationMemory()
+    memory.update("token|", ALICE, "Alice and I talk about hiking")
+    merged = memory.update("token|", BOB, "Bob asks about instruments")
+    
+    assert merged["reset"]
+    assert memory.messages("token|") == BOB
+    text, _ = memory.prompt_context("token|")
+    assert "Alice" not in text
+    assert memory.stats()["resets"] == 1
+
+def test_continuation_builds_the_thread():
+    memory = ConversationMemory()
+    memory.update("c", ALICE, "Hiking chat")
+    merged = memory.update("c", ALICE_NEXT, "Hiking chat, planning a walk")
+    
+    assert not merged["reset"]
+    assert [message["text"] for message in merged["new"]] == ["Want to walk it this weekend?"]
+    assert len(memory.messages("c")) == 4
+
+def _screenshot(label: str) -> str:
+    image = Image.new("RGB", (400, 800), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for row in range(6):
+        left = 20 if (row + len(label)) % 2 else 180
+        draw.rounded_rectangle((left, 100 + row * 110, left + 200, 180 + row * 110), 20, fill=(40 * row, 120, 200))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def test_two_unrelated_chats_in_a_row_do_not_share_memory(monkeypatch):
+    fastmcp = pytest.importorskip("fastmcp")
+    import mcp_server
+    
+    prompts = []
+    chats = iter([(ALICE, "Alice and I talk about hiking"), (BOB, "Bob asks about instruments")])
+    
+    async def analyze_image(image_data, prompt, **kwargs):
+        prompts.append(prompt)
+        messages, summary = next(chats)
+        return json.dumps({
+            "extracted_messages": messages,
+            "conversation_summary": summary,
+            "suggested_replies": [],
+            "conversation_analysis": "",
+            "next_step_advice": ""
+        })
+    
+    monkeypatch.setattr(mcp_server, "STREAMING_ENABLED", False)
+    monkeypatch.setattr(mcp_server.llm, "analyze_image", analyze_image)
+    
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            results = []
+            for label in ("alice", "bob"):
+                result = await client.call_tool(
+                    "analyze_conversation_screenshot", {"image_data": _screenshot(label), "fresh": True}
+                )
+                results.append(result.structured_content)
+            return results
+    
+    alice, bob = asyncio.run(run())
+    assert "error" not in bob
+    assert "Alice" not in prompts[1]
+    assert [message["text"] for message in bob["extracted_messages"]] == [message["text"] for message in BOB]
@@ -0,0 +1,180 @@
+import time
+import asyncio
+from types import SimpleNamespace
+import pytest
+from governor import AdaptiveConcurrencyLimiter, DeadlineExceeded, RateGovernor
+
+class FakeAPIError(Exception):
+    """What the OpenAI SDK raises for an HTTP error response"""
+    
+    def __init__(self, status_code: int, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+class FakeServer:
+    """Answers requests from a script of errors, then succeeds"""
+    
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.requests = 0
+    
+    async def request(self):
+        self.requests += 1
+        await asyncio.sleep(0)
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+class FakeStream:
+    """Streamed completion: content chunks, then a usage chunk"""
+    
+    def __init__(self, chunks: int = 3, total_tokens: int = 100, delay: float = 0):
+        self.chunks = chunks
+        self.total_tokens = total_tokens
+        self.delay = delay
+        self.closed = False
+    
+    async def _generate(self):
+        for _ in range(self.chunks):
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content="hi"))])
+        yield SimpleNamespace(usage=SimpleNamespace(total_tokens=self.total_tokens), choices=[])
+    
+    def __aiter__(self):
+        return self._generate()
+    
+    async def close(self):
+        self.closed = True
+
+def test_429_retries_with_retry_after():
+    server = FakeServer([FakeAPIError(429, {"retry-after-ms": "50"}), FakeAPIError(429, {"retry-after-ms": "50"})])
+    governor = RateGovernor(max_retries=3, backoff_base=0.001)
+    
+    start = time.monotonic()
+    assert asyncio.run(governor.call(server.request, 10)) == "ok"
+    assert time.monotonic() - start >= 0.1
+    assert server.requests == 3
+    assert governor.retries == 2
+    assert governor.rate_limited == 2
+
+def test_429_gives_up_after_max_retries():
+    server = FakeServer([FakeAPIError(429)] * 3)
+    governor = RateGovernor(max_retries=1, backoff_base=0.001)
+    
+    with pytest.raises(FakeAPIError):
+        asyncio.run(governor.call(server.request, 10))
+    assert server.requests == 2
+
+def test_non_retryable_error_fails_fast():
+    server = FakeServer([FakeAPIError(400)])
+    governor = RateGovernor(max_retries=3)
+    
+    with pytest.raises(FakeAPIError):
+        asyncio.run(governor.call(server.request, 10))
+    assert server.requests == 1
+
+def test_aimd_halves_once_per_congestion_window():
+    limiter = AdaptiveConcurrencyLimiter(initial=8)
+    governor = RateGovernor(max_retries=0, limiter=limiter)
+    
+    async def burst():
+        servers = [FakeServer([FakeAPIError(429)]) for _ in range(3)]
+        return await asyncio.gather(*(governor.call(server.request, 10) for server in servers), return_exceptions=True)
+    
+    results = asyncio.run(burst())
+    assert all(isinstance(result, FakeAPIError) for result in results)
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+def test_aimd_increases_on_fast_success():
+    limiter = AdaptiveConcurrencyLimiter(initial=4)
+    governor = RateGovernor(limiter=limiter)
+    
+    asyncio.run(governor.call(FakeServer().request, 10))
+    assert limiter.limit == pytest.approx(4.25)
+
+def test_stream_holds_slot_until_exhausted_and_settles_tokens():
+    governor = RateGovernor(tokens_per_minute=6000)
+    stream = FakeStream(total_tokens=100)
+    
+    async def run():
+        async def request():
+            return stream
+        
+        governed = await governor.call(request, 1000, stream=True)
+        assert governor.limiter.in_flight == 1
+        chunks = [chunk async for chunk in governed]
+        assert governor.limiter.in_flight == 0
+        return chunks
+    
+    assert len(asyncio.run(run())) == 4
+    # 1000 estimated, 100 used: the difference is refunded
+    assert governor.tokens.tokens == pytest.approx(5900, abs=1)
+
+def test_abandoned_stream_releases_slot():
+    governor = RateGovernor(tokens_per_minute=6000)
+    stream = FakeStream()
+    
+    async def run():
+        async def request():
+            return stream
+        
+        governed = await governor.call(request, 1000, stream=True)
+        await governed.__anext__()
+        await governed.aclose()
+        assert governor.limiter.in_flight == 0
+    
+    asyncio.run(run())
+    assert stream.closed
+    # No usage arrived, so the estimate stays charged
+    assert governor.tokens.tokens == pytest.approx(5000, abs=1)
+
+def test_stream_deadline_covers_body():
+    governor = RateGovernor(deadline=0.1)
+    stream = FakeStream(chunks=10, delay=0.05)
+    
+    async def run():
+        async def request():
+            return stream
+        
+        governed = await governor.call(request, 10, stream=True)
+        async for _ in governed:
+            pass
+    
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert governor.limiter.in_flight == 0
+    assert governor.deadline_exceeded == 1
+    assert stream.closed
+
+def test_queue_timeout_refunds_tokens():
+    limiter = AdaptiveConcurrencyLimiter(initial=1)
+    governor = RateGovernor(tokens_per_minute=6000, deadline=0.05, limiter=limiter)
+    
+    async def run():
+        await limiter.acquire()
+        with pytest.raises(DeadlineExceeded):
+            await governor.call(FakeServer().request, 1000)
+    
+    asyncio.run(run())
+    assert governor.tokens.tokens == pytest.approx(6000, abs=1)
+    assert governor.deadline_exceeded == 1
+
+def test_retries_charge_the_estimate_once():
+    server = FakeServer([FakeAPIError(500), FakeAPIError(502), FakeAPIError(503)])
+    governor = RateGovernor(tokens_per_minute=6000, max_retries=3, backoff_base=0.001)
+    
+    assert asyncio.run(governor.call(server.request, 1000)) == "ok"
+    assert server.requests == 4
+    # Left for settle() to adjust once the usage is known
+    assert governor.tokens.tokens == pytest.approx(5000, abs=1)
+
+def test_failed_call_refunds_its_estimate():
+    server = FakeServer([FakeAPIError(500)] * 3)
+    governor = RateGovernor(tokens_per_minute=6000, max_retries=2, backoff_base=0.001)
+    
+    with pytest.raises(FakeAPIError):
+        asyncio.run(governor.call(server.request, 1000))
+    assert server.requests == 3
+    assert governor.tokens.tokens == pytest.approx(6000, abs=1)
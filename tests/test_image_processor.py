@@ -0,0 +1,108 @@
+import io
+import base64
+import random
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from benchmarks.image_crop import THEMES, conversation_screenshot, corpus, encode
+from image_processor import BUBBLE_TILE_GAP, ImageProcessor, color_mask, dominant_color, find_bubbles, tile_bubbles
+
+@pytest.mark.parametrize("theme", list(THEMES))
+@pytest.mark.parametrize("size", [(390, 844), (1170, 2532)])
+def test_never_sends_more_bytes_than_the_upload(theme, size):
+    processor = ImageProcessor(crop=True, segment_bubbles=True)
+    for seed in range(3):
+        image, _ = conversation_screenshot(random.Random(seed), theme, keyboard=seed == 1, width=size[0], height=size[1])
+        prepared = processor.prepare_for_vision(encode(image), segment=True)
+        metadata = prepared["metadata"]
+        assert metadata["sent_bytes"] <= metadata["original_bytes"]
+        assert len(base64.b64decode(prepared["image_data"])) == metadata["sent_bytes"]
+        sent = Image.open(io.BytesIO(base64.b64decode(prepared["image_data"])))
+        assert list(sent.size) == metadata["sent_size"]
+        assert Image.MIME[sent.format] == prepared["mime_type"]
+
+def test_small_png_crop_stays_lossless():
+    image, _ = conversation_screenshot(random.Random(3), "light", keyboard=False, width=390, height=844)
+    prepared = ImageProcessor(crop=True, segment_bubbles=True).prepare_for_vision(encode(image), segment=True)
+    assert prepared["mime_type"] == "image/png"
+    assert prepared["metadata"]["crop_box"] is not None
+    assert prepared["metadata"]["vision_tokens"] < prepared["metadata"]["vision_tokens_uncropped"]
+
+# (left, top, right, bottom) of the chat bubbles drawn by _chat, top to bottom
+BUBBLES = [(20, 120, 220, 180), (180, 200, 380, 260), (20, 280, 200, 340)]
+
+def _chat(dark: bool = False, timestamp: bool = False) -> Image.Image:
+    """400x800 chat: header and divider, three bubbles, divider and keyboard"""
+    background, header, theirs, mine, keys = (
+        ((0, 0, 0), (22, 22, 24), (38, 38, 40), (10, 132, 255), (40, 40, 42)) if dark else
+        ((255, 255, 255), (230, 230, 235), (233, 233, 235), (50, 130, 246), (209, 211, 217))
+    )
+    image = Image.new("RGB", (400, 800), background)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 399, 79), fill=header)
+    draw.rectangle((0, 80, 399, 81), fill=(128, 128, 128))
+    for index, (left, top, right, bottom) in enumerate(BUBBLES):
+        draw.rectangle((left, top, right - 1, bottom - 1), fill=mine if index == 1 else theirs)
+    if timestamp:
+        draw.rectangle((150, 100, 249, 109), fill=(142, 142, 147))
+    draw.rectangle((0, 700, 399, 701), fill=(128, 128, 128))
+    draw.rectangle((0, 720, 399, 799), fill=keys)
+    return image
+
+@pytest.mark.parametrize("dark", [False, True])
+def test_crop_drops_chrome_and_keeps_bubbles_with_padding(dark):
+    cropped, info = ImageProcessor(crop=True).crop_for_vision(_chat(dark))
+    pad = BUBBLE_TILE_GAP
+    assert info["crop_box"] == [20 - pad, 120 - pad, 380 + pad, 340 + pad]
+    assert cropped.size == (360 + 2 * pad, 220 + 2 * pad)
+
+@pytest.mark.parametrize("dark", [False, True])
+def test_bubbles_are_found_with_their_sides_and_roles(dark):
+    _, info = ImageProcessor(crop=True, segment_bubbles=True).crop_for_vision(_chat(dark, timestamp=True), segment=True)
+    bubbles = info["bubbles"]
+    assert [(bubble["side"], bubble["role"]) for bubble in bubbles] == [
+        ("center", None), ("left", "them"), ("right", "me"), ("left", "them")
+    ]
+    # Boxes are in the coordinates of the screenshot
+    assert [tuple(bubble["box"]) for bubble in bubbles[1:]] == BUBBLES
+    assert bubbles[0]["box"] == [150, 100, 250, 110]
+
+def test_bubbles_are_tiled_with_short_gaps():
+    image = _chat()
+    cropped, info = ImageProcessor(crop=True, segment_bubbles=True).crop_for_vision(image, segment=True)
+    gap = BUBBLE_TILE_GAP
+    assert info["tiled"] is True
+    assert cropped.size == (360 + 2 * gap, 3 * 60 + 4 * gap)
+    
+    tiled = np.asarray(cropped)
+    left = info["crop_box"][0]
+    source = np.asarray(image)
+    for index, (x0, y0, x1, y1) in enumerate(BUBBLES):
+        y = gap + index * (60 + gap)
+        assert (tiled[y:y + 60, x0 - left:x1 - left] == source[y0:y1, x0:x1]).all()
+
+def test_tile_bubbles_keeps_horizontal_position():
+    pixels = np.asarray(_chat())
+    background = dominant_color(pixels)
+    bubbles = find_bubbles(~color_mask(pixels, background))
+    tiled = tile_bubbles(pixels, bubbles, background)
+    assert tiled.shape[1] == pixels.shape[1]
+    assert (tiled[:BUBBLE_TILE_GAP] == background).all()
+
+def test_blank_screenshot_is_sent_uncropped():
+    image = Image.new("RGB", (400, 800), (255, 255, 255))
+    cropped, info = ImageProcessor(crop=True).crop_for_vision(image, segment=True)
+    assert info == {"crop_box": None}
+    assert cropped is image
+
+def test_synthetic_corpus_sides_and_crop_boxes():
+    processor = ImageProcessor(crop=True, segment_bubbles=True)
+    for item in corpus(12, seed=7):
+        prepared = processor.prepare_for_vision(item["image_data"], segment=item["sides"] is not None)
+        if item["sides"] is None:
+            continue
+        detected = [bubble["side"] for bubble in prepared["bubbles"] if bubble["side"] != "center"]
+        assert detected == item["sides"]
+        # Header (300px of 2532) and input bar are cropped away
+        for bubble in prepared["bubbles"]:
+            assert bubble["box"][1] >= 302 * 1600 / 2532
@@ -0,0 +1,23 @@
+import pytest
+from cache import LRUCache
+from plan_cache import VIBE_ALIASES, WARM_VIBES, PlanCache, normalize_plan_request, plan_key
+from schemas import DatePlanRequest
+
+SCHEMA_VIBES = DatePlanRequest.model_fields["vibe"].description.split("|")
+
+def warmed_keys(city: str, budget: str):
+    """Keys the warm command fills for one city and budget with its default vibes"""
+    return {plan_key(normalize_plan_request(city, budget, "", vibe)) for vibe in WARM_VIBES}
+
+@pytest.mark.parametrize("vibe", SCHEMA_VIBES)
+def test_every_schema_vibe_hits_a_warmed_key(vibe):
+    cache = PlanCache(LRUCache())
+    for key in warmed_keys("austin", "medium"):
+        cache.add(key, "plan")
+    
+    key = plan_key(normalize_plan_request("Austin, TX", "mid", "", vibe.upper()))
+    assert cache.lookup(key) is not None
+
+def test_vibe_aliases_resolve_to_warmed_vibes():
+    assert set(VIBE_ALIASES.values()) == set(WARM_VIBES)
+    assert normalize_plan_request("nyc", "", "", "artsy")[3] == "cultural"
@@ -0,0 +1,33 @@
+import pytest
+from prescreen import RedFlagScreen
+
+@pytest.fixture
+def screen():
+    return RedFlagScreen()
+
+@pytest.mark.parametrize("text", [
+    "send me a steam gift card please",
+    "Text me on WhatsApp",
+    "I made 30% weekly returns on a crypto trading platform",
+    "Looking for a sugar daddy",
+])
+def test_single_category_is_never_skipped(screen, text):
+    assert screen.scan(text)["decision"] == "focused"
+
+@pytest.mark.parametrize("text", [
+    "Seasons 2018 2019 2020 2021 are the best",
+    "My parents cut my allowance in college lol",
+    "The app sent me a verification code, is that normal?",
+    "I love giving gift cards at christmas",
+])
+def test_ordinary_phrases_do_not_match(screen, text):
+    assert screen.scan(text)["decision"] == "general"
+
+def test_conclusive_hits_across_categories_skip(screen):
+    result = screen.scan("Sugar daddy here, $500 weekly allowance, just send me your Cash App")
+    assert result["decision"] == "skip"
+    assert result["categories"] == ["payment", "solicitation"]
+
+@pytest.mark.parametrize("text", ["Call me 212 555 0147", "add me +1 (415) 555-0198", "text +44 7911 123456"])
+def test_phone_numbers(screen, text):
+    assert "phone_number" in [hit["rule"] for hit in screen.scan(text)["hits"]]
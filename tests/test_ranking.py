@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from ranking import CandidateRanker
+
+PROFILE = "Rock climbing on weekends, ramen hunting and my dog Miso"
+
+def _openers(texts):
+    return [{"text": text, "follow_ups": [], "rationale": ""} for text in texts]
+
+def test_rank_fills_up_count_from_near_duplicates():
+    candidates = _openers([
+        "What's the best ramen spot you've found so far?",
+        "What's the best ramen spot you've found so far??",
+        "What's the best ramen place you have found so far?",
+        "Whats the best ramen spot you found so far, honestly?",
+        "What is the best ramen spot you've found lately?",
+        "What's the best ramen shop you've found so far?",
+    ])
+    selected, counts = CandidateRanker().rank(candidates, "text", PROFILE, "tinder", 3)
+    
+    texts = [candidate["text"] for candidate in selected]
+    assert len(texts) == 3
+    assert texts[0] == candidates[0]["text"]
+    # The near-identical copy is still dropped
+    assert candidates[1]["text"] not in texts
+    assert counts["relaxed"] == 2
+    assert counts["returned"] == 3
+    assert counts["generated"] == counts["returned"] + counts["duplicates"] + counts["too_long"]
+
+def test_rank_prefers_distinct_candidates():
+    candidates = _openers([
+        "What's the best ramen spot you've found so far?",
+        "What's the best ramen place you have found so far?",
+        "Is Miso more of a trail dog or a couch dog?",
+        "Indoor or outdoor climbing when it rains on weekends?",
+    ])
+    selected, counts = CandidateRanker().rank(candidates, "text", PROFILE, "tinder", 3)
+    assert candidates[1] not in selected
+    assert counts["relaxed"] == 0
+    assert len(selected) == 3
+
+def test_opener_reports_an_error_when_no_candidate_survives(monkeypatch):
+    fastmcp = pytest.importorskip("fastmcp")
+    import mcp_server
+    
+    async def generate_structured_response(prompt, response_model, **kwargs):
+        return {"openers": _openers(["x" * 2000])}
+    
+    monkeypatch.setattr(mcp_server.llm, "generate_structured_response", generate_structured_response)
+    
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            result = await client.call_tool("opener", {"their_profile_text": PROFILE, "fresh": True})
+            return result.structured_content
+    
+    result = asyncio.run(run())
+    assert result == {"error": "Opener generation failed: No usable opener candidates"}
@@ -0,0 +1,40 @@
+import asyncio
+from types import SimpleNamespace
+from cache import NullCache
+from llm import LLMClient
+from metrics import MetricsRegistry
+from routing import ModelRouter
+
+TIERS = {"quality": {"model": "primary", "fallback": "fallback", "latency_budget": 60.0}}
+
+def make_client(primary_latency: float, fallback_latency: float) -> LLMClient:
+    router = ModelRouter(tiers=TIERS, tool_tiers={}, hedge_enabled=True, hedge_min_delay=0.01, min_samples=2)
+    client = LLMClient(cache=NullCache(), metrics=MetricsRegistry(), router=router)
+    
+    async def create(model, messages, max_tokens, temperature, tool=None, **kwargs):
+        await asyncio.sleep(primary_latency if model == "primary" else fallback_latency)
+        return SimpleNamespace(model=model)
+    
+    client._create = create
+    return client
+
+def test_hedge_won_counts_cancelled_primary():
+    client = make_client(primary_latency=1.0, fallback_latency=0.01)
+    route = client.router.route("reply")
+    route.latencies.extend([0.02, 0.02])
+    
+    response, model = asyncio.run(client._routed_create("reply", [], 10, 0.7))
+    assert response.model == "fallback"
+    # Counted at least at the hedge delay, so the p95 moves towards the slow tail
+    assert len(route.latencies) == 3
+    assert route.latencies[-1] >= 0.02
+
+def test_hedge_lost_counts_primary_latency():
+    client = make_client(primary_latency=0.05, fallback_latency=1.0)
+    route = client.router.route("reply")
+    route.latencies.extend([0.02, 0.02])
+    
+    response, _ = asyncio.run(client._routed_create("reply", [], 10, 0.7))
+    assert response.model == "primary"
+    assert len(route.latencies) == 3
+    assert route.latencies[-1] >= 0.05
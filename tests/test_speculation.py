@@ -0,0 +1,43 @@
+import asyncio
+from speculation import SpeculativePrefetcher
+
+PARAMS = {"tone": "friendly", "count": 3, "app": "tinder"}
+
+def make_run(result):
+    async def run():
+        await asyncio.sleep(0)
+        return result
+    return run
+
+def test_callers_sharing_a_session_key_keep_their_own_speculations():
+    async def scenario():
+        prefetcher = SpeculativePrefetcher(tokens_per_minute=0)
+        prefetcher.start("token", "opener", "Alice, 27, loves climbing and ramen", PARAMS, 100, make_run("alice"))
+        prefetcher.start("token", "opener", "Bob, 31, jazz pianist and dog dad", PARAMS, 100, make_run("bob"))
+        
+        # Neither overwrote the other, and an unrelated call consumes nothing
+        assert await prefetcher.claim("token", "opener", "Carol, 25, marathon runner", PARAMS) is None
+        assert await prefetcher.claim("token", "opener", "Bob, 31, jazz pianist and dog dad", PARAMS) == "bob"
+        assert await prefetcher.claim("token", "opener", "alice, 27,  loves climbing and ramen", PARAMS) == "alice"
+    
+    asyncio.run(scenario())
+
+def test_near_identical_text_with_same_arguments_is_served():
+    async def scenario():
+        prefetcher = SpeculativePrefetcher(tokens_per_minute=0)
+        prefetcher.start("s", "opener", "Loves hiking, tacos and bad puns. Ask me about my dog", PARAMS, 100, make_run("x"))
+        
+        assert await prefetcher.claim("s", "opener", "Loves hiking, tacos and bad puns. Ask me about my dog", {**PARAMS, "tone": "flirty"}) is None
+        assert await prefetcher.claim("s", "opener", "Loves hiking, tacos and bad puns! Ask me about my dog.", PARAMS) == "x"
+    
+    asyncio.run(scenario())
+
+def test_other_sessions_never_match():
+    async def scenario():
+        prefetcher = SpeculativePrefetcher(tokens_per_minute=0)
+        prefetcher.start("a", "reply", "want to get coffee?", {}, 10, make_run("reply"))
+        assert await prefetcher.claim("b", "reply", "want to get coffee?", {}) is None
+        assert prefetcher.stats()["pending"] == 1
+        prefetcher.cancel_all()
+    
+    asyncio.run(scenario())
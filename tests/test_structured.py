@@ -0,0 +1,31 @@
+import json
+import asyncio
+from cache import NullCache
+from llm import LLMClient
+from metrics import MetricsRegistry
+from schemas import OpenerCandidates
+
+class FormatRejected(Exception):
+    status_code = 400
+
+def test_unsupported_format_retry_keeps_one_system_message():
+    client = LLMClient(cache=NullCache(), metrics=MetricsRegistry())
+    calls = []
+    
+    async def cached_completion(messages, max_tokens, temperature, response_format, tool, bypass_cache):
+        calls.append((messages, response_format))
+        if len(calls) == 1:
+            raise FormatRejected("Invalid parameter: response_format json_schema is not supported")
+        return json.dumps({"openers": [{"text": "Hi", "follow_ups": [], "rationale": ""}]})
+    
+    client._cached_completion = cached_completion
+    data = asyncio.run(client.generate_structured_response(
+        "Write openers", response_model=OpenerCandidates, tool="opener", system_message="STABLE PREFIX"
+    ))
+    
+    assert data["openers"][0]["text"] == "Hi"
+    messages, response_format = calls[1]
+    assert response_format == {"type": "json_object"}
+    assert [message["role"] for message in messages] == ["system", "user"]
+    assert messages[0]["content"].startswith("STABLE PREFIX\n\n")
+    assert "JSON schema" in messages[0]["content"]